@@ -16,13 +16,79 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-__all__ = ['fixed_bin_averager']
+__all__ = ['fixed_bin_averager', 'edge_bin_averager', 'log_bin_averager',
+           'label_averager']
 
 import numpy as np
 import logging
 logger = logging.getLogger('dynsf')
 
-class fixed_bin_averager:
+def _segment_average(y, axis, starts, stops, weights=None):
+    # Average y over the segments starts[i]:stops[i] (back to back, i.e.
+    # starts[i+1] == stops[i]) along axis, optionally weighted
+    y = np.require(y)
+    if len(starts) == 0:
+        res_shape = list(y.shape)
+        res_shape[axis] = 0
+        return np.zeros(res_shape)
+    y = np.moveaxis(y, axis, 0)[starts[0]:stops[-1]]
+    I = starts - starts[0]
+    shape = (-1,) + (1,) * (y.ndim - 1)
+    if weights is None:
+        n = (stops - starts).reshape(shape)
+        res = np.add.reduceat(y, I, axis=0) / n
+    else:
+        w = weights[starts[0]:stops[-1]].reshape(shape)
+        res = np.add.reduceat(w * y, I, axis=0) / np.add.reduceat(w, I, axis=0)
+    return np.moveaxis(res, 0, axis)
+
+
+class edge_bin_averager:
+    """Class for averaging data sets of points (x,y) with
+       a priori decided positions (x), over bins given by their
+       edges (as for numpy.histogram).
+
+       The points must be sorted by x. Points outside of the edges
+       are ignored, and so are bins without points. x is the center
+       and bin_count the number of points of each remaining bin.
+
+       If weights (one per point) are given, weighted averages
+       are calculated.
+    """
+    def __init__(self, edges, x_distances, weights=None):
+        edges = np.asarray(edges, dtype=np.float64)
+        x_distances = np.asarray(x_distances)
+        assert len(edges) > 1 and np.all(np.diff(edges) > 0)
+        assert np.all(np.diff(x_distances) >= 0)
+
+        bin_count, edges = np.histogram(x_distances, bins=edges)
+        self.x_edges = edges
+        self._set_bins(bin_count, 0.5 * (edges[1:]+edges[:-1]),
+                       np.searchsorted(x_distances, edges[0]), weights)
+        self.input_length = len(x_distances)
+
+    def _set_bins(self, bin_count, x_centers, first, weights):
+        # Keep the bins with points, which start at point first
+        I = np.nonzero(bin_count)
+        self.bin_count = bin_count[I]
+        self.x = x_centers[I]
+        self.bins = len(self.x)
+        self._stops = first + np.cumsum(self.bin_count)
+        self._starts = self._stops - self.bin_count
+        self.weights = None if weights is None else \
+            np.asarray(weights, dtype=np.float64)
+        if self.bins != len(bin_count):
+            logger.info('Ignoring %d bins without coverage' % (
+                    len(bin_count)-self.bins))
+
+    def bin(self, y, axis=0):
+        y = np.require(y)
+        assert y.shape[axis] == self.input_length
+        return _segment_average(y, axis, self._starts, self._stops,
+                                self.weights)
+
+
+class fixed_bin_averager(edge_bin_averager):
     """Class for averaging data sets of points (x,y) with
        a priori decided positions (x), over a pre-defined number
        of equally sized, linearely distriuted bins.
@@ -52,7 +118,7 @@ class fixed_bin_averager:
        having its x-value within the respective bin x-range.
 
     """
-    def __init__(self, x_max, x_bins, x_distances, x_min=0.0):
+    def __init__(self, x_max, x_bins, x_distances, x_min=0.0, weights=None):
         assert x_max > x_min
         assert x_bins > 1
 
@@ -61,32 +127,65 @@ class fixed_bin_averager:
         bin_count, edges = np.histogram(x_distances,
                                         bins=x_bins,
                                         range=x_range)
+        self.x_edges = edges
         self.x_linspace = 0.5 * (edges[1:]+edges[:-1])
+        self._set_bins(bin_count, self.x_linspace,
+                       np.searchsorted(x_distances, edges[0]), weights)
+        self.input_length = len(x_distances)
 
-        I = np.nonzero(bin_count)
-        self.bin_count = bin_count[I]
-        self.x = self.x_linspace[I]
+
+class log_bin_averager(edge_bin_averager):
+    """Class for averaging data sets of points (x,y) over x_bins
+       logarithmically distributed bins, from x_min to x_max (> 0)
+
+       x is the geometric center of each bin (with points).
+    """
+    def __init__(self, x_min, x_max, x_bins, x_distances, weights=None):
+        assert x_max > x_min > 0
+        assert x_bins >= 1
+
+        edges = np.logspace(np.log10(x_min), np.log10(x_max), x_bins+1)
+        edges[0], edges[-1] = x_min, x_max
+        bin_count, edges = np.histogram(x_distances, bins=edges)
+        self.x_edges = edges
+        self._set_bins(bin_count, np.sqrt(edges[1:]*edges[:-1]),
+                       np.searchsorted(x_distances, edges[0]), weights)
         self.input_length = len(x_distances)
-        self.bins = len(self.x)
-        if self.bins != x_bins:
-            logger.info('Ignoring %d bins without coverage' % (
-                    x_bins-self.bins))
+
+
+class label_averager:
+    """Class for averaging data sets of points (x,y) over groups of
+       points, the groups given by a label per point (rather than by
+       ranges of x).
+
+       The groups are ordered by first appearance of their label.
+       As for fixed_bin_averager, x is the average x-value and
+       bin_count the number of points of each group.
+    """
+    def __init__(self, labels, x_distances):
+        assert len(labels) == len(x_distances)
+        self.labels = []
+        groups = {}
+        for i, label in enumerate(labels):
+            if label not in groups:
+                self.labels.append(label)
+                groups[label] = []
+            groups[label].append(i)
+        self._groups = [np.array(groups[label]) for label in self.labels]
+
+        x_distances = np.asarray(x_distances)
+        self.bin_count = np.array([len(I) for I in self._groups])
+        self.x = np.array([np.mean(x_distances[I]) for I in self._groups])
+        self.input_length = len(x_distances)
+        self.bins = len(self.labels)
+        # The points ordered group by group
+        self._order = np.concatenate(self._groups) if self._groups else \
+            np.zeros(0, dtype=int)
+        self._stops = np.cumsum(self.bin_count)
+        self._starts = self._stops - self.bin_count
 
     def bin(self, y, axis=0):
         y = np.require(y)
         assert y.shape[axis] == self.input_length
-
-        res_shape = list(y.shape)
-        res_shape[axis] = self.bins
-        result = np.zeros(res_shape)
-
-        ci = 0
-        ind_x = [slice(None)]*len(y.shape)
-        ind_y = [slice(None)]*len(y.shape)
-        for i, n in enumerate(self.bin_count):
-            ind_x[axis] = i
-            ind_y[axis] = slice(ci, ci+n)
-            result[ind_x] = np.mean(y[ind_y], axis=axis)
-            ci += n
-
-        return result
+        return _segment_average(np.take(y, self._order, axis=axis), axis,
+                                self._starts, self._stops)
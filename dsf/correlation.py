@@ -0,0 +1,441 @@
+
+# Copyright (C) 2011 Mattias Slabanja <slabanja@chalmers.se>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+__all__ = ['averager', 'correlator', 'output_dependencies', 'resolve_outputs']
+
+import numpy as np
+import logging
+from itertools import count
+from functools import partial
+
+import dsf.filon as filon
+from dsf.handythread import foreach
+
+try:
+    from scipy.interpolate import interp1d
+except ImportError:
+    # Fallback if SciPy isn't available
+    def interp1d(xp, yp, axis=-1):
+        yp = np.moveaxis(yp, axis, -1)
+        if len(yp.shape) == 1:
+            return lambda x:np.interp(x, xp, yp)
+        def interp(x):
+            res = [np.interp(x, xp, ypi) for ypi in yp.reshape(-1, yp.shape[-1])]
+            res = np.array(res).reshape(yp.shape[:-1] + (len(x),))
+            return np.moveaxis(res, -1, axis)
+        return interp
+
+logger = logging.getLogger('dynsf')
+
+pi = np.pi
+two_pi = 2.0 * pi
+
+
+# The kinds of results of correlator.get_output, and the results each
+# of them is calculated from
+output_dependencies = {
+    'F_k_t': [],
+    'Cl_k_t': [],
+    'Ct_k_t': [],
+    'F_s_k_t': [],
+    'G_r_t': ['F_k_t'],
+    'S_k_w': ['F_k_t'],
+    'Cl_k_w': ['Cl_k_t'],
+    'Ct_k_w': ['Ct_k_t'],
+    'S_s_k_w': ['F_s_k_t'],
+    # Real space results, see dsf.rdf
+    'g_r': [],
+    'S_g_k': ['g_r'],
+    }
+
+
+def resolve_outputs(outputs):
+    """Return the set of outputs, and all outputs they depend on"""
+    res = set()
+    todo = list(outputs)
+    while todo:
+        name = todo.pop()
+        if name not in output_dependencies:
+            raise ValueError('Unknown output %s' % name)
+        if name not in res:
+            res.add(name)
+            todo += output_dependencies[name]
+    return res
+
+
+class averager:
+    """Naive special purpose averager class used in dynsf
+
+    It assists with keeping track on how many data samples
+    have been added to each slot.
+
+    Ex:
+    av = averager(2)
+    av[0] += 10
+    av[1] += 2
+    av[0] += 3
+    av.get_av() ->
+    [6, 3]
+
+    initial may also be a list of initial values, one per slot.
+    """
+    def __init__(self, N_slots, initial=np.zeros(1)):
+        assert(N_slots >= 1)
+        self._N = N_slots
+        if isinstance(initial, list):
+            assert(len(initial) == N_slots)
+            self._data = [np.array(a) for a in initial]
+        else:
+            self._data = [np.array(initial) for n in range(N_slots)]
+        self._samples = np.zeros(N_slots)
+    def __getitem__(self, key):
+        return self._data[key]
+    def __setitem__(self, key, val):
+        self._data[key] = val
+        self._samples[key] += 1
+    def add(self, array, slot):
+        self[slot] += array
+    def get_single_av(self, slot):
+        f = 1.0 / self._samples[slot]
+        return f * self._data[slot]
+    def get_av(self):
+        return np.array([self.get_single_av(i) for i in range(self._N)])
+    def get_sum(self):
+        """Return the sums of all slots (shorter slots zero padded)"""
+        n = max(len(d) for d in self._data)
+        res = np.zeros((self._N, n), dtype=self._data[0].dtype)
+        for i, d in enumerate(self._data):
+            res[i, :len(d)] = d
+        return res
+
+
+class correlator:
+    """Accumulate time correlations of k-space densities
+
+    Windows of frames, processed by a reciprocal_processor (and split
+    and combined by a section_index), are correlated and averaged
+    using add_window. get_output bins the averages so far in |k|,
+    and transforms them into G(r, t) and S(k, w) etc.
+
+    box is the reference simulation box (used for particle densities),
+    N_tc the window width and delta_t the time between two frames.
+
+    If rec uses different k-points for different windows (see e.g.
+    reciprocal_rotating), each window is correlated on its k-points
+    only, and each k-point is averaged over the windows using it.
+
+    The maximum time lag may depend on k (correlations decay faster
+    at larger |k|). max_lags gives the number of time lags (at most
+    N_tc) to correlate for each k-point. With decay_threshold, lags
+    are also cut adaptively: once the (so far averaged) F(k, t) of a
+    k-point has decayed below decay_threshold * F(k, 0), larger lags
+    are no longer correlated for it. In the bin averages, a k-point
+    not correlated at a lag counts as a zero (i.e. fully decayed)
+    correlation, so the cuts do not bias the bins towards the slowly
+    decaying k-points still correlated.
+    """
+    def __init__(self, rec, index, box, N_tc, delta_t,
+                 calculate_current=False, calculate_self=False,
+                 max_lags=None, decay_threshold=None):
+        self.rec = rec
+        self.index = index
+        self.N_tc = N_tc
+        self.delta_t = delta_t
+        self.calculate_current = calculate_current
+        self.calculate_self = calculate_self
+
+        a, b, c = box
+        reference_volume = abs(np.dot(np.cross(a, b), c))
+        self.particle_types = index.get_section_names()
+        self.particle_counts = map(len, index.get_section_indices())
+        self.particle_densities = [n / reference_volume for n in self.particle_counts]
+
+        Ntypes = len(self.particle_types)
+        m = count(0)
+        self.pair_list = [(m.next(), i, j)
+                          for i in xrange(Ntypes) for j in xrange(i, Ntypes)]
+        self.pair_types = [self.particle_types[i] + '-' + self.particle_types[j]
+                           for _, i, j in self.pair_list]
+
+        M = len(rec.q_distance)
+        self._max_lags = None
+        if max_lags is not None or decay_threshold is not None:
+            if max_lags is None:
+                max_lags = np.repeat(N_tc, M)
+            self._set_max_lags(max_lags)
+            # Only the k-points correlated at a lag need to be accumulated
+            z = [np.zeros(I.stop if isinstance(I, slice) else M)
+                 for I in self._lag_k_indices]
+        else:
+            z = np.zeros(M)
+        self.decay_threshold = decay_threshold
+        # Windows between two adaptive updates of the lags
+        self.decay_interval = 10
+
+        self.F_k_t_avs = [averager(N_tc, z) for _ in self.pair_list]
+        if calculate_current:
+            self.Cl_k_t_avs = [averager(N_tc, z) for _ in self.pair_list]
+            self.Ct_k_t_avs = [averager(N_tc, z) for _ in self.pair_list]
+        if calculate_self:
+            self.F_s_k_t_avs = [averager(N_tc, z) for _ in self.particle_types]
+
+        self._n_windows = 0
+        if hasattr(rec, 'get_window_k_indices') or self._max_lags is not None:
+            # Number of windows each k-point has been used in
+            self._k_counts = np.zeros((N_tc, M))
+        else:
+            self._k_counts = None
+
+    def _set_max_lags(self, max_lags):
+        self._max_lags = np.clip(np.asarray(max_lags, dtype=int), 1, self.N_tc)
+        # The k-points to correlate at each lag (a slice if possible,
+        # which is the case if the lags decrease with |k|)
+        self._lag_k_indices = []
+        for t in xrange(self.N_tc):
+            I = np.flatnonzero(self._max_lags > t)
+            if len(I) == 0 or I[-1] == len(I) - 1:
+                I = slice(0, len(I))
+            self._lag_k_indices.append(I)
+
+    def get_max_lags(self):
+        """Return the number of time lags correlated for each k-point"""
+        if self._max_lags is None:
+            return np.repeat(self.N_tc, len(self.rec.q_distance))
+        return self._max_lags.copy()
+
+    def _update_lags(self):
+        # Cut the lags of k-points whose F(k, t) has decayed
+        counts = self._k_counts
+        F = sum(self.F_k_t_avs[m].get_sum() for m, i, j in self.pair_list if i == j)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            F = np.abs(F / counts) / np.abs(F[0] / counts[0])
+            decayed = F < self.decay_threshold
+        max_lags = np.where(decayed.any(axis=0), decayed.argmax(axis=0), self.N_tc)
+        self._set_max_lags(np.minimum(self._max_lags, max_lags))
+
+    def _get_k_indices(self, time_i, k_indices):
+        # The k-points to correlate at time lag time_i, or None for all
+        if self._max_lags is None:
+            return k_indices
+        I = self._lag_k_indices[time_i]
+        if k_indices is None:
+            return I
+        if isinstance(I, slice):
+            return k_indices[:np.searchsorted(k_indices, I.stop)]
+        return np.intersect1d(k_indices, I, assume_unique=True)
+
+    def calc_corr(self, window, time_i, k_indices=None):
+        # Calculate correlations between two frames in the window,
+        # optionally on the k-points k_indices only
+        f0 = window[0]
+        fi = window[time_i]
+        I = self._get_k_indices(time_i, k_indices)
+        def corr(a, b):
+            if I is None:
+                return np.real(a * b.conjugate())
+            return np.real(a[..., I] * b[..., I].conjugate())
+        def add(av, value):
+            if I is None:
+                av[time_i] += value
+            else:
+                av[time_i][I] += value
+
+        for m, i, j in self.pair_list:
+            add(self.F_k_t_avs[m], corr(f0['rho_ks'][i], fi['rho_ks'][j]))
+
+        if self.calculate_current:
+            for m, i, j in self.pair_list:
+                add(self.Cl_k_t_avs[m], corr(f0['jz_ks'][i], fi['jz_ks'][j]))
+                add(self.Ct_k_t_avs[m], 0.5 *
+                    np.sum(corr(f0['jper_ks'][i], fi['jper_ks'][j]), axis=0))
+
+        if self.calculate_self:
+            for i, F_s in enumerate(self.index.combine_classes(
+                self.rec.process_specific_xs(
+                    [(xi - x0) for xi, x0 in zip(fi['xs'], f0['xs'])],
+                    k_indices=I))):
+                add(self.F_s_k_t_avs[i], np.real(F_s))
+
+        if self._k_counts is not None:
+            # k-points cut at this lag count as zero correlations
+            if k_indices is None:
+                self._k_counts[time_i] += 1
+            else:
+                self._k_counts[time_i, k_indices] += 1
+
+    def add_window(self, window, threads=1):
+        """Correlate the first frame of window with all frames in window"""
+        if hasattr(self.rec, 'get_window_k_indices'):
+            k_indices = self.rec.get_window_k_indices(self._n_windows)
+        else:
+            k_indices = None
+        self._n_windows += 1
+        # Have threads threads concurrently process the window
+        foreach(partial(self.calc_corr, window, k_indices=k_indices),
+                xrange(len(window)), threads=threads)
+        if self.decay_threshold is not None and \
+                self._n_windows % self.decay_interval == 0:
+            self._update_lags()
+
+    def get_output(self, k_bins=80, omega_padding=1, k_spacing='linear',
+                   outputs=None):
+        """Return list of (value, name, description) of all results so far
+
+        k_bins is the number of "radial" bins used for averaging (spaced
+        as given by k_spacing, 'linear' or 'log'), or their edges.
+        Spectra are calculated on an omega_padding times finer
+        frequency grid (as if correlations were zero padded).
+
+        outputs is a list of the kinds of results wanted (see
+        output_dependencies), default is all. Only those, and what they
+        are calculated from, are calculated. Results depending on
+        correlations not calculated (e.g. currents) are left out.
+        """
+        rec = self.rec
+        delta_t = self.delta_t
+        pair_list = self.pair_list
+        pair_types = self.pair_types
+
+        available = set(['F_k_t', 'G_r_t', 'S_k_w'])
+        if self.calculate_current:
+            available.update(['Cl_k_t', 'Ct_k_t', 'Cl_k_w', 'Ct_k_w'])
+        if self.calculate_self:
+            available.update(['F_s_k_t', 'S_s_k_w'])
+        if outputs is None:
+            wanted = available
+        else:
+            wanted = set(outputs) & available
+        needed = resolve_outputs(wanted)
+
+        # Extract correlation (all k-point) averages
+        # and calculate average per 'radial' bin
+        k_binner = rec.get_k_binner(k_bins, k_spacing)
+        k_bin_averager = partial(k_binner.bin, axis=1)
+
+        if self._k_counts is not None:
+            # Average over all correlations of the k-points in each bin
+            counts = k_bin_averager(self._k_counts)
+            def average(av):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    res = k_bin_averager(av.get_sum()) / counts
+                # Bins not correlated at some lag (beyond their maximum lag)
+                res[counts == 0] = 0.0
+                return res
+        else:
+            average = lambda av: k_bin_averager(av.get_av())
+
+        if 'F_k_t' in needed:
+            F_k_t = map(average, self.F_k_t_avs)
+
+        if 'Cl_k_t' in needed:
+            Cl_k_t = map(average, self.Cl_k_t_avs)
+        if 'Ct_k_t' in needed:
+            Ct_k_t = map(average, self.Ct_k_t_avs)
+
+        if 'F_s_k_t' in needed:
+            F_s_k_t = map(average, self.F_s_k_t_avs)
+            for i, N in enumerate(self.particle_counts):
+                F_s_k_t[i] *= (1.0 / np.sqrt(N))
+
+        t = delta_t * np.arange(self.N_tc)
+        k = k_binner.x.copy()
+        k_bin_count = k_binner.bin_count.copy()
+
+        output = []
+        output += [(k, 'k', 'k-values (technically, bin centers) [nm^1]'),
+                   (t, 't', 'time values [fs]'),
+                   (k_bin_count, 'k_bin_count', 'Number of k-points per bin')]
+        if hasattr(k_binner, 'labels'):
+            output += [(np.array(k_binner.labels), 'k_labels',
+                        'Labels of the k-point groups (bins)')]
+        if 'F_k_t' in wanted:
+            output += [(F_k_t[m], 'F_k_t_%i_%i' % (i, j),
+                        'Partial intermediate scattering function [time, k] (%s)' % pair_types[m])
+                       for m, i, j in pair_list]
+
+        if 'Cl_k_t' in wanted:
+            output += [(Cl_k_t[m], 'Cl_k_t_%i_%i' % (i, j),
+                        'Longitudinal current correlation [time, k] (%s)' % pair_types[m])
+                       for m, i, j in pair_list]
+        if 'Ct_k_t' in wanted:
+            output += [(Ct_k_t[m], 'Ct_k_t_%i_%i' % (i, j),
+                        'Transversal current correlation [time, k] (%s)' % pair_types[m])
+                       for m, i, j in pair_list]
+
+        if 'F_s_k_t' in wanted:
+            output += [(F_s_k_t[i], 'F_s_k_t_%i' % i,
+                        'Self part of intermediate scattring function [time, k]')
+                       for i in range(self.index.N_sections())]
+
+
+        k_ = []
+        if 'G_r_t' in wanted and len(k) > 1 and hasattr(k_binner, 'x_linspace'):
+            # Create an odd number of linearly spaced k-points, ranging from
+            # the "distance" of the smallest non-empty bin and up.
+            k_ = k_binner.x_linspace
+            k_ = k_[k_ >= k[1]]
+            k_ = k_[k_ <= k[-1]]
+            if not len(k_) % 2:
+                k_ = k_[:-1]
+
+        if len(k_) >= 3:
+            dr = two_pi / k[-1]
+            r = np.arange(5 * dr, pi / k[1], dr)
+            # Transform all pairs at once, F_k_t[m] -> G_r_t[m]
+            kF_ = k_ * interp1d(k, np.array(F_k_t) - 1, axis=2)(k_)
+            G_r_t = filon.sin_integral(kF_, k_[1] - k_[0], r, k_[0], axis=2)
+            for m, i, j in pair_list:
+                G_r_t[m] *= 1 / (r * 2 * pi ** 2 * self.particle_densities[j])
+                G_r_t[m] += 1
+
+            output += [(r, 'r', 'r-values for calculated G(r,t) [nm]')]
+            output += [(G_r_t[m], 'G_r_t_%i_%i' % (i, j),
+                        'Calculated partial van Hove function [time, r] (%s)' % pair_types[m])
+                       for m, i, j in pair_list]
+
+
+        if len(t) > 2 and wanted & set(['S_k_w', 'Cl_k_w', 'Ct_k_w', 'S_s_k_w']):
+            # Each kind of correlation is transformed for all pairs at once
+            w = np.linspace(0.0, two_pi / delta_t, omega_padding * (self.N_tc - 1) + 1)
+            transform = partial(filon.fourier_cos, dx=delta_t, k=w, axis=1)
+            output += [(w, 'w', 'omega [fs^-1]')]
+
+            if 'S_k_w' in wanted:
+                _, S_k_w = transform(np.array(F_k_t))
+                output += [(S_k_w[m], 'S_k_w_%i_%i' % (i, j),
+                            'Partial dynamical structure factor [omega, k] (%s)' % pair_types[m])
+                           for m, i, j in pair_list]
+
+            if 'Cl_k_w' in wanted:
+                _, Cl_k_w = transform(np.array(Cl_k_t))
+                output += [(Cl_k_w[m], 'Cl_k_w_%i_%i' % (i, j),
+                            'Longitudinal partial current correlation [omega, k] (%s)' % pair_types[m])
+                           for m, i, j in pair_list]
+            if 'Ct_k_w' in wanted:
+                _, Ct_k_w = transform(np.array(Ct_k_t))
+                output += [(Ct_k_w[m], 'Ct_k_w_%i_%i' % (i, j),
+                            'Transversal partial current correlation [omega, k] (%s)' % pair_types[m])
+                           for m, i, j in pair_list]
+
+            if 'S_s_k_w' in wanted:
+                _, S_s_k_w = transform(np.array(F_s_k_t))
+                output += [(S_s_k_w[i], 'S_s_k_w_%i' % i,
+                            'Self part of partial dynamical structure factor [omega, k]')
+                           for i, _ in enumerate(self.particle_types)]
+
+        return output
@@ -42,15 +42,16 @@ integration intervals by the optional argument x0.
 
 """
 
-__all__ = ['fourier_cos', 'sin_integral', 'cos_integral']
+__all__ = ['fourier_cos', 'sin_integral', 'cos_integral', 'filon_integral']
 
-from numpy import sin, cos, pi, mod, \
-    zeros, arange, linspace, require, \
-    where, sum
+from numpy import sin, cos, exp, pi, mod, real, \
+    zeros, arange, linspace, require, allclose, \
+    where, outer, tensordot, moveaxis
+from numpy.fft import fft
 
 
 
-def fourier_cos(f, dx, k=None, axis=0):
+def fourier_cos(f, dx, k=None, axis=0, pad=1):
     """Calculate a direct fourier cosine transform of function f(x) using
     Filon's integration method
 
@@ -61,14 +62,23 @@ def fourier_cos(f, dx, k=None, axis=0):
     2*\int_{0}^{xmax}
     where xmax = 2n*dx
 
-    If k is not provided, linspace(0.0, 2*pi/dx, f.shape[axis]),
-    will be used.
+    If k is not provided, linspace(0.0, 2*pi/dx, pad*2n + 1),
+    will be used (i.e. f.shape[axis] values, unless a finer k grid
+    is asked for with pad > 1).
+
+    If k is linearly spaced from 0, with a spacing of 2*pi/(L*dx) for
+    some even L (as the default k), the Filon sums are evaluated using
+    FFTs of length L/2, in O(L log L) rather than O(len(k) * 2n).
     """
 
+    f = require(f)
     if k is None:
-        k = linspace(0.0, 2 * pi / dx, f.shape[axis])
+        k = linspace(0.0, 2 * pi / dx, pad * (f.shape[axis] - 1) + 1)
 
-    return k, 2 * cos_integral(f, dx, k, x0=0.0, axis=axis)
+    L = _fft_length(k, dx)
+    if L is None:
+        return k, 2 * cos_integral(f, dx, k, x0=0.0, axis=axis)
+    return k, 2 * _fft_cos_integral(f, dx, k, L, axis)
 
 
 def cos_integral(f, dx, k, x0=0.0, axis=0):
@@ -88,7 +98,6 @@ def sin_integral(f, dx, k, x0=0.0, axis=0):
 def _gen_sc_int(f, dx, k, x0, axis, sc):
 
     f = require(f)
-    k = require(k)
 
     try:
         axis = range(f.ndim)[axis]
@@ -96,51 +105,119 @@ def _gen_sc_int(f, dx, k, x0, axis, sc):
         print('Error: axis(=%s) is invalid' % str(axis))
         raise
 
-    if k.ndim != 1:
-        raise ValueError('k is not one dimensional')
+    return get_filon_integral(sc, dx, f.shape[axis], k, x0)(f, axis=axis)
 
-    Nk = len(k)
-    Nx = f.shape[axis]
-    x_shape = [1] * f.ndim + [Nx]  # We'll transpose axis and put it last
-    k_shape = [1] * (f.ndim + 1)  #
-    k_shape[axis] = Nk  #
 
+class filon_integral:
+    """Filon integral \int_{x0}^{x0+2n*dx} f(x)*sc(k x) dx (sc is sin or cos)
+
+    The integral is linear in f, and is precomputed as a (Nk, Nx) weight
+    matrix for the given dx, Nx = 2n+1 and k. Calling it with f (of
+    length Nx along axis) applies it to all functions in f at once.
+    """
+    def __init__(self, sc, dx, Nx, k, x0=0.0):
+        k = require(k, dtype=float)
+        if k.ndim != 1:
+            raise ValueError('k is not one dimensional')
+        if mod((Nx - 1), 2) != 0 or Nx < 3:
+            raise ValueError('f must have an odd length, >=3, along its integration axis')
+        if sc not in (sin, cos):
+            raise ValueError('sc must be sin or cos')
+
+        alpha, beta, gamma = _alpha_beta_gamma(dx * k)
+        x = x0 + dx * arange(0.0, Nx)
+
+        W = sc(outer(k, x))
+        W[:, 0] *= 0.5
+        W[:, -1] *= 0.5
+        W[:, 0::2] *= beta.reshape(-1, 1)
+        W[:, 1::2] *= gamma.reshape(-1, 1)
+        if sc == sin:
+            W[:, 0] += alpha * cos(k * x0)
+            W[:, -1] -= alpha * cos(k * x[-1])
+        else:
+            W[:, -1] += alpha * sin(k * x[-1])
+            W[:, 0] -= alpha * sin(k * x0)
+        W *= dx
+
+        self.k = k
+        self.weights = W
+
+    def __call__(self, f, axis=0):
+        f = require(f)
+        if f.shape[axis] != self.weights.shape[1]:
+            raise ValueError('f must have length %i along its integration axis'
+                             % self.weights.shape[1])
+        return moveaxis(tensordot(self.weights, f, axes=([1], [axis])), 0, axis)
+
+
+# The most recently used integrals (typically, the same few are used
+# for all channels of an output)
+_integrals = {}
+_MAX_INTEGRALS = 16
+
+def get_filon_integral(sc, dx, Nx, k, x0=0.0):
+    """Return a (possibly cached) filon_integral(sc, dx, Nx, k, x0)"""
+    k = require(k, dtype=float)
+    key = (sc.__name__, float(dx), Nx, float(x0), k.shape, k.tostring())
+    I = _integrals.get(key)
+    if I is None:
+        if len(_integrals) >= _MAX_INTEGRALS:
+            _integrals.clear()
+        I = _integrals[key] = filon_integral(sc, dx, Nx, k, x0)
+    return I
+
+
+def _fft_length(k, dx):
+    # Return L if k = j * 2*pi/(L*dx), j = 0, 1, .., for some even L,
+    # otherwise None
+    k = require(k, dtype=float)
+    if k.ndim != 1 or len(k) < 2 or k[0] != 0.0 or k[1] <= 0.0:
+        return None
+    dk = k[1]
+    if not allclose(k, dk * arange(len(k)), rtol=1e-10, atol=0.0):
+        return None
+    L = 2 * pi / (dx * dk)
+    if abs(L - round(L)) > 1e-8 * L or int(round(L)) % 2:
+        return None
+    return int(round(L))
+
+
+def _fold(a, M):
+    # Sum a along its first axis, modulo M
+    n = -(-len(a) // M) * M
+    b = zeros((n,) + a.shape[1:])
+    b[:len(a)] = a
+    return b.reshape((n // M, M) + a.shape[1:]).sum(axis=0)
+
+
+def _fft_cos_integral(f, dx, k, L, axis):
+    # cos_integral(f, dx, k, 0.0, axis), for k[j] = j * 2*pi/(L*dx),
+    # where cos(k[j] * x[n]) = cos(2*pi * j * n / L)
+
+    f = moveaxis(f, axis, 0)
+    Nx = len(f)
     if mod((Nx - 1), 2) != 0 or Nx < 3:
         raise ValueError('f must have an odd length, >=3, along its integration axis')
 
-    s = (slice(None),) * f.ndim
-    odd_index = s + (slice(1, None, 2),)
-    even_index = s + (slice(0, None, 2),)
-    first_index = s + ((0,),)
-    last_index = s + ((-1,),)
-
-    alpha, beta, gamma = [x.reshape(k_shape[:-1]) for x in _alpha_beta_gamma(dx * k)]
-    x = (x0 + dx * arange(0.0, Nx)).reshape(x_shape)
-    k = k.reshape(k_shape)
-
-    # Add an extra dimension to f, and transpose it to put the x-dimension at axis=-1
-    t = range(f.ndim + 1)
-    t[axis], t[-1] = t[-1], t[axis]
-    f = f.reshape(f.shape + (1,)).transpose(t)
-
-    sc_k_x = sc(k * x)
-    sc_k_x[first_index] *= 0.5
-    sc_k_x[last_index] *= 0.5
-
-    if sc == sin:
-        return dx * (alpha * sum((f[first_index] * cos(k * x0) -
-                                f[last_index] * cos(k * x[last_index])), axis=-1) +
-                   beta * sum(f[even_index] * sc_k_x[even_index], axis=-1) +
-                   gamma * sum(f[odd_index] * sc_k_x[odd_index], axis=-1))
+    M = L // 2
+    j = arange(len(k))
+    shape = (len(k),) + (1,) * (f.ndim - 1)
+    alpha, beta, gamma = [x.reshape(shape) for x in _alpha_beta_gamma(dx * k)]
 
-    elif sc == cos:
-        return dx * (alpha * sum((f[last_index] * sin(k * x[last_index]) -
-                                f[first_index] * sin(k * x0)), axis=-1) +
-                   beta * sum(f[even_index] * sc_k_x[even_index], axis=-1) +
-                   gamma * sum(f[odd_index] * sc_k_x[odd_index], axis=-1))
+    # Even points, 2m, with half weight at the end points
+    even = f[0::2].copy()
+    even[0] *= 0.5
+    even[-1] *= 0.5
+    even_sum = real(fft(_fold(even, M), axis=0))[j % M]
 
-    raise RuntimeError('Internal error, this should not happen')
+    # Odd points, 2m + 1
+    odd_sum = fft(_fold(f[1::2], M), axis=0)[j % M]
+    odd_sum = real(exp(-2j * pi * j / L).reshape(shape) * odd_sum)
 
+    res = dx * (alpha * f[-1] * sin(k * dx * (Nx - 1)).reshape(shape) +
+                beta * even_sum + gamma * odd_sum)
+    return moveaxis(res, 0, axis)
 
 
 def _alpha_beta_gamma(theta):
@@ -54,6 +54,37 @@ class section_index:
         if not self.valid_index_limits(max_index):
             raise ValueError("section_index: Index file seems to contain one or more invalid indices. " + \
                              ("For the provided trajectory file, indices must be in range [1, %d]" % max_index))
+        self._classify(max_index)
+
+    def _classify(self, N):
+        # Split the atoms into disjoint classes, atoms of a class being
+        # members of exactly the same sections. Each section is then
+        # the union of a few classes. The atom order places the atoms
+        # of each class next to each other (followed by any atoms not
+        # in a section).
+        member = np.zeros((len(self.sections), N), dtype=bool)
+        for s, (_, I) in enumerate(self.sections):
+            member[s, I] = True
+        atoms, = np.nonzero(member.any(axis=0))
+        m = member[:, atoms]
+        # Stable sort on membership, first section as primary key; for
+        # non-overlapping sections each class is one section, in order
+        perm = np.lexsort(~m[::-1])
+        atoms = atoms[perm]
+        m = m[:, perm]
+        changes, = np.nonzero((m[:, 1:] != m[:, :-1]).any(axis=0))
+        ends = np.concatenate([[0], changes + 1, [len(atoms)]])
+
+        self.classes = [atoms[a:b] for a, b in zip(ends[:-1], ends[1:])]
+        self._class_ends = ends
+        self._section_classes = [list(np.nonzero(m[s, ends[:-1]])[0])
+                                 for s in range(len(self.sections))]
+        # rho(k) etc are normalized by 1/sqrt(N), see _rho_j_k.c
+        self._section_weights = [
+            [np.sqrt(float(len(self.classes[c])) / len(I)) for c in C]
+            for C, (_, I) in zip(self._section_classes, self.sections)]
+        rest = np.setdiff1d(np.arange(N), atoms)
+        self._atom_order = np.concatenate([atoms, rest]).astype(np.intp)
 
     def valid_index_limits(self, N):
         for _,I in self.sections:
@@ -70,16 +101,86 @@ class section_index:
     def N_sections(self):
         return len(self.sections)
 
-    def get_section_split_function(self):
+    def N_classes(self):
+        return len(self.classes)
+
+    def get_section_classes(self):
+        """Return, for each section, the atom classes it consists of"""
+        return [list(C) for C in self._section_classes]
+
+    def get_atom_order(self):
+        """Return atom order making all atom classes contiguous
+
+        Intended as atom_order argument to get_itraj (and the trajectory
+        readers).
+        """
+        return self._atom_order
+
+    def get_section_split_function(self, reordered=False, velocities=True):
         """Special function for splitting (3,N) dimensioned x or v arrays
 
-        Split x/v into list of xs/vs in accordance with specified sections.
+        Split x/v into list of xs/vs in accordance with the atom classes
+        (see combine_classes). If no sections overlap, each class is
+        simply a section.
+        The frame is augmented in place, using buffers owned by the frame.
+
+        If reordered, the frames are expected to be read using the order
+        given by get_atom_order, and each xs/vs is then a (zero-copy)
+        slice of x/v.
+
+        If not velocities, v is not split (and hence, no currents are
+        calculated).
+        """
+        indices = self.classes
+        if reordered:
+            ends = self._class_ends
+            slices = [slice(a, b) for a, b in zip(ends[:-1], ends[1:])]
+            def split(frame, a):
+                return [a[:, s] for s in slices]
+        else:
+            def split(frame, a):
+                return [np.take(a, I, axis=1, mode='clip',
+                                out=frame.buffer((3, len(I)), a.dtype))
+                        for I in indices]
+        def fun(frame):
+            frame['xs'] = split(frame, frame['x'])
+            if velocities and frame.get('v') is not None:
+                frame['vs'] = split(frame, frame['v'])
+            return frame
+        return fun
+
+    def combine_classes(self, values, frame=None):
+        """Form per section sums of per class values (e.g. rho(k))
+
+        values is a list with one array per atom class, each normalized
+        by 1/sqrt(number of atoms in class) as done by calc_rho_k. The
+        per section sums are normalized in the same way.
+        Sections consisting of a single class share the array of that
+        class, sums are stored in buffers owned by frame (if given).
+        """
+        res = []
+        for C, W in zip(self._section_classes, self._section_weights):
+            if len(C) == 1:
+                res.append(values[C[0]])
+                continue
+            a = values[C[0]]
+            out = None if frame is None else frame.buffer(a.shape, a.dtype)
+            total = np.multiply(a, W[0], out=out)
+            for c, w in zip(C[1:], W[1:]):
+                total += w * values[c]
+            res.append(total)
+        return res
+
+    def get_section_combine_function(self):
+        """Special function for combining per class k-space densities
+
+        Replace rho_ks (and j_ks, jz_ks, jper_ks) of a frame processed
+        per class by per section sums, see combine_classes.
         """
-        indices = [I for _,I in self.sections]
         def fun(frame):
-            frame = frame.copy()
-            frame['xs'] = [frame['x'][:,I] for I in indices]
-            if 'v' in frame:
-                frame['vs'] = [frame['v'][:,I] for I in indices]
+            for key in ('rho_ks', 'j_ks', 'jz_ks', 'jper_ks'):
+                values = frame.get(key)
+                if values is not None:
+                    frame[key] = self.combine_classes(values, frame)
             return frame
         return fun
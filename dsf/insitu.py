@@ -0,0 +1,153 @@
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+__all__ = ['insitu_dsf']
+
+import numpy as np
+import logging
+from collections import deque
+from functools import partial
+
+from dsf.index import section_index
+from dsf.reciprocal import reciprocal_isotropic
+from dsf.correlation import correlator
+from dsf.output import create_mfile, create_pfile
+from dsf.trajectory_reader.abstract_trajectory_reader import copy_scaled
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
+
+logger = logging.getLogger('dynsf')
+
+
+class insitu_dsf:
+    """Calculate dynamical structure factors from within a simulation
+
+    Positions (and velocities) are passed for one time step at a time
+    using add_frame, e.g. directly from the arrays of a running
+    simulation (the arrays are copied, and can be reused by the
+    caller). Time windows are correlated as soon as they are complete,
+    so only nt frames are kept in memory. Results so far are
+    available at any time from get_output, or written using write.
+
+    The time windows are the same as in dynsf (see iwindow), and the
+    results are identical to running dynsf on a trajectory of the same
+    frames, as long as the same k-points are used: when max_k_points
+    prunes the k-space grid, the points are selected at random, so
+    seed must be given (as --k-seed to dynsf). Call finish when done,
+    to also use the trailing windows.
+
+    box - simulation box as 3 row vectors (nm), used for k-space sampling
+    N - number of atoms
+    index_file - optional (gromacs style) index file, see section_index
+    nt, stride, delta_t, k_max, max_k_points, k_bins, lag_threshold - as
+    for dynsf
+    seed - seed for the random selection of k-points (as --k-seed)
+    x_factor, v_factor - unit conversion of positions and velocities
+    threads - number of threads used for correlating
+    """
+    def __init__(self, box, N, index_file=None, nt=1, stride=1, delta_t=1.0,
+                 k_max=60.0, max_k_points=20000, k_bins=80,
+                 calculate_current=False, calculate_self=False,
+                 lag_threshold=None, x_factor=1.0, v_factor=1.0, threads=1,
+                 seed=None):
+        assert(stride >= 1)
+        self.box = np.array(box, dtype=np.float64)
+        self.N = N
+        self.N_tc = nt + (nt + 1) % 2 if nt > 1 else 1
+        self.stride = stride
+        self.k_bins = k_bins
+        self.calculate_current = calculate_current
+        self.x_factor = x_factor
+        self.v_factor = v_factor
+        self.threads = threads
+
+        self.index = section_index(index_file, N)
+        self.rec = reciprocal_isotropic(self.box, max_points=max_k_points,
+                                        max_k=k_max, seed=seed)
+        self.corr = correlator(self.rec, self.index, self.box, self.N_tc, delta_t,
+                               calculate_current=calculate_current,
+                               calculate_self=calculate_self,
+                               decay_threshold=lag_threshold)
+
+        self._atom_order = self.index.get_atom_order()
+        split = self.index.get_section_split_function(reordered=True)
+        process = self.rec.get_frame_process_function()
+        combine = self.index.get_section_combine_function()
+        self._process = lambda frame: combine(process(split(frame)))
+
+        self._pool = frame_buffer_pool()
+        self._n_frames = 0
+        self._frames = deque()  # (frame number, frame) of unfinished windows
+        self._next_window = 0   # number of the next window to correlate
+
+    def _as_3N(self, a):
+        # Accept both (3, N) and (N, 3) shaped arrays
+        a = np.asarray(a, dtype=np.float64)
+        if a.shape == (3, self.N):
+            return a
+        if a.shape == (self.N, 3):
+            return a.T
+        raise ValueError('insitu_dsf: expected array of shape (3, %i) or (%i, 3)' % (
+                self.N, self.N))
+
+    def add_frame(self, x, v=None, time=None, box=None):
+        """Add positions x (and velocities v) of the next time step"""
+        n = self._n_frames
+        self._n_frames += 1
+        if self.stride > self.N_tc and n % self.stride >= self.N_tc:
+            # Not part of any time window
+            return
+
+        frame = trajectory_frame(pool=self._pool, index=n + 1, N=self.N,
+                                 box=self.box if box is None else box,
+                                 time=time)
+        frame.x = copy_scaled(self._as_3N(x), self.x_factor,
+                              frame.buffer((3, self.N)), self._atom_order)
+        if self.calculate_current:
+            if v is None:
+                raise ValueError('insitu_dsf: velocities are needed for currents')
+            frame.v = copy_scaled(self._as_3N(v), self.v_factor,
+                                  frame.buffer((3, self.N)), self._atom_order)
+        self._frames.append((n, self._process(frame)))
+
+        # Correlate all windows ending with this frame
+        while self._next_window * self.stride + self.N_tc - 1 <= n:
+            self._correlate(self._next_window * self.stride + self.N_tc)
+
+    def _correlate(self, end):
+        start = self._next_window * self.stride
+        window = [f for m, f in self._frames if start <= m < end]
+        self.corr.add_window(window, threads=self.threads)
+        self._next_window += 1
+        # Frames before the next window are not needed anymore
+        start = self._next_window * self.stride
+        while self._frames and self._frames[0][0] < start:
+            self._frames.popleft()[1].release()
+
+    def finish(self):
+        """Correlate the trailing (shorter) windows"""
+        while self._next_window * self.stride < self._n_frames:
+            self._correlate(self._n_frames)
+
+    def get_output(self):
+        """Return list of (value, name, description) of all results so far"""
+        return self.corr.get_output(k_bins=self.k_bins)
+
+    def write(self, mfile=None, pfile=None, comment=None):
+        """Write results so far, as Matlab style m-file and/or pickle file"""
+        output = self.get_output()
+        for fn, writer in ((mfile, partial(create_mfile, comment=comment)),
+                           (pfile, create_pfile)):
+            fn and writer(fn, output)
@@ -0,0 +1,215 @@
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+"""Partial radial distribution functions g(r), calculated in real space
+
+Pair distances are found using cell lists (linked cells), i.e. by
+sorting the atoms into cells at least r_max wide, and only considering
+pairs of atoms in neighbouring cells. This is O(N) per frame, and g(r)
+is not limited by any k_max. The static structure factor S(k) is then
+calculated from g(r) by a (Lorch) windowed sine transform.
+"""
+
+__all__ = ['radial_distribution', 'pair_histogram', 'get_max_r']
+
+import numpy as np
+import logging
+from itertools import product
+
+import dsf.filon as filon
+from dsf.handythread import parallel_map
+
+logger = logging.getLogger('dynsf')
+
+pi = np.pi
+
+# Largest number of candidate pairs considered at once (per thread)
+PAIR_CHUNK = 1 << 20
+
+
+def _cell_list(s, n):
+    # Sort fractional positions s (3, N) into n[0] x n[1] x n[2] cells.
+    # Return table, with the atoms of cell c in table[c] (padded by -1),
+    # and the (3, N_cells) coordinates of all cells
+    c = np.minimum((s * n.reshape(3, 1)).astype(int), n.reshape(3, 1) - 1)
+    cell = np.ravel_multi_index(c, n)
+    order = np.argsort(cell, kind='mergesort')
+    count = np.bincount(cell, minlength=np.prod(n))
+    start = np.cumsum(count) - count
+    table = np.full((len(count), max(count.max(), 1)), -1, dtype=np.intp)
+    cell = cell[order]
+    table[cell, np.arange(len(order)) - start[cell]] = order
+    cells = np.array(np.unravel_index(np.arange(len(count)), n))
+    return table, cells
+
+
+def _box_widths(box):
+    # Distances between opposite faces of box
+    a, b, c = np.asarray(box, dtype=np.float64)
+    V = abs(np.dot(np.cross(a, b), c))
+    return V / np.array([np.linalg.norm(np.cross(b, c)),
+                         np.linalg.norm(np.cross(c, a)),
+                         np.linalg.norm(np.cross(a, b))])
+
+
+def get_max_r(box):
+    """Return the largest r_max that can be used for box"""
+    return 0.5 * _box_widths(box).min()
+
+
+def pair_histogram(x, box, atom_class, N_classes, r_max, r_bins, threads=1):
+    """Histogram the distances below r_max between all pairs of atoms
+
+    x are the (3, N) positions, box the simulation box (3 row vectors)
+    and atom_class the class of each atom. Periodic boundary conditions
+    (minimum image) are used, r_max can hence be at most half the box
+    width. Returns the (N_classes, N_classes, r_bins) counts of ordered
+    pairs (i, j), i != j, by class of i and j.
+    """
+    h = np.asarray(box, dtype=np.float64).T
+    widths = _box_widths(box)
+    if r_max > 0.5 * widths.min():
+        raise ValueError('pair_histogram: r_max must be at most half the box width (%g)'
+                         % (0.5 * widths.min()))
+
+    # Cells are at least r_max wide, so all pairs closer than r_max are
+    # in the same or adjacent cells
+    n = np.maximum((widths // r_max).astype(int), 1)
+    s = np.linalg.solve(h, np.asarray(x, dtype=np.float64))
+    s -= np.floor(s)
+    table, cells = _cell_list(s, n)
+    offsets = list(product(*[np.unique(np.mod([-1, 0, 1], m)) for m in n]))
+    atom_class = np.asarray(atom_class)
+
+    occupancy = table.shape[1]
+    chunk = max(1, PAIR_CHUNK // occupancy ** 2)
+    def hist(task):
+        offset, start = task
+        C = slice(start, start + chunk)
+        neighbours = np.ravel_multi_index(
+            [(cells[d, C] + offset[d]) % n[d] for d in range(3)], n)
+        I, J = np.broadcast_arrays(table[C][:, :, None], table[neighbours][:, None, :])
+        valid = (I >= 0) & (J >= 0) & (I != J)
+        I, J = I[valid], J[valid]
+        ds = s[:, J] - s[:, I]
+        ds -= np.rint(ds)
+        r = np.sqrt(np.sum(np.dot(h, ds) ** 2, axis=0))
+        close = r < r_max
+        bins = np.minimum((r[close] * (r_bins / r_max)).astype(int), r_bins - 1)
+        key = (atom_class[I[close]] * N_classes + atom_class[J[close]]) * r_bins + bins
+        return np.bincount(key, minlength=N_classes ** 2 * r_bins)
+
+    tasks = [(o, start) for o in offsets for start in xrange(0, len(table), chunk)]
+    counts = sum(parallel_map(hist, tasks, threads=threads))
+    return counts.reshape(N_classes, N_classes, r_bins)
+
+
+class radial_distribution:
+    """Accumulate partial radial distribution functions g(r) of frames
+
+    g(r) is calculated for each pair of sections of index (a
+    section_index), from r = 0 to r_max in r_bins bins. Frames are to
+    be split into atom classes (see section_index.get_section_split_function).
+    The pair distances of each frame are found by threads threads.
+    """
+    def __init__(self, index, r_max, r_bins=200, threads=1):
+        assert(r_max > 0 and r_bins > 0)
+        self.index = index
+        self.r_max = float(r_max)
+        self.r_bins = r_bins
+        self.threads = threads
+
+        self.class_counts = np.array([len(C) for C in index.classes])
+        Nc = len(self.class_counts)
+        self._atom_class = np.repeat(np.arange(Nc), self.class_counts)
+        # Sum over frames of pair counts times volume, and of volume
+        self._counts = np.zeros((Nc, Nc, r_bins))
+        self._volume = 0.0
+        self.n_frames = 0
+
+    def add_frame(self, frame):
+        """Add the pair distances of a frame (split into classes, xs)"""
+        x = np.concatenate(frame['xs'], axis=1)
+        V = abs(np.linalg.det(frame['box']))
+        counts = pair_histogram(x, frame['box'], self._atom_class,
+                                len(self.class_counts), self.r_max,
+                                self.r_bins, threads=self.threads)
+        self._counts += V * counts
+        self._volume += V
+        self.n_frames += 1
+
+    def get_frame_process_function(self):
+        """Create a function adding each frame (returned unchanged)"""
+        def fun(frame):
+            self.add_frame(frame)
+            return frame
+        return fun
+
+    def get_output(self, k_max=60.0, k_bins=80, outputs=None):
+        """Return list of (value, name, description) of all results so far
+
+        That is g(r) for each pair of sections, and (unless outputs, a
+        list of kinds of results, leaves out 'S_g_k') S(k) for k_bins
+        values of k up to k_max, calculated from g(r).
+        """
+        if self.n_frames == 0:
+            return []
+        names = self.index.get_section_names()
+        classes = self.index.get_section_classes()
+        N = [self.class_counts[C].sum() for C in classes]
+        V = self._volume / self.n_frames
+
+        dr = self.r_max / self.r_bins
+        edges = dr * np.arange(self.r_bins + 1)
+        r = 0.5 * (edges[1:] + edges[:-1])
+        shell = (4 * pi / 3) * (edges[1:] ** 3 - edges[:-1] ** 3)
+
+        pairs, g = [], []
+        for i in range(len(names)):
+            for j in range(i, len(names)):
+                common = self.class_counts[list(set(classes[i]) & set(classes[j]))].sum()
+                n = self._counts[classes[i]][:, classes[j]].sum(axis=(0, 1))
+                pair_count = N[i] * N[j] - common
+                g.append(n / (self.n_frames * pair_count * shell))
+                pairs.append((i, j, common))
+
+        output = [(r, 'r_g', 'r-values of g(r) (bin centers) [nm]')]
+        output += [(g[m], 'g_r_%i_%i' % (i, j),
+                    'Partial radial distribution function [r] (%s-%s)' % (names[i], names[j]))
+                   for m, (i, j, _) in enumerate(pairs)]
+
+        if outputs is not None and 'S_g_k' not in outputs:
+            return output
+
+        # An odd number of points, as needed by filon
+        M = self.r_bins - (1 - self.r_bins % 2)
+        if M < 3:
+            return output
+        k = np.linspace(k_max / k_bins, k_max, k_bins)
+        window = np.sinc(r[:M] / self.r_max)  # sin(pi r/R) / (pi r/R)
+        f = np.array([r[:M] * (g_ij[:M] - 1) * window for g_ij in g])
+        I = filon.sin_integral(f, dr, k, x0=r[0], axis=1)
+        S = []
+        for (i, j, common), I_ij in zip(pairs, I):
+            Nij = float(N[i] * N[j])
+            S.append(common / np.sqrt(Nij) +
+                     (Nij - common) / (np.sqrt(Nij) * V) * 4 * pi * I_ij / k)
+
+        output += [(k, 'k_g', 'k-values of S(k) calculated from g(r) [nm^-1]')]
+        output += [(S[m], 'S_g_k_%i_%i' % (i, j),
+                    'Partial static structure factor, from g(r) [k] (%s-%s)' % (names[i], names[j]))
+                   for m, (i, j, _) in enumerate(pairs)]
+        return output
@@ -16,15 +16,23 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-__all__ = ['reciprocal_isotropic', 'reciprocal_line']
+__all__ = ['reciprocal_isotropic', 'reciprocal_rotating', 'reciprocal_stratified',
+           'reciprocal_line', 'reciprocal_explicit', 'reciprocal_shells',
+           'read_k_points']
 
 
-from os.path import dirname, join
+import os
+import hashlib
+from itertools import count
+from os.path import dirname, join, isfile
 import numpy as np
 import logging
 from numpy import linalg, array, arange, require, nonzero, pi, sqrt, prod
 from ctypes import cdll, c_int
 
+from dsf.binner import fixed_bin_averager, edge_bin_averager, \
+    log_bin_averager, label_averager
+
 logger = logging.getLogger('dynsf')
 
 np_f = dict(d=np.float64, s=np.float32)
@@ -53,24 +61,28 @@ for t in "ds":
                                 ndp_f_2d_r[t], c_int,
                                 ndp_c_1d_rw[t], ndp_c_2d_rw[t])
 
-def calc_rho_k(x, k, ftype='d'):
+def calc_rho_k(x, k, ftype='d', out=None):
     """Calculate rho(k) of particle coordinates x.
 
     Will call external function rho_k to calculate the
     particle density in k-space.
     Particle coordinates and k-space points of interest are
     passed as input via x and k, respectively.
+    Optionally, rho(k) is written to out.
     """
     x = require(x, np_f[ftype], ['F_CONTIGUOUS', 'ALIGNED'])
     k = require(k, np_f[ftype], ['F_CONTIGUOUS', 'ALIGNED'])
     _, Nx = x.shape
     _, Nk = k.shape
-    rho_k = np.zeros((Nk,), dtype=np_c[ftype], order='F')
-    _lib[ftype].rho_k(x, Nx, k, Nk, rho_k)
-    return rho_k
+    if out is None:
+        out = np.zeros((Nk,), dtype=np_c[ftype], order='F')
+    _lib[ftype].rho_k(x, Nx, k, Nk, out)
+    return out
 
-def calc_rho_j_k(x, v, k, ftype='d'):
+def calc_rho_j_k(x, v, k, ftype='d', out=None):
     """As calc_rho_k, but calculate also velocities in k-space
+
+    Optionally, rho(k) and j(k) are written to out (a tuple).
     """
     assert x.shape == v.shape
     x = require(x, np_f[ftype], ['F_CONTIGUOUS', 'ALIGNED'])
@@ -78,8 +90,10 @@ def calc_rho_j_k(x, v, k, ftype='d'):
     k = require(k, np_f[ftype], ['F_CONTIGUOUS', 'ALIGNED'])
     _, Nx = x.shape
     _, Nk = k.shape
-    rho_k = np.zeros((Nk,), dtype=np_c[ftype], order='F')
-    j_k = np.zeros((3, Nk), dtype=np_c[ftype], order='F')
+    if out is None:
+        out = (np.zeros((Nk,), dtype=np_c[ftype], order='F'),
+               np.zeros((3, Nk), dtype=np_c[ftype], order='F'))
+    rho_k, j_k = out
     _lib[ftype].rho_j_k(x, v, Nx, k, Nk, rho_k, j_k)
     return rho_k, j_k
 
@@ -90,30 +104,58 @@ class reciprocal_processor:
     def get_frame_process_function(self):
         """Create a function to be used to process each trajectory frame.
 
-        Augment the frame (which is a dictionary) with k-space densities
+        Augment the frame (in place) with k-space densities
         for each particle group (e.g. atom type).
         Depending on whether velocity data is available, calculate and
         add also particle currents.
         """
         def fun(frame):
-            frame = frame.copy()
+            Nk = self.k_points.shape[1]
+            c = np_c[self.ftype]
             if 'vs' in frame:
-                rho_ks, j_ks = zip(*[calc_rho_j_k(x, v, self.k_points,
-                                                  ftype=self.ftype)
-                                     for x, v in zip(frame['xs'], frame['vs'])])
-                jz_ks = [np.sum(j * self.k_direct, axis=0) for j in j_ks]
+                rho_ks, j_ks, jz_ks, jper_ks = [], [], [], []
+                for x, v in zip(frame['xs'], frame['vs']):
+                    rho_k, j_k = calc_rho_j_k(x, v, self.k_points, ftype=self.ftype,
+                                              out=(frame.buffer((Nk,), c),
+                                                   frame.buffer((3, Nk), c)))
+                    jz_k = np.einsum('ij,ij->j', j_k, self.k_direct,
+                                     out=frame.buffer((Nk,), c))
+                    jper_k = np.multiply(jz_k, self.k_direct,
+                                         out=frame.buffer((3, Nk), c))
+                    np.subtract(j_k, jper_k, out=jper_k)
+                    rho_ks.append(rho_k)
+                    j_ks.append(j_k)
+                    jz_ks.append(jz_k)
+                    jper_ks.append(jper_k)
                 frame['j_ks'] = j_ks
                 frame['jz_ks'] = jz_ks
-                frame['jper_ks'] = [j - (jz * self.k_direct) for j, jz in zip(j_ks, jz_ks)]
+                frame['jper_ks'] = jper_ks
                 frame['rho_ks'] = rho_ks
             else:
-                frame['rho_ks'] = [calc_rho_k(x, self.k_points, ftype=self.ftype)
+                frame['rho_ks'] = [calc_rho_k(x, self.k_points, ftype=self.ftype,
+                                              out=frame.buffer((Nk,), c))
                                    for x in frame['xs']]
             return frame
         return fun
 
-    def process_specific_xs(self, xs):
-        return [calc_rho_k(x, self.k_points, ftype=self.ftype) for x in xs]
+    def process_specific_xs(self, xs, k_indices=None):
+        """Return rho(k) of each x in xs (only k-points k_indices, if given)"""
+        k = self.k_points if k_indices is None else self.k_points[:, k_indices]
+        return [calc_rho_k(x, k, ftype=self.ftype) for x in xs]
+
+    def get_k_binner(self, k_bins, spacing='linear'):
+        """Return averager of per k-point values into k_bins |k|-bins
+
+        k_bins is either a number of bins, linearly (or with spacing
+        'log', logarithmically from the smallest non-zero |k|) spaced
+        up to max_k, or a sequence of bin edges.
+        """
+        if np.iterable(k_bins):
+            return edge_bin_averager(k_bins, self.k_distance)
+        if spacing == 'log':
+            k_min = np.min(self.k_distance[self.k_distance > 0])
+            return log_bin_averager(k_min, self.max_k, k_bins, self.k_distance)
+        return fixed_bin_averager(self.max_k, k_bins, self.k_distance)
 
 
 def get_prune_distance(max_points, max_q, q_vol):
@@ -136,8 +178,40 @@ def get_prune_distance(max_points, max_q, q_vol):
     x = -(u + v) / 2 - 1j * (u - v) * sqrt(3) / 2
     return np.real(x) + max_q / 2
 
+def iter_k_points(B, max_q, q_prune=None, rng=None, ftype='d'):
+    """Generate the k-points of the grid spanned by B with |q| <= max_q
+
+    The grid (n1*b1 + n2*b2 + n3*b3, n1, n2, n3 >= 0) is enumerated
+    slab by slab (one n1 at a time), yielding (k_points, q_distance)
+    for the points of each slab, so that the full grid never needs to
+    be held in memory. If q_prune is given, each point is kept with
+    probability min(1, (q_prune/|q|)^2), drawing from rng.
+    """
+    npftype = np_f[ftype]
+    b1, b2, b3 = [(2 * pi) * x.reshape((3, 1, 1)) for x in B]
+    N_k1, N_k2, N_k3 = [int(np.ceil(max_q / linalg.norm(b))) for b in B]
+    plane = \
+        b2 * arange(N_k2, dtype=npftype).reshape((1, N_k2, 1)) + \
+        b3 * arange(N_k3, dtype=npftype).reshape((1, 1, N_k3))
+    plane = plane.reshape((3, N_k2 * N_k3))
+    for n1 in xrange(N_k1):
+        k_points = plane + n1 * b1.reshape((3, 1))
+        q_distance = sqrt(np.sum(k_points ** 2, axis=0)) * (1.0 / (2 * pi))
+        I, = nonzero(q_distance <= max_q)
+        if q_prune is not None:
+            # Keep point with probability min(1, (q_prune/|q|)^2) ->
+            # aim for an equal number of points per equally thick "onion peel"
+            # to get equal number of points per radial unit.
+            q = q_distance[I]
+            p = np.ones(len(I))
+            p[q > 0] = (q_prune / q[q > 0]) ** 2
+            I = I[p > rng.rand(len(I))]
+        yield k_points[:, I], q_distance[I]
+
+
 class reciprocal_isotropic(reciprocal_processor):
-    def __init__(self, box, max_points=10000, max_k=10.0, ftype='d'):
+    def __init__(self, box, max_points=10000, max_k=10.0, ftype='d', seed=None,
+                 cache_dir=None):
         """Creates a set of reciprocal coordinates suitable for isotropic
         sampling of k-space. Provide a method to calculate rho_k/j_k
         for trajectory frames.
@@ -155,6 +229,10 @@ class reciprocal_isotropic(reciprocal_processor):
         Variables named q-something are expected to be without the 2*pi factor.
 
         ftype can be either 'd' or 's' (double or single precission)
+
+        seed (optional) seeds the random removal of points, making the
+        set of points reproducible. Reproducible sets are stored in
+        cache_dir (if given), and read from there the next time.
         """
 
         assert(max_points > 1000)
@@ -179,32 +257,35 @@ class reciprocal_isotropic(reciprocal_processor):
         else:
             self.q_prune = get_prune_distance(max_points, max_q, q_vol)
 
-        b1, b2, b3 = [(2 * pi) * x.reshape((3, 1, 1, 1)) for x in self.B]
-        N_k1, N_k2, N_k3 = [np.ceil(max_q / dq) for dq in q_mins]
-        k_points = \
-            b1 * arange(N_k1, dtype=npftype).reshape((1, N_k1, 1, 1)) + \
-            b2 * arange(N_k2, dtype=npftype).reshape((1, 1, N_k2, 1)) + \
-            b3 * arange(N_k3, dtype=npftype).reshape((1, 1, 1, N_k3))
-        k_points = k_points.reshape((3, k_points.size / 3))
-        q_distance = sqrt(np.sum(k_points ** 2, axis=0)) * (1.0 / (2 * pi))
-
-        I, = nonzero(q_distance <= max_q)
-        I = I[q_distance[I].argsort()]
-        q_distance = q_distance[I]
-        k_points = k_points[:, I]  # All k_points < max_k, sorted by length
-
-        if self.q_prune is not None:
-            N = len(q_distance)
-
-            # Keep point with probability min(1, (q_prune/|q|)^2) ->
-            # aim for an equal number of points per equally thick "onion peel"
-            # to get equal number of points per radial unit.
-            p = np.ones(N)
-            p[1:] = (self.q_prune / q_distance[1:]) ** 2
-
-            I, = nonzero(p > np.random.rand(N))
-            q_distance = q_distance[I]
+        cache = None
+        if cache_dir is not None and (seed is not None or self.q_prune is None):
+            h = hashlib.sha1()
+            h.update(np.require(self.A, np.float64, 'C').tostring())
+            h.update('%r %i %r %s' % (max_k, max_points, seed, ftype))
+            cache = join(cache_dir, 'k_points_%s.npy' % h.hexdigest())
+
+        if cache is not None and isfile(cache):
+            logger.debug('Reading k-points from %s' % cache)
+            k_points = np.load(cache)
+            q_distance = sqrt(np.sum(k_points ** 2, axis=0)) * (1.0 / (2 * pi))
+        else:
+            rng = np.random.RandomState(seed)
+            k_points, q_distance = zip(*iter_k_points(self.B, max_q, self.q_prune,
+                                                      rng, ftype))
+            k_points = np.concatenate(k_points, axis=1)
+            q_distance = np.concatenate(q_distance)
+            # Sort by length
+            I = q_distance.argsort(kind='mergesort')
             k_points = k_points[:, I]
+            q_distance = q_distance[I]
+            if cache is not None:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                # Write and rename, concurrent runs may share cache_dir
+                tmp = '%s.tmp%i' % (cache, os.getpid())
+                with open(tmp, 'wb') as fh:
+                    np.save(fh, k_points)
+                os.rename(tmp, cache)
 
         self.k_points = k_points
         self.q_distance = q_distance
@@ -214,6 +295,206 @@ class reciprocal_isotropic(reciprocal_processor):
         self.k_direct[:, 1:] /= self.k_distance[1:].reshape((1, N - 1))
 
 
+class reciprocal_rotating(reciprocal_isotropic):
+    def __init__(self, box, max_points=10000, max_k=10.0, subsets=10,
+                 width=1, stride=1, ftype='d', seed=None, cache_dir=None):
+        """Sample k-space with a different set of k-points for each window
+
+        A large set of subsets * max_points points is selected as by
+        reciprocal_isotropic, and split into subsets of (about)
+        max_points points, each covering all |k|. Time window w
+        (counting from 0, windows of width frames, stride frames
+        apart, see iwindow) uses subset w % subsets, see
+        get_window_k_indices.
+
+        Frames are processed (using get_frame_process_function, on
+        each frame in a window, in order) for the subsets of all
+        windows they are part of, and only those. So if stride is
+        smaller than width, frames are processed for several subsets.
+        """
+        reciprocal_isotropic.__init__(self, box, max_points=subsets * max_points,
+                                      max_k=max_k, ftype=ftype, seed=seed,
+                                      cache_dir=cache_dir)
+        self.width = width
+        self.stride = stride
+
+        # Deal each run of subsets points (in order of |k|) out to
+        # the subsets in random order
+        rng = np.random.RandomState(seed)
+        N = len(self.q_distance)
+        blocks = (N + subsets - 1) // subsets
+        deal = np.concatenate([rng.permutation(subsets) for _ in xrange(blocks)])[:N]
+        self.subsets = [nonzero(deal == i)[0] for i in xrange(subsets)]
+
+    def get_window_k_indices(self, window):
+        """Return the indices of the k-points used by window number window"""
+        return self.subsets[window % len(self.subsets)]
+
+    def _frame_k_indices(self, n):
+        # k-points of the windows that frame number n is part of
+        W, s = self.width, self.stride
+        first = max(0, -(-(n - W + 1) // s))
+        last = n // s
+        I = [self.get_window_k_indices(w) for w in xrange(first, last + 1)]
+        return np.unique(np.concatenate(I)) if len(I) > 1 else I[0]
+
+    def get_frame_process_function(self):
+        """As for reciprocal_processor, but on the k-points of the
+        windows each frame is part of (see __init__)
+
+        The k-space densities have entries for all k-points, those
+        not calculated are zero.
+        """
+        W, s = self.width, self.stride
+        processed = count()
+        def fun(frame):
+            p = processed.next()
+            # Frames not part of any window are never processed
+            n = p if s < W else (p // W) * s + p % W
+            I = self._frame_k_indices(n)
+            k = self.k_points[:, I]
+            k_direct = self.k_direct[:, I]
+            Nk = self.k_points.shape[1]
+            c = np_c[self.ftype]
+            def full(values):
+                a = frame.buffer(values.shape[:-1] + (Nk,), c)
+                a.fill(0)
+                a[..., I] = values
+                return a
+            if 'vs' in frame:
+                rho_ks, j_ks, jz_ks, jper_ks = [], [], [], []
+                for x, v in zip(frame['xs'], frame['vs']):
+                    rho_k, j_k = calc_rho_j_k(x, v, k, ftype=self.ftype)
+                    jz_k = np.einsum('ij,ij->j', j_k, k_direct)
+                    rho_ks.append(full(rho_k))
+                    j_ks.append(full(j_k))
+                    jz_ks.append(full(jz_k))
+                    jper_ks.append(full(j_k - jz_k * k_direct))
+                frame['j_ks'] = j_ks
+                frame['jz_ks'] = jz_ks
+                frame['jper_ks'] = jper_ks
+                frame['rho_ks'] = rho_ks
+            else:
+                frame['rho_ks'] = [full(calc_rho_k(x, k, ftype=self.ftype))
+                                   for x in frame['xs']]
+            return frame
+        return fun
+
+
+def spread_directions(k_points, m, rng):
+    """Return indices of m of the points k_points (3, n), well spread
+    in direction
+
+    The points are ordered along a serpentine path over the unit
+    sphere (bands of equal area, i.e. of equal width in cos(theta),
+    traversed in alternating phi-directions), and m points equally
+    spaced along the path are picked (starting at a random offset).
+    """
+    n = k_points.shape[1]
+    if n <= m:
+        return arange(n)
+    norm = sqrt(np.sum(k_points ** 2, axis=0))
+    z = k_points[2] / np.where(norm > 0, norm, 1.0)
+    phi = np.arctan2(k_points[1], k_points[0])
+    bands = max(1, int(sqrt(m)))
+    z_min, z_max = z.min(), z.max()
+    band = ((z - z_min) * (bands / (z_max - z_min + 1e-12))).astype(int)
+    band = np.minimum(band, bands - 1)
+    order = np.lexsort((np.where(band % 2, -phi, phi), band))
+    return order[((arange(m) + rng.rand()) * (float(n) / m)).astype(int)]
+
+
+class reciprocal_stratified(reciprocal_processor):
+    # Points (per bin) kept in the first, random, thinning of the grid
+    # relative to the number finally selected
+    oversampling = 4
+
+    def __init__(self, box, k_bins=80, points_per_bin=100, max_k=10.0, ftype='d',
+                 seed=None, bin_weights=None):
+        """Sample k-space with a given number of points per |k|-bin
+
+        The bins are those used when averaging (see get_k_binner).
+        Each bin gets points_per_bin points (or all points in the bin,
+        if fewer), spread over all directions (see spread_directions).
+
+        Optionally, bin_weights gives the relative number of points of
+        each bin (keeping the total number of points), e.g. from
+        pilot_bin_weights.
+
+        max_k, ftype and seed are as for reciprocal_isotropic.
+        """
+        assert(k_bins > 1)
+
+        self.max_k = max_k
+        self.k_bins = k_bins
+        self.ftype = ftype
+        npftype = np_f[ftype]
+        self.A = require(box.copy(), npftype)
+        self.B = linalg.inv(self.A.transpose())
+        max_q = max_k / (2.0 * pi)
+
+        target = np.ones(k_bins) * points_per_bin
+        if bin_weights is not None:
+            w = np.asarray(bin_weights, dtype=np.float64)
+            target = (k_bins * points_per_bin / w.sum()) * w
+        target = np.maximum(1, np.rint(target)).astype(int)
+
+        # Count the grid points per bin, then thin out the grid (in the
+        # same order) to a few times the wanted number of points per bin
+        counts = np.zeros(k_bins, dtype=int)
+        for _, q_distance in iter_k_points(self.B, max_q, ftype=ftype):
+            counts += np.bincount(self.bin_index(q_distance), minlength=k_bins)
+        p = np.minimum(1.0, self.oversampling * target / np.maximum(counts, 1.0))
+
+        rng = np.random.RandomState(seed)
+        candidates = [[] for _ in range(k_bins)]
+        for k_points, q_distance in iter_k_points(self.B, max_q, ftype=ftype):
+            b = self.bin_index(q_distance)
+            I, = nonzero(p[b] > rng.rand(len(b)))
+            for i in np.unique(b[I]):
+                candidates[i].append(k_points[:, I[b[I] == i]])
+
+        selected = []
+        for i, c in enumerate(candidates):
+            if c:
+                c = np.concatenate(c, axis=1)
+                selected.append(c[:, spread_directions(c, target[i], rng)])
+        k_points = np.concatenate(selected, axis=1)
+        q_distance = sqrt(np.sum(k_points ** 2, axis=0)) * (1.0 / (2 * pi))
+        I = q_distance.argsort(kind='mergesort')
+
+        self.k_points = require(k_points[:, I], npftype, ['F_CONTIGUOUS', 'ALIGNED'])
+        self.q_distance = q_distance[I]
+        self.k_distance = 2.0 * pi * self.q_distance
+        self.k_direct = array(self.k_points, order='F')
+        nz, = nonzero(self.k_distance > 0)
+        self.k_direct[:, nz] /= self.k_distance[nz]
+
+    def bin_index(self, q_distance):
+        """Return the |k|-bin of each q_distance"""
+        delta_k = self.max_k / (self.k_bins - 1)
+        b = np.floor(2.0 * pi * q_distance / delta_k + 0.5).astype(int)
+        return np.minimum(b, self.k_bins - 1)
+
+    def pilot_bin_weights(self, x):
+        """Return bin weights for allocating points where they are needed
+
+        The spread (standard deviation) of |rho(k)|^2 within each bin,
+        for particle positions x, estimates how much the average of a
+        bin gains from more points. Allocating points in proportion to
+        it (Neyman allocation) minimizes the overall error.
+        """
+        s = np.abs(calc_rho_k(x, self.k_points, ftype=self.ftype)) ** 2
+        b = self.bin_index(self.q_distance)
+        n = np.bincount(b, minlength=self.k_bins).astype(np.float64)
+        mean = np.bincount(b, s, minlength=self.k_bins) / np.maximum(n, 1)
+        var = np.bincount(b, s ** 2, minlength=self.k_bins) / np.maximum(n, 1) - mean ** 2
+        w = sqrt(np.maximum(var, 0.0))
+        # Bins without an estimate get an average share
+        w[(n < 2) | (w == 0)] = w[w > 0].mean() if (w > 0).any() else 1.0
+        return w
+
+
 class reciprocal_line(reciprocal_processor):
     def __init__(self, points=1000, k_direction=(1.0, 1.0, 1.0), ftype='d'):
 
@@ -226,3 +507,137 @@ class reciprocal_line(reciprocal_processor):
         self.q_distance = self.k_distance * (1.0 / (2 * pi))
         self.k_direct = self.k_points.copy()
         self.k_direct[:, 1:] /= self.k_distance[1:].reshape((1, points - 1))
+
+
+def read_k_points(filename):
+    """Read k-points (in 2*pi*nm^-1) from filename
+
+    Return k-points as a (3, N) array, and a list of labels (or None).
+    A .npy-file, holding a (N, 3) array, is memory mapped. Other files
+    are read as text, with one k-point per line (kx ky kz), optionally
+    followed by a label. Empty lines and lines starting with # are
+    ignored.
+    """
+    if filename.endswith('.npy'):
+        k = np.load(filename, mmap_mode='r')
+        if k.ndim != 2 or k.shape[1] != 3:
+            raise ValueError('read_k_points: expected a (N, 3) array in %s' % filename)
+        return k.T, None
+
+    k, labels = [], []
+    with open(filename) as fh:
+        for n, L in enumerate(fh, 1):
+            fields = L.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            try:
+                k.append(map(float, fields[:3]))
+            except ValueError:
+                raise ValueError('read_k_points: bad k-point on line %i of %s' % (
+                        n, filename))
+            if len(k[-1]) != 3:
+                raise ValueError('read_k_points: bad k-point on line %i of %s' % (
+                        n, filename))
+            labels.append(' '.join(fields[3:]))
+    if not k:
+        raise ValueError('read_k_points: no k-points in %s' % filename)
+    if not any(labels):
+        labels = None
+    elif not all(labels):
+        raise ValueError('read_k_points: some, but not all, k-points are '
+                         'labelled in %s' % filename)
+    return array(k).T, labels
+
+
+class reciprocal_explicit(reciprocal_processor):
+    def __init__(self, box, k_points, labels=None, ftype='d'):
+        """Sample k-space on an explicitly given set of k-points
+
+        k_points is a (3, N) array (in 2*pi*nm^-1), see read_k_points.
+        The points are sorted by |k| (as needed for radial binning).
+        If labels (one per k-point) are given, values are averaged
+        per label rather than in |k|-bins.
+
+        Points that do not sit on the reciprocal lattice of box (and
+        hence are not compatible with its periodicity) are rejected,
+        raising ValueError.
+        """
+        self.ftype = ftype
+        npftype = np_f[ftype]
+        self.A = require(box.copy(), npftype)
+
+        # k = 2*pi*B^T*n, n integer, for points on the reciprocal lattice
+        n = np.dot(self.A, k_points) * (1.0 / (2 * pi))
+        off = np.abs(n - np.rint(n)).max(axis=0)
+        if (off > 1e-3).any():
+            raise ValueError('reciprocal_explicit: %i of %i k-points are not on the '
+                             'reciprocal lattice of the box (largest deviation %f)' % (
+                    np.sum(off > 1e-3), len(off), off.max()))
+
+        k_distance = sqrt(np.sum(np.square(k_points, dtype=npftype), axis=0))
+        if (np.diff(k_distance) < 0).any():
+            I = k_distance.argsort(kind='mergesort')
+            k_points = k_points[:, I]
+            k_distance = k_distance[I]
+            if labels is not None:
+                labels = [labels[i] for i in I]
+        # A memory mapped (N, 3) file is already (3, N) fortran ordered
+        self.k_points = require(k_points, npftype, ['F_CONTIGUOUS', 'ALIGNED'])
+        self.k_labels = labels
+        self.k_distance = k_distance
+        self.q_distance = k_distance * (1.0 / (2 * pi))
+        self.max_k = k_distance[-1]
+        self.k_direct = array(self.k_points, order='F')
+        nz, = nonzero(k_distance > 0)
+        self.k_direct[:, nz] /= k_distance[nz]
+
+    def get_k_binner(self, k_bins, spacing='linear'):
+        if self.k_labels is None:
+            return reciprocal_processor.get_k_binner(self, k_bins, spacing)
+        return label_averager(self.k_labels, self.k_distance)
+
+
+class reciprocal_shells(reciprocal_explicit):
+    def __init__(self, box, shells, max_points=1000, ftype='d', seed=None):
+        """Sample k-space in thin shells around a few |k| values only
+
+        shells is a list of (k, tolerance) pairs (in 2*pi*nm^-1); the
+        lattice points with |k| within tolerance from k are used, at
+        most max_points (spread over all directions) per shell. A
+        tolerance of None means half the smallest reciprocal lattice
+        spacing. Shells must not overlap. Results are averaged per
+        shell (the shells are the labels, see reciprocal_explicit).
+        """
+        A = require(box, np.float64)
+        B = linalg.inv(A.transpose())
+        dk = 2.0 * pi * min(linalg.norm(b) for b in B)
+        shells = sorted((k, 0.5 * dk if tolerance is None else tolerance)
+                        for k, tolerance in shells)
+        for (k0, t0), (k1, t1) in zip(shells[:-1], shells[1:]):
+            if k0 + t0 >= k1 - t1:
+                raise ValueError('reciprocal_shells: shells %g and %g overlap' % (k0, k1))
+        max_q = (shells[-1][0] + shells[-1][1]) / (2.0 * pi)
+
+        candidates = [[] for _ in shells]
+        for k_points, q_distance in iter_k_points(B, max_q, ftype=ftype):
+            k_distance = 2.0 * pi * q_distance
+            for i, (k, tolerance) in enumerate(shells):
+                I, = nonzero(np.abs(k_distance - k) <= tolerance)
+                if len(I):
+                    candidates[i].append(k_points[:, I])
+
+        rng = np.random.RandomState(seed)
+        selected, labels = [], []
+        for (k, tolerance), c in zip(shells, candidates):
+            if not c:
+                logger.warning('No k-points within %g of |k| = %g' % (tolerance, k))
+                continue
+            c = np.concatenate(c, axis=1)
+            c = c[:, spread_directions(c, max_points, rng)]
+            selected.append(c)
+            labels += ['%g' % k] * c.shape[1]
+        if not selected:
+            raise ValueError('reciprocal_shells: no k-points in any shell')
+
+        reciprocal_explicit.__init__(self, box, np.concatenate(selected, axis=1),
+                                     labels=labels, ftype=ftype)
@@ -0,0 +1,218 @@
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+__all__ = ['rho_store_key', 'rho_store_writer', 'rho_store_reader', 'open_rho_store']
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+from os.path import join, isdir, isfile, abspath
+
+from dsf.trajectory import expand_filenames
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
+from dsf.trajectory_reader.dsfcache_trajectory_reader import npy_writer
+
+logger = logging.getLogger('dynsf')
+
+#
+# A rho store is a directory of npy-files holding the k-space
+# densities (and currents) of each frame and atom class, i.e. the
+# output of the rho(k)/j(k) kernels, before any correlation:
+#
+#   rho.npy    (T, N_classes, N_k) complex64
+#   jz.npy     (T, N_classes, N_k) complex64 (optional)
+#   jper.npy   (T, N_classes, 3, N_k) complex64 (optional)
+#   x.npy      (T, 3, N) float32 [nm], in atom order (optional, used
+#              for self correlations)
+#   box.npy    (T, 3, 3), time.npy (T,), info (json)
+#
+# Stores are named by a hash of everything the densities depend on
+# (see rho_store_key), and are only written by complete runs. The
+# unit conversions of the trajectory readers (x_factor, v_factor,
+# t_factor) are not part of the hash: dynsf always reads with the
+# default factors, and a store must not be reused by code reading
+# the trajectory with other factors.
+#
+
+
+def rho_store_key(filenames, index_file, k_points, step=1, max_frames=0):
+    """Return a hash identifying the k-space densities of a trajectory
+
+    The trajectory files are identified by name, size and modification
+    time, the index file by its contents. The readers' unit conversion
+    factors are not included, the key is only valid as long as they
+    stay the same (as they do for dynsf, always using the defaults).
+    """
+    h = hashlib.sha1()
+    for fn in expand_filenames(filenames):
+        st = os.stat(fn)
+        h.update('%s %i %r\n' % (abspath(fn), st.st_size, st.st_mtime))
+    if index_file is not None and isfile(index_file):
+        with open(index_file, 'rb') as fh:
+            h.update(fh.read())
+    h.update(np.require(k_points, np.float64, 'C').tostring())
+    h.update('%i %i' % (step, max_frames))
+    return h.hexdigest()
+
+
+class rho_store_writer:
+    """Write per class k-space densities of processed frames to path
+
+    The frame process function (see get_frame_process_function) is
+    to be applied to frames processed by a reciprocal_processor, but
+    not yet combined into sections. The store is complete (and found
+    by rho_store_reader) once close has been called.
+    """
+    def __init__(self, path, positions=False):
+        self.path = path
+        self.positions = positions
+        self._tmp = '%s.tmp%i' % (path, os.getpid())
+        self._writers = None
+        self._boxes = []
+        self._times = []
+
+    def _open(self, frame):
+        os.makedirs(self._tmp)
+        Nc = len(frame['rho_ks'])
+        Nk = len(frame['rho_ks'][0])
+        w = self._writers = {}
+        w['rho'] = npy_writer(join(self._tmp, 'rho.npy'), np.complex64, (Nc, Nk))
+        if frame.get('jz_ks') is not None:
+            w['jz'] = npy_writer(join(self._tmp, 'jz.npy'), np.complex64, (Nc, Nk))
+            w['jper'] = npy_writer(join(self._tmp, 'jper.npy'), np.complex64, (Nc, 3, Nk))
+        if self.positions:
+            w['x'] = npy_writer(join(self._tmp, 'x.npy'), np.float32, (3, frame['N']))
+
+    def add(self, frame):
+        if self._writers is None:
+            self._open(frame)
+        w = self._writers
+        w['rho'].append(np.array(frame['rho_ks']))
+        if 'jz' in w:
+            w['jz'].append(np.array(frame['jz_ks']))
+            w['jper'].append(np.array(frame['jper_ks']))
+        if 'x' in w:
+            w['x'].append(frame['x'])
+        self._boxes.append(frame['box'])
+        self._times.append(np.nan if frame.get('time') is None else frame['time'])
+
+    def get_frame_process_function(self):
+        """Create a function storing each frame (returned unchanged)"""
+        def fun(frame):
+            self.add(frame)
+            return frame
+        return fun
+
+    def close(self):
+        if self._writers is None:
+            return
+        for w in self._writers.itervalues():
+            w.close()
+        np.save(join(self._tmp, 'box.npy'), np.array(self._boxes, dtype=np.float64))
+        np.save(join(self._tmp, 'time.npy'), np.array(self._times, dtype=np.float64))
+        with open(join(self._tmp, 'info'), 'w') as fh:
+            json.dump(dict(T=len(self._boxes)), fh)
+        if isdir(self.path):
+            shutil.rmtree(self.path)
+        os.rename(self._tmp, self.path)
+        self._writers = None
+
+    def abort(self):
+        """Throw away what has been written so far"""
+        if self._writers is not None:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+            self._writers = None
+
+
+class rho_store_reader:
+    """Read frames from a rho store, with per class rho_ks etc
+
+    The frames are ready to be combined into sections (see
+    section_index.get_section_combine_function). If positions are
+    stored, frames also have x (in atom order), which can be split
+    into classes for self correlations. All arrays are memory mapped.
+    """
+    def __init__(self, path):
+        if not isfile(join(path, 'info')):
+            raise IOError('rho_store_reader: %s is not a complete rho store' % path)
+        def load(name):
+            fn = join(path, name + '.npy')
+            return np.load(fn, mmap_mode='r') if isfile(fn) else None
+        self.rho = load('rho')
+        self.jz = load('jz')
+        self.jper = load('jper')
+        self.x = load('x')
+        self.boxes = np.load(join(path, 'box.npy'))
+        self.times = np.load(join(path, 'time.npy'))
+        self._i = 0
+
+    def has_currents(self):
+        return self.jz is not None
+
+    def has_positions(self):
+        return self.x is not None
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('rho_store_reader: frame index out of range')
+        time = self.times[i]
+        frame = trajectory_frame(
+            index=i + 1,
+            box=self.boxes[i],
+            time=None if np.isnan(time) else float(time),
+            rho_ks=list(self.rho[i]),
+            )
+        if self.jz is not None:
+            frame.jz_ks = list(self.jz[i])
+            frame.jper_ks = list(self.jper[i])
+        if self.x is not None:
+            frame.N = self.x.shape[2]
+            frame.x = self.x[i]
+        return frame
+
+    def next(self):
+        if self._i >= len(self):
+            raise StopIteration
+        self._i += 1
+        return self[self._i - 1]
+
+
+def open_rho_store(path, currents=False, positions=False):
+    """Return a rho_store_reader of the store at path, or None
+
+    None is returned if there is no complete store at path, or if the
+    store lacks currents or positions when asked for.
+    """
+    try:
+        reader = rho_store_reader(path)
+    except IOError:
+        return None
+    if currents and not reader.has_currents() or \
+            positions and not reader.has_positions():
+        logger.info('Stored k-space densities %s lack currents or positions' % path)
+        return None
+    return reader
@@ -0,0 +1,101 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+import numpy
+from dsf.binner import edge_bin_averager, fixed_bin_averager, \
+    log_bin_averager, label_averager, _segment_average
+
+
+def mask_average(edges, x, y, axis=0, weights=None):
+    """Average y over the non-empty bins given by edges (last bin closed),
+       one boolean mask per bin"""
+    y = numpy.moveaxis(y, axis, 0)
+    res = []
+    for i in range(len(edges) - 1):
+        if i == len(edges) - 2:
+            I = (x >= edges[i]) & (x <= edges[i+1])
+        else:
+            I = (x >= edges[i]) & (x < edges[i+1])
+        if not numpy.any(I):
+            continue
+        w = None if weights is None else weights[I]
+        res.append(numpy.average(y[I], axis=0, weights=w))
+    return numpy.moveaxis(numpy.array(res), 0, axis)
+
+
+class BinnerTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(7)
+        # A gap between 4 and 6 leaves empty bins in the middle
+        self.x = numpy.sort(numpy.concatenate((rng.uniform(0.5, 4, 60),
+                                               rng.uniform(6, 9.5, 40))))
+        self.y = rng.normal(size=(3, len(self.x), 2))
+        self.weights = rng.uniform(0.5, 2, len(self.x))
+
+    def test_edge_averager(self):
+        edges = [1, 2, 3, 4.5, 5, 5.5, 7, 8, 9]
+        for weights in (None, self.weights):
+            b = edge_bin_averager(edges, self.x, weights=weights)
+            self.assertEqual(b.bins, 6)
+            ref = mask_average(numpy.array(edges, dtype=float), self.x,
+                               self.y, axis=1, weights=weights)
+            numpy.testing.assert_allclose(b.bin(self.y, axis=1), ref)
+
+    def test_fixed_averager(self):
+        b = fixed_bin_averager(10.0, 21, self.x)
+        self.assertTrue(b.bins < 21)
+        ref = mask_average(b.x_edges, self.x, self.y, axis=1)
+        numpy.testing.assert_allclose(b.bin(self.y, axis=1), ref)
+        numpy.testing.assert_allclose(b.bin(self.y[0]),
+                                      mask_average(b.x_edges, self.x,
+                                                   self.y[0]))
+
+    def test_log_averager(self):
+        for weights in (None, self.weights):
+            b = log_bin_averager(0.3, 12.0, 15, self.x, weights=weights)
+            self.assertTrue(b.bins < 15)
+            edges = numpy.logspace(numpy.log10(0.3), numpy.log10(12.0), 16)
+            numpy.testing.assert_allclose(b.x_edges, edges)
+            ref = mask_average(b.x_edges, self.x, self.y, axis=1,
+                               weights=weights)
+            numpy.testing.assert_allclose(b.bin(self.y, axis=1), ref)
+            I = numpy.nonzero(numpy.histogram(self.x, edges)[0])[0]
+            numpy.testing.assert_allclose(
+                b.x, numpy.sqrt(edges[I] * edges[I+1]))
+
+    def test_label_averager(self):
+        labels = ['c', 'a', 'b', 'a', 'c', 'c', 'b', 'a']
+        x = numpy.arange(len(labels), dtype=float)
+        y = numpy.random.RandomState(3).normal(size=(2, len(labels)))
+        b = label_averager(labels, x)
+        self.assertEqual(b.labels, ['c', 'a', 'b'])
+        L = numpy.array(labels)
+        ref = numpy.array([y[:, L == l].mean(axis=1) for l in b.labels]).T
+        numpy.testing.assert_allclose(b.bin(y, axis=1), ref)
+        numpy.testing.assert_allclose(b.x, [x[L == l].mean()
+                                            for l in b.labels])
+        numpy.testing.assert_array_equal(b.bin_count, [3, 3, 2])
+
+    def test_segment_average(self):
+        y = numpy.arange(20, dtype=float).reshape(10, 2)
+        starts = numpy.array([2, 5, 6])
+        stops = numpy.array([5, 6, 9])
+        numpy.testing.assert_allclose(
+            _segment_average(y, 0, starts, stops),
+            [y[2:5].mean(axis=0), y[5:6].mean(axis=0), y[6:9].mean(axis=0)])
+        res = _segment_average(y, 0, starts[:0], stops[:0])
+        self.assertEqual(res.shape, (0, 2))
@@ -0,0 +1,84 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+import numpy
+from dsf.binner import edge_bin_averager
+from dsf.correlation import correlator, resolve_outputs, output_dependencies
+
+
+class single_bin_rec:
+    """Two k-points in one |k|-bin"""
+    def __init__(self):
+        self.q_distance = self.k_distance = numpy.array([1.0, 1.0])
+
+    def get_k_binner(self, k_bins, spacing='linear'):
+        return edge_bin_averager([0.5, 1.5], self.k_distance)
+
+
+class single_section_index:
+    def get_section_names(self):
+        return ['A']
+
+    def get_section_indices(self):
+        return [[0]]
+
+
+class CorrelatorTest(unittest.TestCase):
+
+    def setUp(self):
+        # The first k-point decays at once, the second not at all
+        numpy.random.seed(42)
+        phases = numpy.random.rand(210) * 2 * numpy.pi
+        self.frames = [{'rho_ks': [numpy.array([numpy.exp(1j * p), 1.0])]}
+                       for p in phases]
+
+    def get_F_k_t(self, **kwargs):
+        N_tc = 5
+        corr = correlator(single_bin_rec(), single_section_index(), numpy.eye(3),
+                          N_tc, 1.0, **kwargs)
+        for i in xrange(len(self.frames) - N_tc + 1):
+            corr.add_window(self.frames[i:i + N_tc])
+        output = dict((name, value) for value, name, _ in
+                      corr.get_output(outputs=['F_k_t']))
+        return corr, output['F_k_t_0_0']
+
+    def test_decay_threshold_does_not_bias_bins(self):
+        _, F_uncut = self.get_F_k_t()
+        corr, F_cut = self.get_F_k_t(decay_threshold=0.5)
+        self.assertEqual(list(corr.get_max_lags()), [1, 5])
+        self.assertAlmostEqual(F_cut[0, 0], F_uncut[0, 0])
+        self.assertTrue(numpy.allclose(F_cut, F_uncut, atol=0.1))
+
+
+
+class OutputsTest(unittest.TestCase):
+
+    def test_resolve_outputs(self):
+        self.assertEqual(resolve_outputs([]), set())
+        self.assertEqual(resolve_outputs(['S_k_w']), set(['S_k_w', 'F_k_t']))
+        self.assertEqual(resolve_outputs(['G_r_t', 'S_s_k_w', 'Ct_k_w']),
+                         set(['G_r_t', 'F_k_t', 'S_s_k_w', 'F_s_k_t',
+                              'Ct_k_w', 'Ct_k_t']))
+        self.assertEqual(resolve_outputs(['S_g_k', 'g_r']),
+                         set(['S_g_k', 'g_r']))
+        # The result is closed under dependencies
+        for name in output_dependencies:
+            res = resolve_outputs([name])
+            for dep in res:
+                self.assertTrue(set(output_dependencies[dep]) <= res)
+
+    def test_unknown_output(self):
+        self.assertRaises(ValueError, resolve_outputs, ['F_k_t', 'S_q_w'])
@@ -0,0 +1,124 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+import numpy
+import dsf.filon as filon
+from dsf.filon import fourier_cos, cos_integral, sin_integral, \
+    filon_integral, get_filon_integral, _fft_cos_integral, _fft_length, \
+    _alpha_beta_gamma
+
+
+def per_k_filon(sc, f, dx, k, x0=0.0):
+    """Filon integral of 1d f, evaluated one k at a time"""
+    x = x0 + dx * numpy.arange(len(f))
+    res = []
+    for kk in k:
+        alpha, beta, gamma = _alpha_beta_gamma(numpy.array([dx * kk]))
+        s = sc(kk * x)
+        even = numpy.sum(f[0::2] * s[0::2]) - 0.5 * (f[0] * s[0] + f[-1] * s[-1])
+        odd = numpy.sum(f[1::2] * s[1::2])
+        if sc is numpy.sin:
+            end = f[0] * numpy.cos(kk * x0) - f[-1] * numpy.cos(kk * x[-1])
+        else:
+            end = f[-1] * numpy.sin(kk * x[-1]) - f[0] * numpy.sin(kk * x0)
+        res.append(dx * (alpha[0] * end + beta[0] * even + gamma[0] * odd))
+    return numpy.array(res)
+
+
+class FilonTest(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.dx = 0.3
+
+    def assert_close(self, a, b):
+        scale = numpy.max(numpy.abs(b))
+        self.assertTrue(numpy.allclose(a, b, rtol=0.0, atol=1e-12 * scale))
+
+    def test_weights_match_per_k_integral(self):
+        k = numpy.linspace(0.0, 12.0, 17)
+        for Nx in (9, 11):
+            f = numpy.random.rand(Nx)
+            for sc in (numpy.sin, numpy.cos):
+                for x0 in (0.0, 0.7):
+                    self.assert_close(filon_integral(sc, self.dx, Nx, k, x0)(f),
+                                      per_k_filon(sc, f, self.dx, k, x0))
+        f = numpy.random.rand(9)
+        self.assert_close(sin_integral(f, self.dx, k, x0=0.7),
+                          per_k_filon(numpy.sin, f, self.dx, k, 0.7))
+
+    def test_weights_along_other_axes(self):
+        k = numpy.linspace(0.0, 5.0, 6)
+        f = numpy.random.rand(4, 9, 3)
+        res = cos_integral(f, self.dx, k, axis=1)
+        self.assertEqual(res.shape, (4, 6, 3))
+        self.assert_close(res[2, :, 1], per_k_filon(numpy.cos, f[2, :, 1], self.dx, k))
+
+    def test_integrals_are_cached(self):
+        k = numpy.linspace(0.0, 5.0, 6)
+        I = get_filon_integral(numpy.cos, self.dx, 9, k)
+        self.assertTrue(get_filon_integral(numpy.cos, self.dx, 9, k.copy()) is I)
+        self.assertFalse(get_filon_integral(numpy.sin, self.dx, 9, k) is I)
+        self.assertFalse(get_filon_integral(numpy.cos, self.dx, 11, k) is I)
+        for Nx in xrange(3, 3 + 2 * 2 * filon._MAX_INTEGRALS, 2):
+            get_filon_integral(numpy.cos, self.dx, Nx, k)
+        self.assertTrue(len(filon._integrals) <= filon._MAX_INTEGRALS)
+
+    def test_fft_matches_weights(self):
+        for Nx in (9, 11):
+            for L in (Nx - 1, 4 * (Nx - 1), 6):
+                k = 2 * numpy.pi / (L * self.dx) * numpy.arange(2 * L + 3)
+                self.assertEqual(_fft_length(k, self.dx), L)
+                f = numpy.random.rand(3, Nx, 2)
+                for axis in (1, -2):
+                    self.assert_close(_fft_cos_integral(f, self.dx, k, L, axis),
+                                      cos_integral(f, self.dx, k, axis=axis))
+
+    def test_fourier_cos_default_k(self):
+        f = numpy.random.rand(2, 11)
+        k, F = fourier_cos(f, self.dx, axis=1)
+        self.assertEqual(len(k), 11)
+        self.assert_close(F, 2 * cos_integral(f, self.dx, k, axis=1))
+
+    def test_padding_is_zero_padded_transform(self):
+        pad = 3
+        x = self.dx * numpy.arange(11)
+        f = numpy.exp(-x) * numpy.cos(2 * x)
+        f[-1] = 0.0  # (fully decayed, as padding assumes)
+        k, F = fourier_cos(f, self.dx, pad=pad)
+        f_padded = numpy.zeros(pad * (len(f) - 1) + 1)
+        f_padded[:len(f)] = f
+        k_padded, F_padded = fourier_cos(f_padded, self.dx)
+        self.assertTrue(numpy.allclose(k, k_padded))
+        self.assert_close(F, 2 * cos_integral(f_padded, self.dx, k_padded))
+        self.assert_close(F, F_padded)
+
+    def test_non_uniform_k_uses_weights(self):
+        f = numpy.random.rand(9)
+        ks = [numpy.array([0.0, 1.0, 2.5, 3.0]),   # not linearly spaced
+              numpy.linspace(0.5, 5.0, 10),        # not from 0
+              numpy.linspace(0.0, 5.0, 10)]        # no even fft length
+        fft_cos_integral = filon._fft_cos_integral
+        def no_fft(*args):
+            raise AssertionError('fft path used')
+        filon._fft_cos_integral = no_fft
+        try:
+            for k in ks:
+                self.assertTrue(_fft_length(k, self.dx) is None)
+                _, F = fourier_cos(f, self.dx, k=k)
+                self.assert_close(F, 2 * per_k_filon(numpy.cos, f, self.dx, k))
+        finally:
+            filon._fft_cos_integral = fft_cos_integral
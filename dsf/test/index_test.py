@@ -0,0 +1,110 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+from dsf.index import section_index
+from dsf.reciprocal import calc_rho_k
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
+
+
+class SectionIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.N = 20
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def index(self, text):
+        filename = os.path.join(self.dir, 'index.ndx')
+        with open(filename, 'w') as f:
+            f.write(text)
+        return section_index(filename, self.N)
+
+    def test_overlapping_sections(self):
+        # C is within A, A and B overlap, atom 20 is in no section
+        index = self.index('[ A ]\n1 2 3 4 5 6\n7 8 9 10 11 12\n'
+                           '[ B ]\n8 9 10 11 12 13 14 15 16 17 18 19\n'
+                           '[ C ]\n5 3 8\n')
+        self.assertEqual(index.get_section_names(), ['A', 'B', 'C'])
+        sections = [set(I) for I in index.get_section_indices()]
+        # Classes are disjoint, each atom of a class being a member of
+        # the same sections, and each section is the union of its classes
+        members = numpy.concatenate(index.classes)
+        self.assertEqual(len(members), len(set(members)))
+        for I in index.classes:
+            self.assertEqual(len(set(tuple(i in S for S in sections)
+                                     for i in I)), 1)
+        for S, C in zip(sections, index.get_section_classes()):
+            self.assertEqual(S, set(numpy.concatenate(
+                        [index.classes[c] for c in C])))
+        self.assertEqual(index.N_classes(), 5)
+
+        # The atom order makes each class contiguous, unassigned atoms last
+        order = index.get_atom_order()
+        self.assertEqual(sorted(order), range(self.N))
+        numpy.testing.assert_array_equal(order[:len(members)], members)
+        self.assertEqual(order[-1], 19)
+
+    def test_combine_classes(self):
+        index = self.index('[ A ]\n1 2 3 4 5 6 7 8 9 10 11 12\n'
+                           '[ B ]\n8 9 10 11 12 13 14 15 16 17 18 19\n'
+                           '[ C ]\n3 5 8\n[ D ]\n20\n')
+        rng = numpy.random.RandomState(5)
+        x = 2.0 * rng.rand(3, self.N)
+        k = 5.0 * rng.randn(3, 30)
+        frame = trajectory_frame(index=1, N=self.N, x=x)
+        index.get_section_split_function()(frame)
+        rho_ks = [calc_rho_k(xs, k) for xs in frame['xs']]
+        combined = index.combine_classes(rho_ks, frame)
+        for (_, I), rho_k in zip(index.sections, combined):
+            numpy.testing.assert_allclose(rho_k, calc_rho_k(x[:, I], k),
+                                          rtol=1e-10, atol=1e-12)
+
+    def test_reordered_split(self):
+        index = self.index('[ A ]\n1 3 5 7 9 11 13\n[ B ]\n7 8 9 10\n')
+        x = numpy.random.RandomState(6).rand(3, self.N)
+        order = index.get_atom_order()
+        f1 = trajectory_frame(index=1, N=self.N, x=x)
+        f2 = trajectory_frame(index=1, N=self.N, x=x[:, order])
+        index.get_section_split_function(velocities=False)(f1)
+        index.get_section_split_function(reordered=True)(f2)
+        self.assertEqual(len(f1['xs']), index.N_classes())
+        for a, b in zip(f1['xs'], f2['xs']):
+            numpy.testing.assert_array_equal(a, b)
+
+    def test_disjoint_sections(self):
+        index = self.index('[ B ]\n11 12 13\n[ A ]\n1 2 3 4\n')
+        self.assertEqual([list(I) for I in index.classes],
+                         [[10, 11, 12], [0, 1, 2, 3]])
+        self.assertEqual(index.get_section_classes(), [[0], [1]])
+        values = [numpy.ones(3), 2 * numpy.ones(3)]
+        combined = index.combine_classes(values)
+        self.assertTrue(combined[0] is values[0])
+        self.assertTrue(combined[1] is values[1])
+
+    def test_no_index_file(self):
+        index = section_index(None, self.N)
+        self.assertEqual(index.get_section_names(), ['all'])
+        numpy.testing.assert_array_equal(index.get_atom_order(),
+                                         numpy.arange(self.N))
+
+    def test_invalid_index(self):
+        self.assertRaises(ValueError, self.index, '[ A ]\n1 2 21\n')
@@ -0,0 +1,82 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+import numpy
+from itertools import imap
+from dsf.insitu import insitu_dsf
+from dsf.index import section_index
+from dsf.reciprocal import reciprocal_isotropic
+from dsf.correlation import correlator
+from dsf.trajectory import iwindow
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
+
+
+class InsituTest(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.N = 20
+        self.box = 2.0 * numpy.eye(3)
+        x0 = 2.0 * numpy.random.rand(self.N, 3)
+        self.xs = [x0 + 0.01 * i * numpy.random.randn(self.N, 3)
+                   for i in xrange(14)]
+        self.vs = [numpy.random.randn(self.N, 3) for x in self.xs]
+        # Few enough k-points for the k-space grid to be pruned
+        self.options = dict(nt=5, stride=2, delta_t=1.0, k_max=60.0,
+                            max_k_points=1500, k_bins=20)
+
+    def run_insitu(self, seed):
+        dsf = insitu_dsf(self.box, self.N, calculate_current=True,
+                         calculate_self=True, seed=seed, **self.options)
+        for x, v in zip(self.xs, self.vs):
+            dsf.add_frame(x, v)
+        dsf.finish()
+        return dsf
+
+    def run_windows(self, seed):
+        opt = self.options
+        N_tc = opt['nt']
+        index = section_index(None, self.N)
+        rec = reciprocal_isotropic(self.box, max_points=opt['max_k_points'],
+                                   max_k=opt['k_max'], seed=seed)
+        corr = correlator(rec, index, self.box, N_tc, opt['delta_t'],
+                          calculate_current=True, calculate_self=True)
+        f1 = index.get_section_split_function()
+        f2 = rec.get_frame_process_function()
+        f3 = index.get_section_combine_function()
+        frames = [trajectory_frame(index=i + 1, N=self.N, box=self.box,
+                                   x=x.T.copy(), v=v.T.copy())
+                  for i, (x, v) in enumerate(zip(self.xs, self.vs))]
+        for window in iwindow(imap(lambda f: f3(f2(f1(f))), frames),
+                              width=N_tc, stride=opt['stride']):
+            corr.add_window(window)
+        return corr.get_output(k_bins=opt['k_bins'])
+
+    def assert_outputs_equal(self, output, reference):
+        self.assertEqual([name for _, name, _ in output],
+                         [name for _, name, _ in reference])
+        for (a, name, _), (b, _, _) in zip(output, reference):
+            self.assertTrue(numpy.allclose(a, b, rtol=1e-10, atol=1e-12), name)
+
+    def test_same_as_correlating_windows(self):
+        dsf = self.run_insitu(seed=3)
+        self.assertTrue(len(dsf.rec.k_distance) < 2000)
+        self.assert_outputs_equal(dsf.get_output(), self.run_windows(seed=3))
+
+    def test_seed_selects_same_k_points(self):
+        a = self.run_insitu(seed=3).rec
+        b = self.run_insitu(seed=3).rec
+        self.assertTrue(numpy.array_equal(a.k_points, b.k_points))
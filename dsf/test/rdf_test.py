@@ -0,0 +1,94 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+import numpy
+from itertools import product
+from dsf.index import section_index
+from dsf.rdf import pair_histogram, radial_distribution, get_max_r
+
+
+def brute_force_histogram(x, box, atom_class, N_classes, r_max, r_bins):
+    """pair_histogram, by checking all images of all pairs"""
+    h = numpy.asarray(box, dtype=numpy.float64).T
+    images = numpy.dot(h, numpy.array(list(product([-1, 0, 1], repeat=3))).T)
+    counts = numpy.zeros((N_classes, N_classes, r_bins), dtype=int)
+    N = x.shape[1]
+    for i in xrange(N):
+        for j in xrange(N):
+            if i == j:
+                continue
+            ds = numpy.linalg.solve(h, x[:, j] - x[:, i])
+            d = numpy.dot(h, ds - numpy.rint(ds)).reshape(3, 1) + images
+            for r in numpy.sqrt(numpy.sum(d ** 2, axis=0)):
+                if r < r_max:
+                    counts[atom_class[i], atom_class[j], int(r * r_bins / r_max)] += 1
+    return counts
+
+
+class PairHistogramTest(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.N = 60
+        self.atom_class = numpy.sort(numpy.random.randint(0, 2, self.N))
+
+    def random_positions(self, box):
+        # Also outside of the box, which must be wrapped
+        s = 1.5 * numpy.random.rand(3, self.N) - 0.25
+        return numpy.dot(numpy.asarray(box).T, s)
+
+    def check_box(self, box, r_max, threads=1):
+        x = self.random_positions(box)
+        counts = pair_histogram(x, box, self.atom_class, 2, r_max, 7, threads=threads)
+        expected = brute_force_histogram(x, box, self.atom_class, 2, r_max, 7)
+        self.assertTrue(expected.sum() > 0)
+        self.assertTrue(numpy.array_equal(counts, expected))
+
+    def test_orthorhombic_box(self):
+        self.check_box(numpy.diag([2.0, 2.5, 3.0]), 0.6)
+
+    def test_triclinic_box(self):
+        box = numpy.array([[2.0, 0.0, 0.0],
+                           [0.6, 2.2, 0.0],
+                           [-0.4, 0.5, 2.4]])
+        self.check_box(box, 0.6)
+
+    def test_few_cells(self):
+        # 2 and 3 cells wide, so that neighbour cells wrap onto each other
+        self.check_box(numpy.diag([2.0, 2.0, 3.1]), 1.0)
+        self.check_box(numpy.diag([2.0, 2.0, 2.0]), 0.99)
+
+    def test_threads(self):
+        self.check_box(numpy.diag([2.0, 2.5, 3.0]), 0.6, threads=3)
+
+    def test_r_max_too_large(self):
+        box = numpy.diag([2.0, 3.0, 3.0])
+        self.assertAlmostEqual(get_max_r(box), 1.0)
+        self.assertRaises(ValueError, pair_histogram, self.random_positions(box),
+                          box, self.atom_class, 2, 1.01, 7)
+
+
+class RadialDistributionTest(unittest.TestCase):
+
+    def test_uniform_points(self):
+        numpy.random.seed(42)
+        N = 500
+        box = 3.0 * numpy.eye(3)
+        rdf = radial_distribution(section_index(None, N), 1.2, r_bins=6)
+        for i in xrange(5):
+            rdf.add_frame({'xs': [3.0 * numpy.random.rand(3, N)], 'box': box})
+        output = dict((name, value) for value, name, _ in rdf.get_output())
+        self.assertTrue(numpy.allclose(output['g_r_0_0'], 1.0, atol=0.1))
@@ -0,0 +1,177 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import unittest
+import tempfile
+import numpy
+from dsf.reciprocal import iter_k_points, reciprocal_isotropic, reciprocal_explicit, \
+    reciprocal_stratified, reciprocal_shells, reciprocal_rotating
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
+
+
+def brute_force_k_points(box, max_k):
+    """All k-points n1*b1 + n2*b2 + n3*b3 (n >= 0) with |k| <= max_k, at once"""
+    B = numpy.linalg.inv(numpy.asarray(box, dtype=numpy.float64).T)
+    max_q = max_k / (2 * numpy.pi)
+    N = [int(numpy.ceil(max_q / numpy.linalg.norm(b))) for b in B]
+    n = numpy.indices(N).reshape((3, -1))
+    k = 2 * numpy.pi * numpy.dot(B.T, n)
+    return k[:, numpy.sqrt(numpy.sum(k ** 2, axis=0)) <= max_k]
+
+
+def sorted_columns(k):
+    return k[:, numpy.lexsort(numpy.round(k, 8))]
+
+
+class ReciprocalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.box = numpy.array([[2.0, 0.0, 0.0],
+                                [0.3, 2.5, 0.0],
+                                [0.2, -0.4, 3.0]])
+        self.B = numpy.linalg.inv(self.box.T)
+
+    def test_iter_k_points_all_points(self):
+        max_k = 15.0
+        slabs = list(iter_k_points(self.B, max_k / (2 * numpy.pi)))
+        self.assertTrue(len(slabs) > 1)
+        k = numpy.concatenate([k for k, _ in slabs], axis=1)
+        q = numpy.concatenate([q for _, q in slabs])
+        self.assertTrue(numpy.allclose(2 * numpy.pi * q,
+                                       numpy.sqrt(numpy.sum(k ** 2, axis=0))))
+        expected = brute_force_k_points(self.box, max_k)
+        self.assertEqual(k.shape, expected.shape)
+        self.assertTrue(numpy.allclose(sorted_columns(k), sorted_columns(expected)))
+
+    def test_isotropic_without_pruning(self):
+        rec = reciprocal_isotropic(self.box, max_points=100000, max_k=15.0)
+        self.assertTrue(rec.q_prune is None)
+        self.assertTrue(numpy.all(numpy.diff(rec.k_distance) >= 0))
+        self.assertTrue(numpy.allclose(sorted_columns(rec.k_points),
+                                       sorted_columns(brute_force_k_points(self.box, 15.0))))
+
+    def test_seed_and_cache(self):
+        kwargs = dict(max_points=1500, max_k=40.0)
+        a = reciprocal_isotropic(self.box, seed=3, **kwargs)
+        self.assertTrue(a.q_prune is not None)
+        b = reciprocal_isotropic(self.box, seed=3, **kwargs)
+        self.assertTrue(numpy.array_equal(a.k_points, b.k_points))
+        c = reciprocal_isotropic(self.box, seed=4, **kwargs)
+        self.assertFalse(numpy.array_equal(a.k_points, c.k_points))
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            d = reciprocal_isotropic(self.box, seed=3, cache_dir=cache_dir, **kwargs)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached = reciprocal_isotropic(self.box, seed=3, cache_dir=cache_dir, **kwargs)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            for r in (d, cached):
+                self.assertTrue(numpy.array_equal(r.k_points, a.k_points))
+                self.assertTrue(numpy.allclose(r.k_distance, a.k_distance))
+            # The cached set is read, not generated again
+            fn = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+            numpy.save(fn, a.k_points[:, :10])
+            self.assertEqual(reciprocal_isotropic(self.box, seed=3, cache_dir=cache_dir,
+                                                  **kwargs).k_points.shape, (3, 10))
+            # Sets from random seeds are not cached
+            reciprocal_isotropic(self.box, cache_dir=cache_dir, **kwargs)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_explicit_lattice_points(self):
+        n = numpy.array([[0, 2, 1], [1, 0, 0], [0, 0, 1], [3, -1, 2]]).T
+        k = 2 * numpy.pi * numpy.dot(self.B.T, n)
+        rec = reciprocal_explicit(self.box, k, labels=['a', 'b', 'c', 'd'])
+        self.assertTrue(numpy.all(numpy.diff(rec.k_distance) >= 0))
+        order = numpy.argsort(numpy.sqrt(numpy.sum(k ** 2, axis=0)), kind='mergesort')
+        self.assertEqual(rec.k_labels, [['a', 'b', 'c', 'd'][i] for i in order])
+        self.assertTrue(numpy.allclose(rec.k_points, k[:, order]))
+
+    def test_explicit_rejects_off_lattice_points(self):
+        n = numpy.array([[0, 2, 1], [1, 0.5, 0]]).T
+        k = 2 * numpy.pi * numpy.dot(self.B.T, n)
+        self.assertRaises(ValueError, reciprocal_explicit, self.box, k)
+
+    def test_stratified_points_per_bin(self):
+        rec = reciprocal_stratified(self.box, k_bins=10, points_per_bin=40,
+                                    max_k=30.0, seed=2)
+        grid = brute_force_k_points(self.box, 30.0)
+        in_grid = numpy.bincount(
+            rec.bin_index(numpy.sqrt(numpy.sum(grid ** 2, axis=0)) / (2 * numpy.pi)),
+            minlength=10)
+        counts = numpy.bincount(rec.bin_index(rec.q_distance), minlength=10)
+        self.assertTrue(in_grid[-1] > 40 and in_grid[0] < 40)
+        self.assertTrue(numpy.array_equal(counts, numpy.minimum(in_grid, 40)))
+        self.assertTrue(numpy.all(numpy.diff(rec.k_distance) >= 0))
+        # The bins are those of the binner used for averaging
+        binner = rec.get_k_binner(10)
+        self.assertTrue(numpy.array_equal(binner.bin_count[binner.bin_count > 0],
+                                          counts[counts > 0]))
+
+    def test_stratified_bin_weights(self):
+        weights = numpy.ones(10)
+        weights[-3:] = 2.0
+        rec = reciprocal_stratified(self.box, k_bins=10, points_per_bin=20,
+                                    max_k=30.0, seed=2, bin_weights=weights)
+        counts = numpy.bincount(rec.bin_index(rec.q_distance), minlength=10)
+        # 200 points in total, 200/13 per unit weight
+        self.assertEqual(counts[-4], 15)
+        self.assertTrue(numpy.all(counts[-3:] == 31))
+
+    def test_shells(self):
+        rec = reciprocal_shells(self.box, [(20.0, 0.5), (10.0, None)],
+                                max_points=50, seed=1)
+        dk = 2 * numpy.pi * min(numpy.linalg.norm(b) for b in self.B)
+        grid = numpy.sqrt(numpy.sum(brute_force_k_points(self.box, 21.0) ** 2, axis=0))
+        for k, tolerance in ((10.0, 0.5 * dk), (20.0, 0.5)):
+            I = numpy.array([label == '%g' % k for label in rec.k_labels])
+            self.assertTrue(numpy.all(numpy.abs(rec.k_distance[I] - k) <= tolerance))
+            self.assertEqual(I.sum(), min(50, numpy.sum(numpy.abs(grid - k) <= tolerance)))
+        self.assertEqual(rec.k_points.shape[1], len(rec.k_labels))
+        self.assertEqual(rec.get_k_binner(10).labels, ['10', '20'])
+
+    def test_overlapping_shells(self):
+        self.assertRaises(ValueError, reciprocal_shells, self.box,
+                          [(10.0, 1.0), (11.5, 1.0)])
+
+    def test_rotating_subsets_partition_k_points(self):
+        rec = reciprocal_rotating(self.box, max_points=1200, max_k=40.0, subsets=4,
+                                  width=3, stride=2, seed=5)
+        N = len(rec.k_distance)
+        indices = numpy.concatenate(rec.subsets)
+        self.assertTrue(numpy.array_equal(numpy.sort(indices), numpy.arange(N)))
+        sizes = [len(I) for I in rec.subsets]
+        self.assertTrue(max(sizes) - min(sizes) <= 1)
+        self.assertTrue(rec.get_window_k_indices(5) is rec.subsets[1])
+
+    def test_rotating_frames_processed_for_their_windows(self):
+        rec = reciprocal_rotating(self.box, max_points=1200, max_k=40.0, subsets=4,
+                                  width=3, stride=2, seed=5)
+        process = rec.get_frame_process_function()
+        full = reciprocal_isotropic.get_frame_process_function(rec)
+        numpy.random.seed(1)
+        for n in xrange(6):
+            x = numpy.random.rand(3, 10)
+            rho_k = process(trajectory_frame(xs=[x]))['rho_ks'][0]
+            expected = full(trajectory_frame(xs=[x]))['rho_ks'][0]
+            # Frame n is part of windows (n - 1) // 2 and n // 2
+            I = numpy.union1d(rec.get_window_k_indices(max(0, (n - 1) // 2)),
+                              rec.get_window_k_indices(n // 2))
+            self.assertTrue(numpy.allclose(rho_k[I], expected[I]))
+            unused = numpy.setdiff1d(numpy.arange(len(rho_k)), I)
+            self.assertTrue(numpy.all(rho_k[unused] == 0))
@@ -0,0 +1,112 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import unittest
+import tempfile
+import numpy
+from dsf.index import section_index
+from dsf.reciprocal import reciprocal_isotropic
+from dsf.correlation import correlator
+from dsf.trajectory import iwindow
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
+from dsf.rho_store import rho_store_key, rho_store_writer, rho_store_reader, \
+    open_rho_store
+
+
+class RhoStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(42)
+        self.dir = tempfile.mkdtemp()
+        self.N = 20
+        self.box = 2.0 * numpy.eye(3)
+        index_file = os.path.join(self.dir, 'index.ndx')
+        with open(index_file, 'w') as fh:
+            fh.write('[ A ]\n1 2 3 4 5 6 7 8 9 10 11 12\n[ B ]\n8 9 10 11 12 13 14 15 16 17 18 19 20\n')
+        self.index = section_index(index_file, self.N)
+        self.rec = reciprocal_isotropic(self.box, max_points=1500, max_k=20.0, seed=1)
+        self.f1 = self.index.get_section_split_function()
+        self.f2 = self.rec.get_frame_process_function()
+        self.f3 = self.index.get_section_combine_function()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def frames(self):
+        x = 2.0 * numpy.random.rand(3, self.N)
+        for i in xrange(8):
+            x = x + 0.02 * numpy.random.randn(3, self.N)
+            yield trajectory_frame(index=i + 1, N=self.N, box=self.box, time=0.5 * i,
+                                   x=x.copy(), v=numpy.random.randn(3, self.N))
+
+    def correlate(self, frames, element_processor):
+        corr = correlator(self.rec, self.index, self.box, 3, 0.5,
+                          calculate_current=True, calculate_self=True)
+        for window in iwindow(frames, width=3, element_processor=element_processor):
+            corr.add_window(window)
+        return corr.get_output(k_bins=10)
+
+    def write_store(self, path, positions=True):
+        writer = rho_store_writer(path, positions=positions)
+        for frame in self.frames():
+            writer.add(self.f2(self.f1(frame)))
+        writer.close()
+
+    def test_stored_densities_give_same_correlations(self):
+        path = os.path.join(self.dir, 'store')
+        self.write_store(path)
+        numpy.random.seed(42)
+        expected = self.correlate(self.frames(), lambda f: self.f3(self.f2(self.f1(f))))
+
+        reader = rho_store_reader(path)
+        self.assertEqual(len(reader), 8)
+        self.assertTrue(reader.has_currents() and reader.has_positions())
+        self.assertEqual(reader[3]['time'], 1.5)
+        output = self.correlate(reader, lambda f: self.f3(self.f1(f)))
+        self.assertEqual([name for _, name, _ in output],
+                         [name for _, name, _ in expected])
+        for (a, name, _), (b, _, _) in zip(output, expected):
+            self.assertTrue(numpy.allclose(a, b, rtol=1e-4, atol=1e-5), name)
+
+    def test_store_lacking_data_is_rejected(self):
+        path = os.path.join(self.dir, 'store')
+        self.assertTrue(open_rho_store(path) is None)
+        writer = rho_store_writer(path)
+        for frame in self.frames():
+            frame.v = None
+            writer.add(self.f2(self.f1(frame)))
+        writer.close()
+        self.assertTrue(open_rho_store(path) is not None)
+        self.assertTrue(open_rho_store(path, currents=True) is None)
+        self.assertTrue(open_rho_store(path, positions=True) is None)
+
+    def test_incomplete_store_is_not_used(self):
+        path = os.path.join(self.dir, 'store')
+        writer = rho_store_writer(path)
+        for frame in self.frames():
+            writer.add(self.f2(self.f1(frame)))
+        writer.abort()
+        self.assertTrue(open_rho_store(path) is None)
+        self.assertFalse(os.path.exists(path))
+
+    def test_key(self):
+        trajectory = os.path.join(self.dir, 'index.ndx')
+        key = rho_store_key(trajectory, None, self.rec.k_points)
+        self.assertEqual(key, rho_store_key(trajectory, None, self.rec.k_points.copy()))
+        self.assertNotEqual(key, rho_store_key(trajectory, None, self.rec.k_points, step=2))
+        self.assertNotEqual(key, rho_store_key(trajectory, None, 2 * self.rec.k_points))
+        self.assertNotEqual(key, rho_store_key(trajectory, trajectory, self.rec.k_points))
@@ -0,0 +1,144 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import numpy
+from functools import partial
+from dsf.trajectory import expand_filenames, ichain, iprefetch, \
+    open_trajectory
+from dsf.trajectory_reader.dsfcache_trajectory_reader import CACHE_SUFFIX
+
+data_dir = os.path.join(os.path.dirname(__file__), '..',
+                        'trajectory_reader', 'test', 'data')
+# positions.lammpstrj holds 4 frames of 33 lines each
+frame_lines = 33
+
+
+class TrajectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(data_dir, 'positions.lammpstrj')) as f:
+            self.lines = f.readlines()
+        self.opener = partial(open_trajectory, use_cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_frames(self, name, start, stop):
+        filename = os.path.join(self.dir, name)
+        with open(filename, 'w') as f:
+            f.writelines(self.lines[start*frame_lines:stop*frame_lines])
+        return filename
+
+    def read_all(self, filename):
+        return [(f['time'], f['x'].copy()) for f in self.opener(filename)]
+
+    def test_expand_filenames(self):
+        for name in ['dump.10.lammpstrj', 'dump.9.lammpstrj',
+                     'dump.2.lammpstrj', 'dump.10.lammpstrj' + CACHE_SUFFIX,
+                     'dump.1.lammpstrj' + CACHE_SUFFIX]:
+            open(os.path.join(self.dir, name), 'w').close()
+        names = expand_filenames(os.path.join(self.dir, 'dump.*'))
+        # The cache of a matching file is left out, a lone cache is not
+        self.assertEqual([os.path.basename(n) for n in names],
+                         ['dump.1.lammpstrj' + CACHE_SUFFIX,
+                          'dump.2.lammpstrj', 'dump.9.lammpstrj',
+                          'dump.10.lammpstrj'])
+        a = os.path.join(self.dir, 'dump.9.lammpstrj')
+        self.assertEqual(expand_filenames(a), [a])
+        self.assertEqual(expand_filenames([a, a]), [a, a])
+        self.assertRaises(IOError, expand_filenames,
+                          os.path.join(self.dir, 'missing.*'))
+
+    def test_ichain(self):
+        ref = self.read_all(os.path.join(data_dir, 'positions.lammpstrj'))
+        # The third frame ends the first file and starts the second
+        a = self.write_frames('a.lammpstrj', 0, 3)
+        b = self.write_frames('b.lammpstrj', 2, 4)
+        frames = list(ichain([a, b], self.opener))
+        self.assertEqual([f['index'] for f in frames], [1, 2, 3, 4])
+        for f, (t, x) in zip(frames, ref):
+            self.assertEqual(f['time'], t)
+            numpy.testing.assert_array_equal(f['x'], x)
+
+        # Without overlap all frames are kept
+        c = self.write_frames('c.lammpstrj', 0, 2)
+        d = self.write_frames('d.lammpstrj', 2, 4)
+        frames = list(ichain([c, d], self.opener))
+        self.assertEqual([f['index'] for f in frames], [1, 2, 3, 4])
+        self.assertEqual([f['time'] for f in frames], [t for t, x in ref])
+
+    def test_ichain_open_ahead(self):
+        a = self.write_frames('a.lammpstrj', 0, 2)
+        b = self.write_frames('b.lammpstrj', 2, 4)
+        opened = threading.Event()
+        threads = []
+        def opener(filename):
+            threads.append(threading.current_thread())
+            if filename == b:
+                opened.set()
+            return self.opener(filename)
+        it = ichain([a, b], opener)
+        it.next()
+        # b is opened in the background while a is read
+        opened.wait(10)
+        self.assertTrue(opened.is_set())
+        self.assertEqual(len(list(it)), 3)
+        self.assertEqual(len(threads), 2)
+        self.assertFalse(any(t is threading.current_thread() for t in threads))
+
+    def test_ichain_open_error(self):
+        a = self.write_frames('a.lammpstrj', 0, 2)
+        missing = os.path.join(self.dir, 'missing.lammpstrj')
+        it = ichain([a, missing], self.opener)
+        self.assertEqual([f['index'] for f in [it.next(), it.next()]], [1, 2])
+        self.assertRaises(IOError, it.next)
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def test_order(self):
+        for size in (1, 3, 100):
+            self.assertEqual(list(iprefetch(iter(xrange(50)), size)),
+                             range(50))
+
+    def test_exception(self):
+        def items():
+            yield 1
+            yield 2
+            raise KeyError('in reader thread')
+        it = iprefetch(items(), 4)
+        self.assertEqual([it.next(), it.next()], [1, 2])
+        self.assertRaises(KeyError, it.next)
+        self.assertRaises(StopIteration, it.next)
+
+    def test_close(self):
+        read = []
+        def items():
+            for i in xrange(1000):
+                read.append(i)
+                yield i
+        it = iprefetch(items(), 2)
+        self.assertEqual(it.next(), 0)
+        it.close()
+        self.assertFalse(it._thread.is_alive())
+        # The reader thread stopped, at most a full queue ahead
+        self.assertTrue(len(read) <= 4)
+        self.assertRaises(StopIteration, it.next)
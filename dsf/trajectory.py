@@ -16,28 +16,148 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
-__all__ = ['get_itraj', 'iwindow']
+__all__ = ['get_itraj', 'iwindow', 'iprefetch', 'ichain',
+           'expand_filenames', 'open_trajectory', 'is_stream']
 
+import os
+import re
 import sys
+import stat
 import logging
-from itertools import islice, imap
+import threading
+from glob import glob
+from Queue import Queue, Full
+from itertools import islice, imap, count
+from functools import partial
 from os.path import isfile
 from collections import deque
 
-from trajectory_readers import trajectory_readers
+from dsf.trajectory_reader.trr_trajectory_reader import trr_trajectory_reader
+from dsf.trajectory_reader.dcd_trajectory_reader import dcd_trajectory_reader
+from dsf.trajectory_reader.lammpsbin_trajectory_reader import lammpsbin_trajectory_reader
+from dsf.trajectory_reader.netcdf_trajectory_reader import netcdf_trajectory_reader
+from dsf.trajectory_reader.molfile_trajectory_reader import molfile_trajectory_reader
+from dsf.trajectory_reader.xtc_trajectory_reader import xtc_trajectory_reader
+from dsf.trajectory_reader.lammpstrj_trajectory_reader import lammpstrj_trajectory_reader
+from dsf.trajectory_reader.dsfcache_trajectory_reader import dsfcache_trajectory_reader, \
+    find_cache, CACHE_SUFFIX
+
+# Readers are tried in order. Readers that can positively identify
+# a file format (e.g. by a magic number) should go first.
+trajectory_readers = (trr_trajectory_reader,
+                      dcd_trajectory_reader,
+                      lammpsbin_trajectory_reader,
+                      netcdf_trajectory_reader,
+                      molfile_trajectory_reader,
+                      xtc_trajectory_reader,
+                      lammpstrj_trajectory_reader)
 
 logger = logging.getLogger('dynsf')
 
+def is_stream(filename):
+    """True if filename is standard input ("-") or a named pipe"""
+    return filename == '-' or (os.path.exists(filename) and
+                               stat.S_ISFIFO(os.stat(filename).st_mode))
+
+
+def expand_filenames(filenames):
+    """Return list of trajectory files
+
+    filenames is a filename or glob pattern, or a list of those.
+    Files matching a pattern are sorted "naturally", i.e. with
+    numbers in increasing order (dump.9.lammpstrj before
+    dump.10.lammpstrj). Caches of matching files (which are read
+    in place of the files anyway) are left out.
+    """
+    if isinstance(filenames, basestring):
+        filenames = [filenames]
+    def natural_key(name):
+        return [int(s) if s.isdigit() else s for s in re.split(r'(\d+)', name)]
+    res = []
+    for name in filenames:
+        if isfile(name) or is_stream(name):
+            res.append(name)
+            continue
+        matches = sorted(glob(name), key=natural_key)
+        if not matches:
+            raise IOError('File "%s" does not exist' % name)
+        matches = [m for m in matches if not (m.endswith(CACHE_SUFFIX) and
+                                              m[:-len(CACHE_SUFFIX)] in matches)]
+        res += matches
+    return res
+
+
+def open_trajectory(filename, readers=trajectory_readers, atom_order=None,
+                    workers=1, follow=0, use_cache=True):
+    """Return a trajectory reader for filename
+
+    Simply pick the first reader that seems to work. A stream can not
+    be rewound, so it is handed to the first reader supporting streams.
+    If use_cache is True, an up to date cache of the file (written by
+    dynsf-convert) is read instead, if there is one.
+    """
+    stream = is_stream(filename)
+    if not stream and use_cache:
+        cache = find_cache(filename)
+        if cache is not None:
+            logger.debug('Reading trajectory cache %s' % cache)
+            return dsfcache_trajectory_reader(cache, atom_order=atom_order)
+    if not stream and not isfile(filename):
+        raise IOError('File "%s" does not exist' % filename)
+
+    for reader in readers:
+        if stream and not reader.stream_input:
+            continue
+        if reader.reader_available():
+            reader_name = reader.__name__
+            if stream:
+                return reader(filename, atom_order=atom_order, follow=follow)
+            try:
+                logger.debug('Trying trajectory_reader %s' % reader_name)
+                kwargs = dict(atom_order=atom_order)
+                if workers > 1 and reader.parallel_decoding:
+                    kwargs['workers'] = workers
+                if follow and reader.stream_input:
+                    kwargs['follow'] = follow
+                return reader(filename, **kwargs)
+            except Exception as _:
+                logger.debug('Trying trajectory_reader %s failed to open file %s' % (
+                        reader_name, filename))
+
+    raise IOError("Failed to open trajectory file %s" % filename)
+
+
 def get_itraj(filename, step=1, max_frames=0,
-              readers=trajectory_readers):
+              readers=trajectory_readers, atom_order=None, prefetch=0,
+              workers=1, follow=0, use_cache=True):
     """Return a dynsf-style trajectory iterator
 
     Simple wrapper for the trajectory_reader-classes.
 
+    filename: a trajectory file, a glob pattern, or a list of
+    those. Several files are read as one trajectory, see ichain.
+    Standard input ("-") and named pipes can be read by some readers.
+
     step: (1 by default = every single frame), must be > 0.
 
     max_frames: (0 by default = no limit), must be >= 0.
 
+    atom_order: (None by default = as in file), permutation of the
+    atoms, see e.g. section_index.get_atom_order.
+
+    prefetch: (0 by default = no read ahead), if > 0 frames are read
+    in a background thread, keeping up to prefetch frames ready.
+
+    workers: (1 by default), number of processes used for decoding
+    frames, by readers supporting it (parallel_decoding).
+
+    follow: (0 by default = stop at end of file), seconds to wait for
+    more frames to be appended to the trajectory, by readers
+    supporting it (stream_input).
+
+    use_cache: (True by default), read trajectory caches written by
+    dynsf-convert instead of the trajectory files, when up to date.
+
     Each iterator step consists of a dictionary.
     {
      'index' : trajectory frame index (1, 2, 3, ...),
@@ -48,6 +168,7 @@ def get_itraj(filename, step=1, max_frames=0,
      'time'  : (*) simulation time (ps),
     }
     (*) may not be available, depends on reader and trajectory file format.
+    Frames are trajectory_frame objects, which can be used as dicts.
     """
 
     assert step > 0
@@ -57,22 +178,116 @@ def get_itraj(filename, step=1, max_frames=0,
     elif step > 1:
         max_frames = max_frames * step
 
-    if not isfile(filename):
-        raise IOError('File "%s" does not exist' % filename)
+    filenames = expand_filenames(filename)
+    opener = partial(open_trajectory, readers=readers,
+                     atom_order=atom_order, workers=workers, follow=follow,
+                     use_cache=use_cache)
 
-    for reader in readers:
-        # Simply pick the first reader that seems to work
-        if reader.reader_available():
-            reader_name = reader.__name__
+    if len(filenames) > 1:
+        itraj = islice(ichain(filenames, opener), 0, max_frames, step)
+    else:
+        i = opener(filenames[0])
+        if hasattr(i, 'get_block') and hasattr(i, '__len__'):
+            # Block readers read (every step:th frame of) a whole block at once
+            itraj = _iblocks(i, min(len(i), max_frames), step)
+        elif hasattr(i, '__getitem__') and hasattr(i, '__len__'):
+            # Random access readers can skip directly to each frame
+            itraj = imap(i.__getitem__,
+                         xrange(0, min(len(i), max_frames), step))
+        else:
+            itraj = islice(i, 0, max_frames, step)
+    if prefetch > 0:
+        itraj = iprefetch(itraj, prefetch)
+    return itraj
+
+
+def _iblocks(reader, stop, step):
+    """Iterate through frames 0, step, .. (before stop) of reader,
+    reading block_size frames at a time using get_block
+    """
+    n = getattr(reader, 'block_size', 64) * step
+    for start in xrange(0, stop, n):
+        for frame in reader.get_block(start, min(start + n, stop), step):
+            yield frame
+
+
+class ichain:
+    """Iterate through several trajectory files as one trajectory
+
+    Frames at the start of a file which are not later than the last
+    frame of the previous file (e.g. the first frame of a restarted
+    simulation) are dropped. Frames are renumbered consecutively.
+
+    The next file is opened (and e.g. indexed, for readers doing that)
+    in a background thread while the current file is being read.
+    """
+    def __init__(self, filenames, opener=open_trajectory):
+        self._filenames = list(filenames)
+        self._opener = opener
+        self._index = count(1)
+        self._last_time = None
+        self._first_time = None
+        self._boundary = False
+        self._reader = None
+        self._next = None
+        self._open_ahead()
+
+    def _open_ahead(self):
+        if not self._filenames:
+            self._next = None
+            return
+        filename = self._filenames.pop(0)
+        result = {}
+        def run():
             try:
-                logger.debug('Trying trajectory_reader %s' % reader_name)
-                i = reader(filename)
-                return islice(reader(filename), 0, max_frames, step)
-            except Exception as _:
-                logger.debug('Trying trajectory_reader %s failed to open file %s' % (
-                        reader_name, filename))
+                result['reader'] = self._opener(filename)
+            except:
+                result['error'] = sys.exc_info()
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        self._next = (filename, thread, result)
 
-    raise IOError("Failed to open trajectory file %s" % filename)
+    def _next_reader(self):
+        filename, thread, result = self._next
+        thread.join()
+        if 'error' in result:
+            a, b, c = result['error']
+            raise a, b, c
+        logger.debug('Reading trajectory file %s' % filename)
+        self._reader = result['reader']
+        self._open_ahead()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            if self._reader is None:
+                if self._next is None:
+                    raise StopIteration
+                self._next_reader()
+                # Only check for overlap if time is known to advance
+                self._boundary = (self._last_time is not None and
+                                  self._last_time > self._first_time)
+                self._first_time = None
+            try:
+                frame = self._reader.next()
+            except StopIteration:
+                self._reader.close()
+                self._reader = None
+                continue
+            if self._boundary:
+                if frame['time'] <= self._last_time:
+                    logger.debug('Dropping frame at time %f, already read' % frame['time'])
+                    release(frame)
+                    continue
+                self._boundary = False
+            if self._first_time is None:
+                self._first_time = frame['time']
+            self._last_time = frame['time']
+            frame['index'] = self._index.next()
+            return frame
 
 
 def consume(iterator, n):
@@ -84,6 +299,71 @@ def consume(iterator, n):
         next(islice(iterator, n, n), None)
 
 
+def release(frame):
+    "Hand back the buffers of a frame to its pool (if it has one)"
+    getattr(frame, 'release', lambda: None)()
+
+
+class iprefetch:
+    """Read ahead iterator
+
+    Consume an iterator (e.g. a trajectory reader, which spends its
+    time doing I/O, decompression and parsing) in a background thread,
+    keeping at most size items in a queue. Exceptions raised by the
+    iterator are re-raised by next.
+    """
+    _end = object()
+
+    def __init__(self, iterator, size=4):
+        assert(size >= 1)
+        self._queue = Queue(size)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, args=(iterator,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, item):
+        # Block while the queue is full, unless asked to stop
+        while not self._stopped:
+            try:
+                self._queue.put(item, True, 0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _run(self, iterator):
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+        except:
+            self._put((self._end, sys.exc_info()))
+            return
+        self._put((self._end, None))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._stopped:
+            raise StopIteration
+        # A (long) timeout keeps the wait interruptible by KeyboardInterrupt
+        item = self._queue.get(True, 1e9)
+        if isinstance(item, tuple) and item[0] is self._end:
+            self._stopped = True
+            if item[1] is None:
+                raise StopIteration
+            a, b, c = item[1]
+            raise a, b, c
+        return item
+
+    def close(self):
+        """Stop reading ahead"""
+        self._stopped = True
+        self._thread.join()
+
+
 class iwindow:
     """Sliding window iterator
 
@@ -97,8 +377,14 @@ class iwindow:
     Useful if stride > width and map_item is expensive (as compared to
     directly passing imap(fun, itraj) as itraj).
     If stride < width, you could as well directly pass "imap(fun, itraj)"
+
+    If recycle is True, frames are released (see trajectory_frame) as
+    soon as they leave the window, so their buffers can be reused for
+    new frames. Windows (and their frames) must then not be used after
+    the next window has been requested.
     """
-    def __init__(self, itraj, width=2, stride=1, element_processor=None):
+    def __init__(self, itraj, width=2, stride=1, element_processor=None,
+                 recycle=False):
 
         self._raw_it = itraj
         if element_processor:
@@ -109,21 +395,29 @@ class iwindow:
         assert(width >= 1)
         self.width = width
         self.stride = stride
+        self.recycle = recycle
         self._window = None
 
     def __iter__(self):
         return self
 
+    def _discard(self, frame):
+        if self.recycle:
+            release(frame)
+
     def next(self):
         if self._window is None:
             self._window = deque(islice(self._it, self.width), self.width)
         else:
             if self.stride >= self.width:
+                for f in self._window:
+                    self._discard(f)
                 self._window.clear()
-                consume(self._raw_it, self.stride - self.width)
+                for f in islice(self._raw_it, self.stride - self.width):
+                    self._discard(f)
             else:
                 for _ in xrange(min((self.stride, len(self._window)))):
-                    self._window.popleft()
+                    self._discard(self._window.popleft())
             for f in islice(self._it, min((self.stride, self.width))):
                 self._window.append(f)
 
@@ -131,4 +425,3 @@ class iwindow:
             raise StopIteration
 
         return list(self._window)
-
@@ -15,6 +15,7 @@
 # 02110-1301, USA.
 
 from abc import abstractmethod, ABCMeta
+import numpy as np
 
 
 class abstract_trajectory_reader(object):
@@ -23,8 +24,22 @@ class abstract_trajectory_reader(object):
     """Provide a way to iterate through a molecular dynamics (MD) trajectory file
 
     Each frame/time-step is returned as a trajectory_frame.
+
+    Readers take an optional atom_order argument (an index array, a
+    permutation of all atoms). If given, column j of the particle data
+    in each frame holds atom atom_order[j], rather than atom j.
+
+    Readers with parallel_decoding set also take a workers argument,
+    the number of processes to use for decoding frames.
+
+    Readers with stream_input set can read from standard input ("-")
+    and named pipes, and take a follow argument (seconds to wait for
+    a growing file to grow).
     """
 
+    parallel_decoding = False
+    stream_input = False
+
     @classmethod
     @abstractmethod
     def reader_available(cls):
@@ -45,3 +60,43 @@ class abstract_trajectory_reader(object):
     def close(self):
         """Close down, release resources etc"""
         pass
+
+
+def copy_scaled(src, factor, out, atom_order=None):
+    """Copy (3, N) particle data src into out, reordered and scaled
+
+    atom_order is as for the trajectory readers. Returns out.
+    """
+    if atom_order is None:
+        np.multiply(src, factor, out=out)
+    elif src.dtype.newbyteorder('=') != out.dtype:
+        # take can not convert (e.g. quantized int32 into float32)
+        np.multiply(src[:, atom_order], factor, out=out)
+    else:
+        np.take(src, atom_order, axis=1, out=out, mode='clip')
+        out *= factor
+    return out
+
+
+def lengths_angles_to_box(A, B, C, alpha, beta, gamma):
+    """Return the box (3 row vectors) of a cell given by its edge lengths
+    and angles (degrees), a along x and b in the xy-plane
+    """
+    deg2rad = np.pi / 180.0
+    cos_a, cos_b, cos_g = np.cos(deg2rad * np.array([alpha, beta, gamma]))
+    sin_g = np.sin(deg2rad * gamma)
+    cx = C * cos_b
+    cy = C * (cos_a - cos_b * cos_g) / sin_g
+    return np.array(((A, 0.0, 0.0),
+                     (B * cos_g, B * sin_g, 0.0),
+                     (cx, cy, np.sqrt(max(C * C - cx * cx - cy * cy, 0.0)))))
+
+
+def atom_slots(atom_order, N):
+    """Inverse of atom_order: column in which each atom should be stored"""
+    slots = np.empty(N, dtype=np.intp)
+    if atom_order is None:
+        slots[:] = np.arange(N)
+    else:
+        slots[atom_order] = np.arange(N)
+    return slots
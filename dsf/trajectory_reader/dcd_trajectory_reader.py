@@ -0,0 +1,189 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import numpy as np
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, copy_scaled, \
+    lengths_angles_to_box
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
+from numpy import zeros, pi, arccos
+
+#
+# D C D
+#
+# A dcd-file (CHARMM, NAMD, X-PLOR, LAMMPS "dump dcd") is a sequence of
+# fortran unformatted records, each record being enclosed by 4 byte
+# markers containing the record length.
+#
+#   "CORD" + 20 ints (icntrl)    84 bytes
+#   ntitle + ntitle * 80 chars   title
+#   natoms                       4 bytes
+#
+# followed by frames, each consisting of
+#
+#   unit cell (6 doubles)        only if icntrl[10] (and CHARMM style)
+#   x, y, z (natoms floats each)
+#
+# Since all frames have the same size, frame i is found at a fixed
+# offset, and all positions (or unit cells) in the file can be
+# described as a single strided array.
+#
+# icntrl[0] = number of frames, icntrl[1] = first step,
+# icntrl[2] = steps between frames, icntrl[8] = number of fixed atoms,
+# icntrl[9] = timestep (AKMA units), icntrl[10] = has unit cell,
+# icntrl[11] = has 4th dimension, icntrl[19] = CHARMM version.
+#
+
+# AKMA time unit in ps
+AKMA_TIME = 4.888821e-2
+
+
+class dcd_trajectory_reader(abstract_trajectory_reader):
+    """Read a dcd-file, using numpy only
+
+    The file is memory mapped, and positions and unit cells for all
+    frames are exposed as strided (zero-copy) views into the file.
+    Any frame can be reached in O(1), so frames can be accessed in
+    any order (and by several consumers).
+
+    Files with fixed atoms are not supported.
+    """
+
+    @classmethod
+    def reader_available(cls):
+        return True
+
+    def __init__(self, filename, x_factor=0.1, t_factor=AKMA_TIME, atom_order=None):
+        self.x_factor = x_factor
+        self.t_factor = t_factor
+        self._atom_order = atom_order
+
+        mm = self._mm = np.memmap(filename, dtype=np.uint8, mode='r')
+
+        for endian in '<>':
+            i4 = np.dtype(endian + 'i4')
+            if len(mm) >= 92 and np.ndarray((), i4, mm, 0) == 84:
+                break
+        else:
+            raise IOError('dcd_reader: %s does not look like a dcd-file' % filename)
+        if mm[4:8].tostring() != 'CORD':
+            raise IOError('dcd_reader: %s does not look like a dcd-file' % filename)
+
+        icntrl = np.ndarray((20,), i4, mm, 8)
+        charmm = icntrl[19] != 0
+        if icntrl[8] != 0:
+            raise IOError('dcd_reader: fixed atoms are not supported (%s)' % filename)
+        if charmm:
+            delta = float(np.ndarray((), endian + 'f4', mm, 8 + 9 * 4))
+        else:
+            delta = float(np.ndarray((), endian + 'f8', mm, 8 + 9 * 4))
+        has_cell = charmm and icntrl[10] != 0
+        has_4d = charmm and icntrl[11] != 0
+
+        offset = 92
+        title_size = np.ndarray((), i4, mm, offset)
+        offset += title_size + 8
+        if np.ndarray((), i4, mm, offset) != 4:
+            raise IOError('dcd_reader: malformed header in %s' % filename)
+        N = int(np.ndarray((), i4, mm, offset + 4))
+        offset += 12
+
+        record_size = 4 * N + 8
+        frame_size = (3 + has_4d) * record_size
+        if has_cell:
+            frame_size += 6 * 8 + 8
+        # Trust the file size rather than icntrl[0], which is not always updated
+        n_frames = (len(mm) - offset) // frame_size
+
+        f4 = np.dtype(endian + 'f4')
+        f8 = np.dtype(endian + 'f8')
+        # cells[i] and positions[i] are views of the unit cell
+        # (as stored in the file) and (3, N) positions of frame i
+        if has_cell:
+            self.cells = np.ndarray((n_frames, 6), f8, mm, offset + 4,
+                                    strides=(frame_size, 8))
+            x_offset = offset + 6 * 8 + 8 + 4
+        else:
+            self.cells = None
+            x_offset = offset + 4
+        self.positions = np.ndarray((n_frames, 3, N), f4, mm, x_offset,
+                                    strides=(frame_size, record_size, 4))
+
+        self._natoms = N
+        self._first_step = int(icntrl[1])
+        self._step_interval = int(icntrl[2]) or 1
+        self._delta = delta
+        self._pool = frame_buffer_pool()
+        self._i = 0
+        self._open = True
+
+    def _to_box(self, cell):
+        # CHARMM/NAMD order is A, gamma, B, beta, alpha, C. Angles are
+        # either in degrees, or (for newer CHARMM/NAMD) stored as cosines
+        A, gamma, B, beta, alpha, C = cell
+        if all(abs(c) <= 1.0 for c in (alpha, beta, gamma)):
+            alpha, beta, gamma = [arccos(c) * 180.0 / pi for c in (alpha, beta, gamma)]
+        return lengths_angles_to_box(A, B, C, alpha, beta, gamma)
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        """Random access to frame i (counting from 0)
+
+        The returned arrays are not shared with any other frame.
+        """
+        if not self._open:
+            raise IOError('dcd_reader: reader is closed')
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('dcd_reader: frame index out of range')
+
+        if self.cells is not None:
+            box = self._to_box(self.cells[i])
+        else:
+            box = zeros((3, 3))
+
+        step = self._first_step + i * self._step_interval
+        res = trajectory_frame(
+            pool=self._pool,
+            index=i + 1,
+            N=self._natoms,
+            box=self.x_factor * box,
+            time=self.t_factor * self._delta * step,
+            )
+        res.x = copy_scaled(self.positions[i], self.x_factor,
+                            res.buffer((3, self._natoms), np.float32),
+                            self._atom_order)
+        return res
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self.positions = None
+            self.cells = None
+            self._mm = None
+
+    def next(self):
+        if not self._open or self._i >= len(self):
+            self.close()
+            raise StopIteration
+
+        res = self[self._i]
+        self._i += 1
+        return res
@@ -0,0 +1,248 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from os.path import join, isdir, isfile, abspath
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, copy_scaled
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
+
+#
+# D S F   C A C H E
+#
+# A trajectory converted (once, by dynsf-convert) into a directory
+# <trajectory>.dsfcache of plain npy-files, which are memory mapped:
+#
+#   positions.npy    (T, 3, N) float32 [nm], or int32 if quantized
+#   velocities.npy   (T, 3, N) float32 [nm/ps] (optional)
+#   box.npy          (T, 3, 3) float64 [nm]
+#   time.npy         (T,) float64 [ps] (nan if unknown)
+#   info             json; N, T, precision, and size and modification
+#                    time of the source trajectory
+#
+# Quantized positions are stored as round(x * precision), as in
+# xtc-files (where the precision typically is 1000, i.e. 1e-3 nm).
+#
+
+CACHE_SUFFIX = '.dsfcache'
+
+# Room for the npy header, written when the number of frames is known
+NPY_HEADER_SIZE = 128
+
+logger = logging.getLogger('dynsf')
+
+
+def _source_stamp(filename):
+    st = os.stat(filename)
+    return dict(source=abspath(filename), size=st.st_size, mtime=st.st_mtime)
+
+
+def _read_info(cache):
+    try:
+        with open(join(cache, 'info')) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return None
+
+
+def find_cache(filename):
+    """Return the (up to date) cache of filename, or None
+
+    filename may also be a cache itself.
+    """
+    if isdir(filename) and _read_info(filename) is not None:
+        return filename
+    cache = filename + CACHE_SUFFIX
+    if not isfile(filename) or not isdir(cache):
+        return None
+    info = _read_info(cache)
+    stamp = _source_stamp(filename)
+    if info is None or info.get('size') != stamp['size'] or \
+            info.get('mtime') != stamp['mtime']:
+        logger.warning('Ignoring out of date trajectory cache %s' % cache)
+        return None
+    return cache
+
+
+class npy_writer:
+    """Write a npy-file, array by array along its first axis
+
+    Each array has the given shape, the total number of arrays (T)
+    need not be known in advance.
+    """
+    def __init__(self, filename, dtype, shape):
+        self._fh = open(filename, 'wb')
+        self._dtype = np.dtype(dtype)
+        self._shape = tuple(shape)
+        self.T = 0
+        self._fh.write(' ' * NPY_HEADER_SIZE)
+
+    def append(self, a):
+        assert a.shape == self._shape
+        self._fh.write(np.require(a, self._dtype, 'C').tostring())
+        self.T += 1
+
+    def close(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(self._dtype), (self.T,) + self._shape)
+        # Magic string and version (8 bytes), header length (2 bytes), header
+        header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+        preamble = np.lib.format.magic(1, 0) + np.array(
+            [len(header)], dtype='<u2').tostring()
+        self._fh.seek(0)
+        self._fh.write(preamble + header)
+        self._fh.close()
+
+
+def write_cache(itraj, cache, source=None, precision=0, velocities=True):
+    """Write the frames of itraj to the cache directory cache
+
+    source is the converted trajectory file, whose size and
+    modification time are recorded. If precision is > 0, positions
+    are quantized. Velocities are stored if velocities is True and
+    the frames have velocities. Returns the number of frames.
+    """
+    tmp = '%s.tmp%i' % (cache, os.getpid())
+    os.mkdir(tmp)
+    try:
+        x_writer = v_writer = None
+        boxes, times = [], []
+        for frame in itraj:
+            if x_writer is None:
+                N = frame['N']
+                if precision > 0:
+                    x_writer = npy_writer(join(tmp, 'positions.npy'), '<i4', (3, N))
+                else:
+                    x_writer = npy_writer(join(tmp, 'positions.npy'), '<f4', (3, N))
+                if velocities and frame.get('v') is not None:
+                    v_writer = npy_writer(join(tmp, 'velocities.npy'), '<f4', (3, N))
+            x = frame['x']
+            if precision > 0:
+                x = np.rint(precision * x)
+                if np.abs(x).max() >= 2**31:
+                    raise ValueError('write_cache: positions out of range for precision %g' % precision)
+            x_writer.append(x)
+            if v_writer is not None:
+                v_writer.append(frame['v'])
+            boxes.append(frame['box'])
+            times.append(np.nan if frame.get('time') is None else frame['time'])
+            getattr(frame, 'release', lambda: None)()
+        if x_writer is None:
+            raise IOError('write_cache: no frames to write')
+        x_writer.close()
+        v_writer and v_writer.close()
+        np.save(join(tmp, 'box.npy'), np.array(boxes, dtype=np.float64))
+        np.save(join(tmp, 'time.npy'), np.array(times, dtype=np.float64))
+
+        info = dict(N=N, T=x_writer.T, precision=precision)
+        if source is not None:
+            info.update(_source_stamp(source))
+        with open(join(tmp, 'info'), 'w') as fh:
+            json.dump(info, fh)
+
+        if isdir(cache):
+            shutil.rmtree(cache)
+        os.rename(tmp, cache)
+    except:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return info['T']
+
+
+class dsfcache_trajectory_reader(abstract_trajectory_reader):
+    """Read a trajectory cache, as written by write_cache (dynsf-convert)
+
+    All data is memory mapped, so any frame can be reached in O(1),
+    and frames can be accessed in any order.
+    """
+
+    @classmethod
+    def reader_available(cls):
+        return True
+
+    def __init__(self, cache, atom_order=None):
+        info = _read_info(cache)
+        if info is None:
+            raise IOError('dsfcache_reader: %s is not a trajectory cache' % cache)
+        self._atom_order = atom_order
+        self._natoms = info['N']
+        precision = info.get('precision', 0)
+        self._x_factor = 1.0 / precision if precision > 0 else 1.0
+
+        self.positions = np.load(join(cache, 'positions.npy'), mmap_mode='r')
+        if isfile(join(cache, 'velocities.npy')):
+            self.velocities = np.load(join(cache, 'velocities.npy'), mmap_mode='r')
+        else:
+            self.velocities = None
+        self.boxes = np.load(join(cache, 'box.npy'))
+        self.times = np.load(join(cache, 'time.npy'))
+        if self.positions.shape != (len(self.boxes), 3, self._natoms):
+            raise IOError('dsfcache_reader: inconsistent cache %s' % cache)
+
+        self._pool = frame_buffer_pool()
+        self._i = 0
+        self._open = True
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, i):
+        """Random access to frame i (counting from 0)
+
+        The returned arrays are not shared with any other frame.
+        """
+        if not self._open:
+            raise IOError('dsfcache_reader: reader is closed')
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('dsfcache_reader: frame index out of range')
+
+        time = self.times[i]
+        res = trajectory_frame(
+            pool=self._pool,
+            index=i + 1,
+            N=self._natoms,
+            box=self.boxes[i].copy(),
+            time=None if np.isnan(time) else float(time),
+            )
+        res.x = copy_scaled(self.positions[i], self._x_factor,
+                            res.buffer((3, self._natoms), np.float32),
+                            self._atom_order)
+        if self.velocities is not None:
+            res.v = copy_scaled(self.velocities[i], 1.0,
+                                res.buffer((3, self._natoms), np.float32),
+                                self._atom_order)
+        return res
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self.positions = self.velocities = None
+
+    def next(self):
+        if not self._open or self._i >= len(self):
+            self.close()
+            raise StopIteration
+
+        res = self[self._i]
+        self._i += 1
+        return res
@@ -0,0 +1,294 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import numpy as np
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, atom_slots
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
+from itertools import count
+from numpy import array
+
+#
+# L A M M P S   B I N A R Y   D U M P
+#
+# Each frame ("dump custom" with a *.bin filename) is written as
+#
+#   [bigint -len(magic), magic ("DUMPCUSTOM"), int endian, int revision]
+#                                 (only in files from newer LAMMPS versions)
+#   bigint ntimestep, bigint natoms
+#   int triclinic, int boundary[6]
+#   double xlo, xhi, ylo, yhi, zlo, zhi [, xy, xz, yz]
+#   int size_one (number of columns)
+#   [int len, char unit_style[len],
+#    char time_flag [, double time],
+#    int len, char columns[len]]  (only for format revision > 1)
+#   int nchunk
+#
+# followed by nchunk chunks (one per writing processor), each being
+#
+#   int n, double data[n]  (n / size_one atoms)
+#
+# Files written by older LAMMPS versions contain no column names, so
+# these must then be provided.
+#
+
+_bigint = np.dtype('<i8')
+_int = np.dtype('<i4')
+_double = np.dtype('<f8')
+
+MAGIC_STRING = 'DUMPCUSTOM'
+
+
+class lammpsbin_trajectory_reader(abstract_trajectory_reader):
+    """Read LAMMPS binary dump file
+
+    Each processor chunk is decoded with a single np.frombuffer, and
+    scattered by atom id into the (3, N) position/velocity buffers.
+
+    columns - tuple of column names (e.g. ('id', 'type', 'x', 'y', 'z')),
+              needed for files written by older LAMMPS versions, which
+              do not contain column information.
+    """
+
+    @classmethod
+    def reader_available(cls):
+        return True
+
+    def __init__(self, filename, x_factor=0.1, t_factor=1.0, columns=None,
+                 atom_order=None):
+        if filename.endswith('.gz'):
+            from gzip import GzipFile
+            self._fh = GzipFile(filename, 'rb')
+        elif filename.endswith('.bz2'):
+            from bz2 import BZ2File
+            self._fh = BZ2File(filename, 'rb')
+        else:
+            self._fh = open(filename, 'rb')
+
+        self.x_factor = x_factor
+        self.t_factor = t_factor
+        self.v_factor = x_factor / t_factor
+        self._columns = columns
+        self._atom_order = atom_order
+        self._index = count(1)
+        self._pool = frame_buffer_pool()
+        self._frame = self._x = self._v = None
+
+        # Parse the first header already here, as it is the only way
+        # to tell whether this is a LAMMPS binary dump or not
+        try:
+            self._header = self._read_frame_header()
+        except (IOError, ValueError):
+            self._fh.close()
+            raise IOError('lammpsbin_reader: %s does not look like a LAMMPS '
+                          'binary dump' % filename)
+        if self._header is None:
+            self._fh.close()
+            raise IOError('lammpsbin_reader: %s is empty' % filename)
+        self._open = True
+        self._first_called = False
+
+    def _read(self, dtype, n=None):
+        size = dtype.itemsize * (1 if n is None else n)
+        data = self._fh.read(size)
+        if len(data) != size:
+            raise IOError('lammpsbin_reader: unexpected end of file')
+        a = np.frombuffer(data, dtype=dtype)
+        return a[0] if n is None else a
+
+    def _read_string(self):
+        n = self._read(_int)
+        if n < 0 or n > 1 << 20:
+            raise IOError('lammpsbin_reader: malformed string in header')
+        return self._fh.read(n)
+
+    def _read_frame_header(self):
+        # Return (step, natoms, box, cols, nchunk), or None at end of file
+        data = self._fh.read(_bigint.itemsize)
+        if len(data) == 0:
+            return None
+        if len(data) != _bigint.itemsize:
+            raise IOError('lammpsbin_reader: unexpected end of file')
+        step = np.frombuffer(data, dtype=_bigint)[0]
+
+        revision = 0
+        if step < 0:
+            if -step > 64:
+                raise IOError('lammpsbin_reader: malformed frame header')
+            magic = self._fh.read(-step)
+            if magic != MAGIC_STRING:
+                raise IOError('lammpsbin_reader: unknown magic string')
+            if self._read(_int) != 1:
+                raise IOError('lammpsbin_reader: unsupported endianness')
+            revision = self._read(_int)
+            step = self._read(_bigint)
+
+        natoms = self._read(_bigint)
+        triclinic = self._read(_int)
+        boundary = self._read(_int, 6)
+        if (step < 0 or not 0 < natoms < 1 << 40 or triclinic not in (0, 1) or
+            boundary.min() < 0 or boundary.max() > 3):
+            raise IOError('lammpsbin_reader: malformed frame header')
+
+        x = self._read(_double, 6).reshape((3, 2))
+        box = np.diag(x[:, 1] - x[:, 0])
+        if triclinic:
+            xy, xz, yz = self._read(_double, 3)
+            box[1, 0] = xy
+            box[2, 0] = xz
+            box[2, 1] = yz
+
+        size_one = self._read(_int)
+        if not 0 < size_one < 1024:
+            raise IOError('lammpsbin_reader: malformed frame header')
+
+        cols = None
+        if revision > 1:
+            # Unit style and (optional) simulation time are skipped; as
+            # for text dumps, time is taken to be the timestep
+            self._read_string()
+            if self._read(np.dtype('i1')):
+                self._read(_double)
+            cols = tuple(self._read_string().split())
+        if not cols:
+            cols = self._columns and tuple(self._columns)
+        if cols is None or len(cols) != size_one:
+            raise IOError('lammpsbin_reader: column names unknown for %i columns, '
+                          'provide them via columns' % size_one)
+
+        nchunk = self._read(_int)
+        if nchunk < 1:
+            raise IOError('lammpsbin_reader: malformed frame header')
+
+        return (int(step), int(natoms), box, cols, nchunk)
+
+    def _read_chunks(self, nchunk, size_one):
+        # Scatter each chunk directly into the (3, N) buffers
+        for _ in xrange(nchunk):
+            n = self._read(_int)
+            data = self._read(_double, n).reshape((n // size_one, size_one))
+            I = self._slots[np.searchsorted(self._ids, data[:, self._id_I].astype(np.int64))]
+            if self._x_map is None:
+                self._x[:, I] = data[:, self._x_I].transpose()
+            else:
+                self._x[:, I] = self._x_map(data[:, self._x_I].transpose())
+            if self._v_I is not None:
+                self._v[:, I] = data[:, self._v_I].transpose()
+
+    def _get_first(self):
+        step, N, box, cols, nchunk = self._header
+        self._natoms = N
+        self._step = step
+        self._cols = cols
+        self._box = box
+
+        def _all_in_cols(keys):
+            for k in keys:
+                if not k in cols:
+                    return False
+            return True
+
+        self._x_map = None
+        if _all_in_cols(('id', 'xu', 'yu', 'zu')):
+            self._x_I = array(map(cols.index, ('xu', 'yu', 'zu')))
+        elif _all_in_cols(('id', 'x', 'y', 'z')):
+            self._x_I = array(map(cols.index, ('x', 'y', 'z')))
+        elif _all_in_cols(('id', 'xs', 'ys', 'zs')):
+            self._x_I = array(map(cols.index, ('xs', 'ys', 'zs')))
+            self._x_map = lambda xs : xs * self._box.diagonal().reshape((3, 1))
+        else:
+            raise RuntimeError('LAMMPS binary dump must contain at least atom-id, '
+                               'x, y, and z coordinates to be useful.')
+        self._id_I = cols.index('id')
+
+        if _all_in_cols(('vx', 'vy', 'vz')):
+            self._v_I = array(map(cols.index, ('vx', 'vy', 'vz')))
+        else:
+            self._v_I = None
+
+        # Read all chunks once to learn which atom ids are present
+        # (unless the dump is done for group "all", ids are not 1..N)
+        chunks = []
+        for _ in xrange(nchunk):
+            n = self._read(_int)
+            chunks.append(self._read(_double, n).reshape((-1, len(cols))))
+        data = np.concatenate(chunks)
+        self._ids = np.sort(data[:, self._id_I].astype(np.int64))
+        if len(self._ids) != N:
+            raise IOError('lammpsbin_reader: expected %i atoms, found %i' % (
+                    N, len(self._ids)))
+
+        # _slots maps the position of an id (in sorted order) to a column
+        self._slots = atom_slots(self._atom_order, N)
+        I = self._slots[np.searchsorted(self._ids, data[:, self._id_I].astype(np.int64))]
+        self._new_frame(N)
+        if self._x_map is None:
+            self._x[:, I] = data[:, self._x_I].transpose()
+        else:
+            self._x[:, I] = self._x_map(data[:, self._x_I].transpose())
+        if self._v_I is not None:
+            self._v[:, I] = data[:, self._v_I].transpose()
+
+    def _get_next(self):
+        header = self._read_frame_header()
+        if header is None:
+            self._fh.close()
+            self._open = False
+            raise StopIteration
+        step, N, box, cols, nchunk = header
+        assert(self._natoms == N)
+        assert(self._cols == cols)
+        self._step = step
+        self._box = box
+        self._new_frame(N)
+        self._read_chunks(nchunk, len(cols))
+
+    def _new_frame(self, N):
+        # Particle data is scattered directly into buffers owned by the frame
+        self._frame = trajectory_frame(pool=self._pool)
+        self._x = self._frame.buffer((3, N))
+        if self._v_I is not None:
+            self._v = self._frame.buffer((3, N))
+
+    def __iter__(self):
+        return self
+
+    def close(self):
+        if not self._fh.closed:
+            self._fh.close()
+
+    def next(self):
+        if not self._open:
+            raise StopIteration
+
+        if self._first_called:
+            self._get_next()
+        else:
+            self._get_first()
+            self._first_called = True
+
+        # Apply unit scaling in place
+        self._x *= self.x_factor
+        if self._v_I is not None:
+            self._v *= self.v_factor
+
+        res = self._frame
+        res.index = self._index.next()
+        res.N = int(self._natoms)
+        res.box = self.x_factor * self._box.copy('F')
+        res.time = self.t_factor * self._step
+        res.x = self._x
+        res.v = self._v
+        self._frame = self._x = self._v = None
+        return res
@@ -14,10 +14,82 @@
 # 02110-1301, USA.
 
 import numpy as np
-from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, atom_slots
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
 import re
+import sys
+import mmap
+import time
 from itertools import count
-from numpy import array, arange, zeros
+from collections import deque
+from numpy import array, arange
+from os.path import isfile
+
+FRAME_MARKER = 'ITEM: TIMESTEP'
+
+
+def _box_from_bounds(bbounds):
+    x = array(bbounds)
+    box = np.diag(x[:, 1] - x[:, 0])
+    if x.shape == (3, 3):
+        box[1, 0] = x[0, 2]
+        box[2, 0] = x[1, 2]
+        box[2, 1] = x[2, 2]
+    elif x.shape != (3, 2):
+        raise IOError('TRJ_reader: Malformed box bounds in TRJ frame header')
+    return box
+
+
+#
+# Parallel decoding
+#
+# The text of each frame (or the byte range it occupies in an
+# uncompressed file) is handed to a worker process, which parses
+# it and stores the atom data in its slot of a shared memory array.
+# Frames are collected in order, at most one frame per slot being
+# in flight at any time.
+#
+
+_shared = None
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+
+
+def _decode_frame(job):
+    # Parse one frame, return (step, natoms, box, cols); the atom data
+    # is written to the given slot of the shared array
+    slot, slot_size, source = job
+    if isinstance(source, tuple):
+        filename, start, stop = source
+        with open(filename, 'rb') as fh:
+            fh.seek(start)
+            text = fh.read(stop - start)
+    else:
+        text = source
+
+    i = text.index('ITEM: ATOMS')
+    j = text.index('\n', i)
+    head = text[:i].split('\n')
+    cols = tuple(text[i + len('ITEM: ATOMS'):j].split())
+    step = natoms = box = None
+    for n, L in enumerate(head):
+        if L.startswith(FRAME_MARKER):
+            step = int(head[n + 1])
+        elif L.startswith('ITEM: NUMBER OF ATOMS'):
+            natoms = int(head[n + 1])
+        elif L.startswith('ITEM: BOX BOUNDS'):
+            box = _box_from_bounds([map(float, b.split()) for b in head[n + 1:n + 4]])
+    if step is None or natoms is None or box is None:
+        raise IOError('TRJ_reader: Failed to read/parse TRJ frame header')
+
+    data = np.fromstring(text[j + 1:], dtype=np.float64, sep=' ')
+    if len(data) != natoms * len(cols) or len(data) > slot_size:
+        raise IOError('TRJ_reader: Malformed TRJ frame at timestep %i' % step)
+    shared = np.frombuffer(_shared, dtype=np.float64)
+    shared[slot * slot_size:slot * slot_size + len(data)] = data
+    return step, natoms, box, cols
 
 
 class lammpstrj_trajectory_reader(abstract_trajectory_reader):
@@ -25,14 +97,34 @@ class lammpstrj_trajectory_reader(abstract_trajectory_reader):
 
     This is a naive (and comparatively slow) implementation,
     written entirely in python.
+
+    With workers > 1, all frames but the first are decoded by a pool
+    of worker processes. Uncompressed files are split into frame
+    aligned byte ranges (read by the workers themselves), for
+    compressed files the text of each frame is passed to the workers.
+
+    filename may be "-" (standard input) or a named pipe. With
+    follow > 0, a growing (uncompressed) file is followed, waiting
+    for more frames until no data has been added for follow seconds.
     """
 
+    parallel_decoding = True
+    stream_input = True
+    poll_interval = 0.5
+
     @classmethod
     def reader_available(cls):
         return True
 
-    def __init__(self, filename, x_factor=0.1, t_factor=1.0):
-        if filename.endswith('.gz'):
+    def __init__(self, filename, x_factor=0.1, t_factor=1.0, atom_order=None,
+                 workers=1, follow=0):
+        self._filename = filename
+        # Byte ranges can only be used for uncompressed regular files
+        self._seekable = not (filename == '-' or filename.endswith('.gz') or
+                              filename.endswith('.bz2') or not isfile(filename))
+        if filename == '-':
+            self._fh = sys.stdin
+        elif filename.endswith('.gz'):
             from gzip import GzipFile
             self._fh = GzipFile(filename, 'r')
         elif filename.endswith('.bz2'):
@@ -46,8 +138,15 @@ class lammpstrj_trajectory_reader(abstract_trajectory_reader):
         self.x_factor = x_factor
         self.t_factor = t_factor
         self.v_factor = x_factor / t_factor
+        self._atom_order = atom_order
         self._first_called = False
         self._index = count(1)
+        self._pool = frame_buffer_pool()
+        self._frame = self._x = self._v = None
+        self._follow = follow
+        # Frames of a growing file can not be handed out ahead of time
+        self._workers = 1 if follow else workers
+        self._decoders = None
 
     # ITEM: TIMESTEP
     # 81000
@@ -62,9 +161,25 @@ class lammpstrj_trajectory_reader(abstract_trajectory_reader):
     # 249 2 3.73324 3.05962 4.14359 0.00346029 0.00332502 -0.00731005
     # 463 1 3.5465 4.12841 5.34888 0.000523332 0.00145597 -0.00418675
 
+    def _readline(self):
+        L = self._fh.readline()
+        if not self._follow:
+            return L
+        # Wait for complete lines to be appended
+        waited = 0.0
+        while not L.endswith('\n') and waited < self._follow:
+            time.sleep(self.poll_interval)
+            more = self._fh.readline()
+            if more:
+                L += more
+                waited = 0.0
+            else:
+                waited += self.poll_interval
+        return L
+
     def _read_frame_header(self):
         while True:
-            L = self._fh.readline()
+            L = self._readline()
             m = self._item_re.match(L)
             if not m:
                 if L == '':
@@ -75,20 +190,12 @@ class lammpstrj_trajectory_reader(abstract_trajectory_reader):
                     continue
                 raise IOError("TRJ_reader: Failed to read/parse TRJ frame header")
             if m.group(1) == "TIMESTEP":
-                step = int(self._fh.readline())
+                step = int(self._readline())
             elif m.group(1) == "NUMBER OF ATOMS":
-                natoms = int(self._fh.readline())
+                natoms = int(self._readline())
             elif m.group(1) == "BOX BOUNDS":
-                bbounds = [map(float, self._fh.readline().split())
-                           for _ in range(3)]
-                x = array(bbounds)
-                box = np.diag(x[:, 1] - x[:, 0])
-                if x.shape == (3, 3):
-                    box[1, 0] = x[0, 2]
-                    box[2, 0] = x[1, 2]
-                    box[2, 1] = x[2, 2]
-                elif x.shape != (3, 2):
-                    raise IOError('TRJ_reader: Malformed box bounds in TRJ frame header')
+                box = _box_from_bounds([map(float, self._readline().split())
+                                        for _ in range(3)])
             elif m.group(1) == "ATOMS":
                 cols = tuple(m.group(2).split())
                 # At this point, there should be only atomic data left
@@ -133,18 +240,21 @@ class lammpstrj_trajectory_reader(abstract_trajectory_reader):
         else:
             self._type_I = None
 
-        data = array([map(float, self._fh.readline().split())
+        data = array([map(float, self._readline().split())
                          for _ in range(N)])
         I = np.asarray(data[:, self._id_I], dtype=np.int)
+        self._ids = np.sort(I)
         # Unless dump is done for group "all" ...
         I[np.argsort(I)] = arange(len(I))
-        self._x = zeros((3, N), order='F')
+        if self._atom_order is not None:
+            self._slots = atom_slots(self._atom_order, N)
+            I = self._slots[I]
+        self._new_frame(N)
         if self._x_map is None:
             self._x[:, I] = data[:, self._x_I].transpose()
         else:
             self._x[:, I] = self._x_map(data[:, self._x_I].transpose())
         if self._v_I is not None:
-            self._v = zeros((3, N), order='F')
             self._v[:, I] = data[:, self._v_I].transpose()
 
     def _get_next(self):
@@ -155,44 +265,145 @@ class lammpstrj_trajectory_reader(abstract_trajectory_reader):
         self._step = step
         self._box = box
 
-        data = array([map(float, self._fh.readline().split())
+        data = array([map(float, self._readline().split())
                          for _ in range(N)])
-        I = np.asarray(data[:, self._id_I], dtype=np.int) - 1
+        I = np.searchsorted(self._ids, data[:, self._id_I].astype(np.int))
+        if self._atom_order is not None:
+            I = self._slots[I]
+        self._new_frame(N)
+        if self._x_map is None:
+            self._x[:, I] = data[:, self._x_I].transpose()
+        else:
+            self._x[:, I] = self._x_map(data[:, self._x_I].transpose())
+        if self._v_I is not None:
+            self._v[:, I] = data[:, self._v_I].transpose()
+
+    def _frame_texts(self):
+        # Split the remaining (decompressed) stream into frames
+        buf = ''
+        while True:
+            block = self._fh.read(1 << 22)
+            buf += block
+            start = 0
+            while True:
+                i = buf.find(FRAME_MARKER, start + 1)
+                if i < 0:
+                    break
+                yield buf[start:i]
+                start = i
+            buf = buf[start:]
+            if not block:
+                break
+        if buf.strip():
+            yield buf
+
+    def _frame_ranges(self):
+        # Find frame aligned byte ranges of the rest of the file
+        offset = self._fh.tell()
+        with open(self._filename, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = None
+            for m in re.compile('^' + FRAME_MARKER, re.M).finditer(mm, offset):
+                if start is not None:
+                    yield (self._filename, start, m.start())
+                start = m.start()
+            if start is not None:
+                yield (self._filename, start, len(mm))
+        finally:
+            mm.close()
+
+    def _start_decoders(self):
+        from multiprocessing import Pool, RawArray
+        self._slot_size = self._natoms * len(self._cols)
+        n_slots = 2 * self._workers
+        self._shared = RawArray('d', n_slots * self._slot_size)
+        self._decoders = Pool(self._workers, _init_worker, (self._shared,))
+        if self._seekable:
+            self._sources = self._frame_ranges()
+        else:
+            self._sources = self._frame_texts()
+        self._pending = deque()
+        for slot in xrange(n_slots):
+            self._submit(slot)
+
+    def _submit(self, slot):
+        for source in self._sources:
+            job = (slot, self._slot_size, source)
+            self._pending.append((slot, self._decoders.apply_async(_decode_frame, (job,))))
+            return
+
+    def _get_decoded(self):
+        # Collect the next frame from the worker processes, in order
+        if not self._pending:
+            self._open = False
+            self.close()
+            raise StopIteration
+        slot, result = self._pending.popleft()
+        step, N, box, cols = result.get()
+        assert(self._natoms == N)
+        assert(self._cols == cols)
+        self._step = step
+        self._box = box
+
+        shared = np.frombuffer(self._shared, dtype=np.float64)
+        data = shared[slot * self._slot_size:(slot + 1) * self._slot_size]
+        data = data.reshape((N, len(cols)))
+        I = np.searchsorted(self._ids, data[:, self._id_I].astype(np.int))
+        if self._atom_order is not None:
+            I = self._slots[I]
+        self._new_frame(N)
         if self._x_map is None:
             self._x[:, I] = data[:, self._x_I].transpose()
         else:
             self._x[:, I] = self._x_map(data[:, self._x_I].transpose())
         if self._v_I is not None:
             self._v[:, I] = data[:, self._v_I].transpose()
+        # The slot is free for the next frame
+        self._submit(slot)
+
+    def _new_frame(self, N):
+        # Particle data is scattered directly into buffers owned by the frame
+        self._frame = trajectory_frame(pool=self._pool)
+        self._x = self._frame.buffer((3, N))
+        if self._v_I is not None:
+            self._v = self._frame.buffer((3, N))
 
     def __iter__(self):
         return self
 
     def close(self):
-        if not self._fh.closed:
+        if self._decoders is not None:
+            self._decoders.terminate()
+            self._decoders = None
+        if not self._fh.closed and self._fh is not sys.stdin:
             self._fh.close()
 
     def next(self):
         if not self._open:
             raise StopIteration
 
-        if self._first_called:
+        if self._decoders is not None:
+            self._get_decoded()
+        elif self._first_called:
             self._get_next()
         else:
             self._get_first()
+            self._first_called = True
+            if self._workers > 1:
+                self._start_decoders()
 
-        res = dict(
-            index=self._index.next(),
-            N=int(self._natoms),
-            box=self.x_factor * self._box.copy('F'),
-            time=self.t_factor * self._step,
-            x=self.x_factor * self._x,
-            )
-
+        # Apply unit scaling in place
+        self._x *= self.x_factor
         if self._v_I is not None:
-            res['v'] = self.v_factor * self._v
-        else:
-            res['v'] = None
+            self._v *= self.v_factor
 
+        res = self._frame
+        res.index = self._index.next()
+        res.N = int(self._natoms)
+        res.box = self.x_factor * self._box.copy('F')
+        res.time = self.t_factor * self._step
+        res.x = self._x
+        res.v = self._v
+        self._frame = self._x = self._v = None
         return res
-
@@ -14,7 +14,8 @@
 # 02110-1301, USA.
 
 import numpy as np
-from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, copy_scaled
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
 from dsf.trajectory_reader.molfile_plugin import (
     _MolfilePlugin, molfile_plugin_dir, molfile_plugin_path, TRAJECTORY_PLUGIN_MAPPING,
     molfile_atom_t, molfile_timestep_metadata_t, molfile_timestep_t)
@@ -50,7 +51,8 @@ class molfile_trajectory_reader(abstract_trajectory_reader):
             if suffix == filename_suffix:
                 return plugin_name
 
-    def __init__(self, filename, plugin_name=None, x_factor=0.1, t_factor=1.0):
+    def __init__(self, filename, plugin_name=None, x_factor=0.1, t_factor=1.0,
+                 atom_order=None):
 
         if plugin_name is None:
             plugin_name = self._guess_plugin(filename)
@@ -61,6 +63,7 @@ class molfile_trajectory_reader(abstract_trajectory_reader):
         self.x_factor = x_factor
         self.t_factor = t_factor
         self.v_factor = x_factor / t_factor
+        self._atom_order = atom_order
 
         self._N = c_int()
         suffix = filename.rsplit('.', 1)[-1]
@@ -120,6 +123,7 @@ class molfile_trajectory_reader(abstract_trajectory_reader):
 
         # Set frame counter
         self._index = count(1)
+        self._pool = frame_buffer_pool()
 
     def __iter__(self):
         return self
@@ -134,18 +138,20 @@ class molfile_trajectory_reader(abstract_trajectory_reader):
             self._mfp.close()
             raise StopIteration
 
-        res = dict(
+        N = self._N.value
+        res = trajectory_frame(
+                   pool=self._pool,
                    index=self._index.next(),
                    box=self._to_box(ts.A, ts.B, ts.C,
                                 ts.alpha, ts.beta, ts.gamma) * self.x_factor,
-                   N=self._N.value,
+                   N=N,
                    time=ts.physical_time * self.t_factor,
-                   x=self._x * self.x_factor
                    )
+        res.x = copy_scaled(self._x, self.x_factor,
+                            res.buffer((3, N), molfile_float_np), self._atom_order)
         if self._v is not None:
-            res['v'] = self._v * self.v_factor
-        else:
-            res['v'] = None
+            res.v = copy_scaled(self._v, self.v_factor,
+                                res.buffer((3, N), molfile_float_np), self._atom_order)
 
         return res
 
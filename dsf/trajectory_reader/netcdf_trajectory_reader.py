@@ -0,0 +1,201 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import numpy as np
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, \
+    lengths_angles_to_box
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
+from numpy import zeros
+
+try:
+    from scipy.io import netcdf_file
+except ImportError:
+    # SciPy is optional, without it this reader is not available
+    netcdf_file = None
+
+#
+# A M B E R   N E T C D F
+#
+# AMBER (and e.g. OpenMM, MDTraj) trajectories following the AMBER
+# NetCDF convention contain the variables
+#
+#   coordinates(frame, atom, spatial)      [Angstrom]
+#   velocities(frame, atom, spatial)       (optional) [Angstrom/ps]
+#   time(frame)                            (optional) [ps]
+#   cell_lengths(frame, cell_spatial)      (optional) [Angstrom]
+#   cell_angles(frame, cell_angular)       (optional) [degree]
+#
+# Variables may have a scale_factor attribute (typically the velocities,
+# 20.455, converting to Angstrom/ps).
+#
+# Only classic-format (NetCDF3) files are supported, as that is what
+# scipy.io.netcdf_file can read. Those can be memory mapped, in which
+# case the (frame, atom, spatial) variables are strided views into the
+# file, and a whole block of frames is transposed into (3, N) order
+# in one go.
+#
+
+
+class netcdf_trajectory_reader(abstract_trajectory_reader):
+    """Read an AMBER NetCDF (classic format) trajectory using scipy
+
+    Frames are read in blocks of block_size frames. Blocks (of any
+    size) can also be fetched directly using get_block, which is
+    useful for batched processing.
+    """
+
+    @classmethod
+    def reader_available(cls):
+        return netcdf_file is not None
+
+    def __init__(self, filename, x_factor=0.1, t_factor=1.0, block_size=64,
+                 atom_order=None):
+        if netcdf_file is None:
+            raise RuntimeError('netcdf_reader: SciPy is required for reading NetCDF files')
+
+        self.x_factor = x_factor
+        self.t_factor = t_factor
+        self.v_factor = x_factor / t_factor
+        assert block_size > 0
+        self.block_size = block_size
+        self._atom_order = atom_order
+
+        self._nc = netcdf_file(filename, 'r', mmap=True)
+        var = self._nc.variables
+        if 'coordinates' not in var:
+            self._nc.close()
+            raise IOError('netcdf_reader: no coordinates in %s' % filename)
+
+        self._coordinates = var['coordinates']
+        self._velocities = var.get('velocities')
+        self._time = var.get('time')
+        if 'cell_lengths' in var and 'cell_angles' in var:
+            self._cell_lengths = var['cell_lengths']
+            self._cell_angles = var['cell_angles']
+        else:
+            self._cell_lengths = None
+            self._cell_angles = None
+
+        shape = self._coordinates.shape
+        if len(shape) != 3 or shape[2] != 3:
+            self._nc.close()
+            raise IOError('netcdf_reader: unexpected shape of coordinates in %s' % filename)
+        self._n_frames, self._natoms, _ = shape
+
+        self._block = []
+        self._i = 0
+        self._open = True
+
+    def _scale(self, variable):
+        return getattr(variable, 'scale_factor', 1.0)
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return self._n_frames
+
+    def __getitem__(self, i):
+        """Random access to frame i (counting from 0)"""
+        if i < 0:
+            i += self._n_frames
+        if not 0 <= i < self._n_frames:
+            raise IndexError('netcdf_reader: frame index out of range')
+        return self.get_block(i, i + 1)[0]
+
+    def _read_slab(self, variable, start, stop, step, factor):
+        slab = variable[start:stop:step]
+        if self._atom_order is None:
+            out = np.multiply(slab, factor)
+        else:
+            out = np.empty(slab.shape, dtype=slab.dtype.newbyteorder('='))
+            np.take(slab, self._atom_order, axis=1, out=out, mode='clip')
+            out *= factor
+        return out.transpose((0, 2, 1))
+
+    def get_block(self, start, stop, step=1):
+        """Return frames start, start+step, .. (before stop) as a list of frames
+
+        Each variable is read with a single (hyperslab) access, and
+        converted in bulk. The returned arrays are not shared with
+        any other frame.
+        """
+        if not self._open:
+            raise IOError('netcdf_reader: reader is closed')
+        stop = min(stop, self._n_frames)
+        if start >= stop:
+            return []
+        n = len(xrange(start, stop, step))
+
+        # Scaling the (n, N, 3) slab gives a native c-ordered copy, and
+        # transposing that into (n, 3, N) makes each frame fortran ordered
+        x_factor = self.x_factor * self._scale(self._coordinates)
+        xs = self._read_slab(self._coordinates, start, stop, step, x_factor)
+        if self._velocities is not None:
+            v_factor = self.v_factor * self._scale(self._velocities)
+            vs = self._read_slab(self._velocities, start, stop, step, v_factor)
+        if self._time is not None:
+            times = self.t_factor * self._scale(self._time) * \
+                np.asarray(self._time[start:stop:step], dtype=np.float64)
+        else:
+            times = zeros(n)
+        if self._cell_lengths is not None:
+            lengths = self._scale(self._cell_lengths) * \
+                np.asarray(self._cell_lengths[start:stop:step], dtype=np.float64)
+            angles = np.asarray(self._cell_angles[start:stop:step], dtype=np.float64)
+
+        frames = []
+        for j in xrange(n):
+            if self._cell_lengths is not None:
+                A, B, C = lengths[j]
+                alpha, beta, gamma = angles[j]
+                box = lengths_angles_to_box(A, B, C, alpha, beta, gamma)
+            else:
+                box = zeros((3, 3))
+            frame = trajectory_frame(
+                index=start + j * step + 1,
+                N=self._natoms,
+                box=self.x_factor * box,
+                time=times[j],
+                x=xs[j],
+                )
+            if self._velocities is not None:
+                frame.v = vs[j]
+            frames.append(frame)
+        return frames
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self._block = []
+            self._coordinates = self._velocities = self._time = None
+            self._cell_lengths = self._cell_angles = None
+            # Drop all references to the mapped data before closing
+            self._nc.variables.clear()
+            self._nc.close()
+
+    def next(self):
+        if not self._open:
+            raise StopIteration
+
+        if not self._block:
+            self._block = self.get_block(self._i, self._i + self.block_size)
+            self._block.reverse()
+            if not self._block:
+                self.close()
+                raise StopIteration
+
+        self._i += 1
+        return self._block.pop()
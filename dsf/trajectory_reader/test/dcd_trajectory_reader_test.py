@@ -0,0 +1,109 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import unittest
+import tempfile
+import numpy
+from dsf.trajectory_reader.dcd_trajectory_reader import (
+    dcd_trajectory_reader as trajectory_reader)
+from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
+
+
+def _record(fh, data):
+    data = data.tostring()
+    marker = numpy.array([len(data)], dtype='<i4').tostring()
+    fh.write(marker + data + marker)
+
+
+def write_dcd(filename, positions, cells=None, first_step=10, step_interval=5):
+    """Write a CHARMM style dcd-file, positions has shape (frames, 3, N) [Angstrom]"""
+    n_frames, _, N = positions.shape
+    icntrl = numpy.zeros(20, dtype='<i4')
+    icntrl[0] = n_frames
+    icntrl[1] = first_step
+    icntrl[2] = step_interval
+    icntrl[9] = numpy.array([1.0], dtype='<f4').view('<i4')[0]
+    icntrl[10] = cells is not None
+    icntrl[19] = 24
+    with open(filename, 'wb') as fh:
+        _record(fh, numpy.fromstring('CORD' + icntrl.tostring(), dtype=numpy.uint8))
+        _record(fh, numpy.fromstring(numpy.array([1], dtype='<i4').tostring() +
+                                     'test'.ljust(80), dtype=numpy.uint8))
+        _record(fh, numpy.array([N], dtype='<i4'))
+        for i in range(n_frames):
+            if cells is not None:
+                _record(fh, numpy.require(cells[i], '<f8'))
+            for x in positions[i]:
+                _record(fh, numpy.require(x, '<f4'))
+
+
+class DCDTrajectoryReaderTest(unittest.TestCase, TrajectoryReaderTestMixin):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.dcd')
+        os.close(fd)
+        self.positions = (numpy.random.rand(4, 3, 5) * 10.0).astype(numpy.float32)
+        cell = [20.0, 90.0, 21.0, 90.0, 90.0, 22.0]
+        write_dcd(self.filename, self.positions, cells=[cell] * 4)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_open_lammpstrj_fails(self):
+        self.assertRaises(IOError, trajectory_reader, self.filename_lammpstrj())
+
+    def test_read_frames(self):
+        reader = trajectory_reader(self.filename)
+        self.assertEqual(len(reader), 4)
+        frames = list(reader)
+        self.assertEqual(len(frames), 4)
+        self.assertEqual([f['index'] for f in frames], [1, 2, 3, 4])
+
+    def test_frame_contents(self):
+        reader = trajectory_reader(self.filename, t_factor=1.0)
+        frame = reader.next()
+        self.assertEqual(frame['N'], 5)
+        self.assertEqual(frame['v'], None)
+        self.assertEqual(frame['time'], 10.0)
+        self.assertTrue(frame['x'].flags.f_contiguous)
+        self.assert_arrays_equal_within_float32eps(frame['x'], 0.1 * self.positions[0])
+        self.assert_arrays_equal_within_float32eps(frame['box'].diagonal(),
+                                                   numpy.array([2.0, 2.1, 2.2]))
+
+    def test_random_access(self):
+        reader = trajectory_reader(self.filename, t_factor=1.0)
+        frame = reader[2]
+        self.assertEqual(frame['index'], 3)
+        self.assertEqual(frame['time'], 20.0)
+        self.assert_arrays_equal_within_float32eps(frame['x'], 0.1 * self.positions[2])
+        self.assert_arrays_equal_within_float32eps(reader[-1]['x'], 0.1 * self.positions[3])
+        self.assertRaises(IndexError, reader.__getitem__, 4)
+
+    def test_triclinic_box(self):
+        # A, gamma, B, beta, alpha, C, once with angles as cosines
+        cells = [[10.0, 60.0, 10.0, 80.0, 70.0, 12.0],
+                 [10.0, 0.5, 10.0, numpy.cos(numpy.radians(80.0)),
+                  numpy.cos(numpy.radians(70.0)), 12.0]]
+        write_dcd(self.filename, self.positions[:2], cells=cells)
+        for frame in trajectory_reader(self.filename):
+            a, b, c = frame['box']
+            self.assertAlmostEqual(numpy.linalg.norm(a), 1.0)
+            self.assertAlmostEqual(numpy.linalg.norm(b), 1.0)
+            self.assertAlmostEqual(numpy.linalg.norm(c), 1.2)
+            cos_angle = lambda u, v: numpy.dot(u, v) / numpy.linalg.norm(u) / numpy.linalg.norm(v)
+            self.assertAlmostEqual(cos_angle(a, b), numpy.cos(numpy.radians(60.0)))
+            self.assertAlmostEqual(cos_angle(a, c), numpy.cos(numpy.radians(80.0)))
+            self.assertAlmostEqual(cos_angle(b, c), numpy.cos(numpy.radians(70.0)))
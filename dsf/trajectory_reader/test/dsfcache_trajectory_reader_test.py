@@ -0,0 +1,78 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import shutil
+import unittest
+import tempfile
+import numpy
+from dsf.trajectory import get_itraj
+from dsf.trajectory_reader.dsfcache_trajectory_reader import (
+    dsfcache_trajectory_reader as trajectory_reader, write_cache, find_cache)
+from dsf.trajectory_reader.lammpstrj_trajectory_reader import lammpstrj_trajectory_reader
+from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
+
+
+class DsfcacheTrajectoryReaderTest(unittest.TestCase, TrajectoryReaderTestMixin):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'dump.lammpstrj')
+        shutil.copy(self.filename_lammpstrj(), self.filename)
+        self.cache = self.filename + '.dsfcache'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_open_lammpstrj_fails(self):
+        self.assertRaises(IOError, trajectory_reader, self.filename)
+
+    def test_read_frames(self):
+        n = write_cache(lammpstrj_trajectory_reader(self.filename), self.cache,
+                        source=self.filename)
+        reader = trajectory_reader(self.cache)
+        self.assertEqual(len(reader), n)
+        for frame, orig in zip(reader, lammpstrj_trajectory_reader(self.filename)):
+            self.assertEqual(frame['index'], orig['index'])
+            self.assertEqual(frame['time'], orig['time'])
+            self.assertTrue(frame['x'].flags.f_contiguous)
+            self.assert_arrays_equal_within_float32eps(frame['box'], orig['box'])
+            self.assert_arrays_equal_within_float32eps(frame['x'], orig['x'])
+            self.assert_arrays_equal_within_float32eps(frame['v'], orig['v'])
+
+    def test_quantized(self):
+        order = numpy.arange(24)[::-1]
+        write_cache(lammpstrj_trajectory_reader(self.filename), self.cache,
+                    precision=1000, velocities=False)
+        frame = trajectory_reader(self.cache, atom_order=order)[0]
+        orig = lammpstrj_trajectory_reader(self.filename).next()
+        self.assertEqual(frame['v'], None)
+        self.assertTrue((abs(frame['x'] - orig['x'][:, order]) <= 0.5e-3 + 1e-6).all())
+
+    def test_cache_preferred(self):
+        self.assertEqual(find_cache(self.filename), None)
+        write_cache(lammpstrj_trajectory_reader(self.filename), self.cache,
+                    source=self.filename)
+        self.assertEqual(find_cache(self.filename), self.cache)
+        self.assertEqual(find_cache(self.cache), self.cache)
+        frame = get_itraj(self.filename).next()
+        self.assertEqual(frame['x'].dtype, numpy.float32)
+
+        # A modified trajectory makes the cache out of date
+        with open(self.filename, 'a') as fh:
+            fh.write('\n')
+        self.assertEqual(find_cache(self.filename), None)
+        frame = get_itraj(self.filename).next()
+        self.assertEqual(frame['x'].dtype, numpy.float64)
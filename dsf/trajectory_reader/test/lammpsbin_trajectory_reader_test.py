@@ -0,0 +1,102 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import unittest
+import tempfile
+import numpy
+from dsf.trajectory_reader.lammpsbin_trajectory_reader import (
+    lammpsbin_trajectory_reader as trajectory_reader)
+from dsf.trajectory_reader.lammpstrj_trajectory_reader import (
+    lammpstrj_trajectory_reader)
+from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
+
+
+def write_lammpsbin(filename, lammpstrj_filename, new_format=True, nchunk=3):
+    """Convert a (orthogonal box) text dump into a LAMMPS binary dump"""
+    def i4(*x):
+        return numpy.array(x, dtype='<i4').tostring()
+    def i8(*x):
+        return numpy.array(x, dtype='<i8').tostring()
+    def f8(*x):
+        return numpy.array(x, dtype='<f8').tostring()
+
+    with open(lammpstrj_filename) as fh:
+        lines = fh.read().splitlines()
+    with open(filename, 'wb') as out:
+        while lines:
+            step = int(lines[1])
+            N = int(lines[3])
+            bounds = [map(float, L.split()) for L in lines[5:8]]
+            cols = lines[8].split()[2:]
+            data = numpy.array([map(float, L.split()) for L in lines[9:9 + N]])
+            lines = lines[9 + N:]
+
+            if new_format:
+                out.write(i8(-10) + 'DUMPCUSTOM' + i4(1, 2))
+            out.write(i8(step, N) + i4(0, 0, 0, 0, 0, 0, 0))
+            out.write(f8(*sum(bounds, [])))
+            out.write(i4(len(cols)))
+            if new_format:
+                out.write(i4(4) + 'real' + '\x01' + f8(step * 2.0))
+                out.write(i4(len(' '.join(cols))) + ' '.join(cols))
+            out.write(i4(nchunk))
+            for chunk in numpy.array_split(data[::-1], nchunk):
+                out.write(i4(chunk.size) + chunk.tostring())
+    return cols
+
+
+class LAMMPSBinTrajectoryReaderTest(unittest.TestCase, TrajectoryReaderTestMixin):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.bin')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def assert_same_frames(self, reader, text_filename):
+        frames = list(reader)
+        reference = list(lammpstrj_trajectory_reader(text_filename))
+        self.assertEqual(len(frames), len(reference))
+        for f, r in zip(frames, reference):
+            for key in ('index', 'N', 'time'):
+                self.assertEqual(f[key], r[key])
+            self.assertTrue((f['box'] == r['box']).all())
+            self.assertTrue((f['x'] == r['x']).all())
+            if r['v'] is None:
+                self.assertEqual(f['v'], None)
+            else:
+                self.assertTrue((f['v'] == r['v']).all())
+
+    def test_open_lammpstrj_fails(self):
+        self.assertRaises(IOError, trajectory_reader, self.filename_lammpstrj())
+
+    def test_same_as_text_dump(self):
+        write_lammpsbin(self.filename, self.filename_lammpstrj())
+        self.assert_same_frames(trajectory_reader(self.filename),
+                                self.filename_lammpstrj())
+
+    def test_same_as_text_dump_no_velocities(self):
+        write_lammpsbin(self.filename, self.filename_lammpstrj_no_velocities())
+        self.assert_same_frames(trajectory_reader(self.filename),
+                                self.filename_lammpstrj_no_velocities())
+
+    def test_old_format_needs_columns(self):
+        cols = write_lammpsbin(self.filename, self.filename_lammpstrj(),
+                               new_format=False)
+        self.assertRaises(IOError, trajectory_reader, self.filename)
+        self.assert_same_frames(trajectory_reader(self.filename, columns=cols),
+                                self.filename_lammpstrj())
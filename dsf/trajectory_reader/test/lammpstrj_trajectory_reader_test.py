@@ -14,6 +14,10 @@
 # 02110-1301, USA.
 
 import unittest
+import numpy
+import os
+import tempfile
+import threading
 from dsf.trajectory_reader.lammpstrj_trajectory_reader import (
     lammpstrj_trajectory_reader as trajectory_reader)
 from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
@@ -54,3 +58,66 @@ class LAMMPSTRJTrajectoryReaderTest(unittest.TestCase, TrajectoryReaderTestMixin
         self.assertEqual(frame['v'], None)
         self.assert_arrays_equal_within_float32eps(frame['x'][:, 0],
                                                    self.LAMMPSTRJ_FIRST_FRAME_FIRST_X)
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_atom_order(self):
+        order = numpy.arange(24)[::-1]
+        frame = trajectory_reader(self.filename_lammpstrj()).next()
+        reordered = trajectory_reader(self.filename_lammpstrj(), atom_order=order).next()
+        self.assert_arrays_equal_within_float32eps(reordered['x'], frame['x'][:, order])
+        self.assert_arrays_equal_within_float32eps(reordered['v'], frame['v'][:, order])
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_atom_order_non_contiguous_ids(self):
+        # E.g. a dump of a group, atoms in different order in each frame
+        ids = numpy.array([3, 7, 10, 15, 20])
+        fd, filename = tempfile.mkstemp(suffix='.lammpstrj')
+        with os.fdopen(fd, 'w') as fh:
+            for step in range(3):
+                fh.write('ITEM: TIMESTEP\n%i\nITEM: NUMBER OF ATOMS\n5\n' % step)
+                fh.write('ITEM: BOX BOUNDS pp pp pp\n0 30\n0 30\n0 30\n')
+                fh.write('ITEM: ATOMS id type x y z\n')
+                for i in numpy.roll(ids, step):
+                    fh.write('%i 1 %i %i %i\n' % (i, i, step, -i))
+        order = numpy.array([4, 2, 0, 3, 1])
+        try:
+            frames = list(trajectory_reader(filename, atom_order=order))
+        finally:
+            os.remove(filename)
+        self.assertEqual(len(frames), 3)
+        for step, frame in enumerate(frames):
+            expected = 0.1 * numpy.array([ids[order], step + 0 * order, -ids[order]])
+            self.assert_arrays_equal_within_float32eps(frame['x'], expected)
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_parallel_decoding(self):
+        frames = list(trajectory_reader(self.filename_lammpstrj()))
+        reader = trajectory_reader(self.filename_lammpstrj(), workers=2)
+        decoded = list(reader)
+        reader.close()
+        self.assertEqual(len(decoded), len(frames))
+        for f, g in zip(frames, decoded):
+            self.assertEqual(f['time'], g['time'])
+            self.assert_arrays_equal_within_float32eps(f['box'], g['box'])
+            self.assert_arrays_equal_within_float32eps(f['x'], g['x'])
+            self.assert_arrays_equal_within_float32eps(f['v'], g['v'])
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_follow_growing_file(self):
+        with open(self.filename_lammpstrj()) as fh:
+            text = fh.read()
+        fd, filename = tempfile.mkstemp(suffix='.lammpstrj')
+        os.write(fd, text[:len(text) // 2])
+        def append():
+            os.write(fd, text[len(text) // 2:])
+            os.close(fd)
+        reader = trajectory_reader(filename, follow=1.0)
+        reader.poll_interval = 0.05
+        timer = threading.Timer(0.2, append)
+        timer.start()
+        try:
+            frames = list(reader)
+        finally:
+            timer.join()
+            os.remove(filename)
+        self.assertEqual(len(frames), 4)
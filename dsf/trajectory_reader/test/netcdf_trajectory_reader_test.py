@@ -0,0 +1,148 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import unittest
+import tempfile
+import numpy
+from dsf.trajectory_reader.netcdf_trajectory_reader import (
+    netcdf_trajectory_reader as trajectory_reader, netcdf_file)
+from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
+from dsf.trajectory import get_itraj
+
+
+_not_available = not trajectory_reader.reader_available()
+_not_available_reason = "SciPy netcdf not available"
+
+
+def write_amber_netcdf(filename, positions, velocities=None, times=None, cell=None):
+    """Write an AMBER style NetCDF file, positions has shape (frames, N, 3)"""
+    nc = netcdf_file(filename, 'w', version=2)
+    nc.Conventions = 'AMBER'
+    nc.createDimension('frame', None)
+    nc.createDimension('spatial', 3)
+    nc.createDimension('atom', positions.shape[1])
+    nc.createDimension('cell_spatial', 3)
+    nc.createDimension('cell_angular', 3)
+    x = nc.createVariable('coordinates', 'f', ('frame', 'atom', 'spatial'))
+    x[:] = positions
+    if velocities is not None:
+        v = nc.createVariable('velocities', 'f', ('frame', 'atom', 'spatial'))
+        v.scale_factor = 20.455
+        v[:] = velocities / 20.455
+    if times is not None:
+        t = nc.createVariable('time', 'f', ('frame',))
+        t[:] = times
+    if cell is not None:
+        l = nc.createVariable('cell_lengths', 'd', ('frame', 'cell_spatial'))
+        a = nc.createVariable('cell_angles', 'd', ('frame', 'cell_angular'))
+        l[:] = [cell[:3]] * len(positions)
+        a[:] = [cell[3:]] * len(positions)
+    nc.close()
+
+
+class NetCDFTrajectoryReaderTest(unittest.TestCase, TrajectoryReaderTestMixin):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.nc')
+        os.close(fd)
+        self.positions = (numpy.random.rand(7, 5, 3) * 10.0).astype(numpy.float32)
+        self.velocities = (numpy.random.rand(7, 5, 3) * 10.0 - 5.0).astype(numpy.float32)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_open_lammpstrj_fails(self):
+        self.assertRaises(Exception, trajectory_reader, self.filename_lammpstrj())
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_read_frames(self):
+        write_amber_netcdf(self.filename, self.positions,
+                           times=numpy.arange(7) * 2.0,
+                           cell=[10.0, 11.0, 12.0, 90.0, 90.0, 90.0])
+        reader = trajectory_reader(self.filename, block_size=3)
+        self.assertEqual(len(reader), 7)
+        frames = list(reader)
+        self.assertEqual([f['index'] for f in frames], range(1, 8))
+        for i, f in enumerate(frames):
+            self.assertEqual(f['N'], 5)
+            self.assertEqual(f['v'], None)
+            self.assertEqual(f['time'], 2.0 * i)
+            self.assertTrue(f['x'].flags.f_contiguous)
+            self.assert_arrays_equal_within_float32eps(f['x'],
+                                                       0.1 * self.positions[i].T)
+            self.assert_arrays_equal_within_float32eps(f['box'].diagonal(),
+                                                       numpy.array([1.0, 1.1, 1.2]))
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_triclinic_box(self):
+        write_amber_netcdf(self.filename, self.positions,
+                           cell=[10.0, 10.0, 12.0, 70.0, 80.0, 60.0])
+        a, b, c = trajectory_reader(self.filename)[0]['box']
+        norm = numpy.linalg.norm
+        self.assertAlmostEqual(norm(a), 1.0)
+        self.assertAlmostEqual(norm(b), 1.0)
+        self.assertAlmostEqual(norm(c), 1.2)
+        cos_angle = lambda u, v: numpy.dot(u, v) / norm(u) / norm(v)
+        self.assertAlmostEqual(cos_angle(b, c), numpy.cos(numpy.radians(70.0)))
+        self.assertAlmostEqual(cos_angle(a, c), numpy.cos(numpy.radians(80.0)))
+        self.assertAlmostEqual(cos_angle(a, b), numpy.cos(numpy.radians(60.0)))
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_velocities_and_random_access(self):
+        write_amber_netcdf(self.filename, self.positions, velocities=self.velocities)
+        reader = trajectory_reader(self.filename)
+        frame = reader[4]
+        self.assertEqual(frame['index'], 5)
+        self.assertTrue(frame['v'].flags.f_contiguous)
+        self.assertTrue(numpy.allclose(frame['v'], 0.1 * self.velocities[4].T,
+                                       rtol=1e-6, atol=1e-6))
+        block = reader.get_block(5, 10)
+        self.assertEqual(len(block), 2)
+        self.assert_arrays_equal_within_float32eps(block[1]['x'],
+                                                   0.1 * self.positions[6].T)
+        reader.close()
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_get_itraj_reads_blocks(self):
+        write_amber_netcdf(self.filename, self.positions)
+        calls = []
+        get_block = trajectory_reader.get_block
+        def counting_get_block(reader, *args):
+            calls.append(args)
+            return get_block(reader, *args)
+        trajectory_reader.get_block = counting_get_block
+        try:
+            frames = list(get_itraj(self.filename, step=3, max_frames=3))
+        finally:
+            trajectory_reader.get_block = get_block
+        self.assertEqual([f['index'] for f in frames], [1, 4, 7])
+        self.assert_arrays_equal_within_float32eps(frames[2]['x'],
+                                                   0.1 * self.positions[6].T)
+        self.assertEqual(calls, [(0, 7, 3)])
+
+    @unittest.skipIf(_not_available, _not_available_reason)
+    def test_atom_order(self):
+        write_amber_netcdf(self.filename, self.positions, velocities=self.velocities)
+        order = numpy.array([3, 0, 4, 1, 2])
+        reader = trajectory_reader(self.filename, atom_order=order)
+        frame = reader[2]
+        self.assertTrue(frame['x'].flags.f_contiguous)
+        self.assert_arrays_equal_within_float32eps(frame['x'],
+                                                   0.1 * self.positions[2][order].T)
+        self.assertTrue(numpy.allclose(frame['v'], 0.1 * self.velocities[2][order].T,
+                                       rtol=1e-6, atol=1e-6))
+        reader.close()
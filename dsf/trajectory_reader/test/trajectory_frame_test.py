@@ -0,0 +1,55 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import unittest
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
+from dsf.trajectory_reader.lammpstrj_trajectory_reader import (
+    lammpstrj_trajectory_reader)
+from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
+
+
+class TrajectoryFrameTest(unittest.TestCase, TrajectoryReaderTestMixin):
+
+    def test_dict_style_access(self):
+        frame = trajectory_frame(index=1, N=3, v=None)
+        self.assertEqual(frame['N'], 3)
+        self.assertTrue('N' in frame)
+        self.assertFalse('v' in frame)
+        self.assertEqual(frame.get('v'), None)
+        frame['xs'] = []
+        self.assertEqual(frame.xs, [])
+        self.assertRaises(AttributeError, setattr, frame, 'foo', 1)
+
+    def test_buffers_are_recycled(self):
+        pool = frame_buffer_pool()
+        frame = trajectory_frame(pool=pool)
+        a = frame.buffer((3, 4))
+        self.assertTrue(a.flags.f_contiguous)
+        frame.release()
+        self.assertEqual(frame.x, None)
+        frame = trajectory_frame(pool=pool)
+        self.assertTrue(frame.buffer((3, 4)) is a)
+        self.assertFalse(frame.buffer((3, 4)) is a)
+
+    def test_reader_reuses_released_buffers(self):
+        reader = lammpstrj_trajectory_reader(self.filename_lammpstrj())
+        f1 = reader.next()
+        x, v = f1.x, f1.v
+        self.assert_arrays_equal_within_float32eps(x[:, 0],
+                                                   self.LAMMPSTRJ_FIRST_FRAME_FIRST_X)
+        f1.release()
+        f2 = reader.next()
+        self.assertTrue(f2.x is x or f2.x is v)
+        self.assertTrue(f2.v is x or f2.v is v)
@@ -19,6 +19,8 @@ import os
 class TrajectoryReaderTestMixin(object):
 
     LAMMPSTRJ_FIRST_FRAME_FIRST_X = numpy.array([0.191468, 0.302071, 0.0528818])
+    TRR_FIRST_FRAME_FIRST_X = numpy.array([5.2600083, 4.377864, 2.0856938])
+    TRR_FIRST_FRAME_FIRST_V = numpy.array([0.3290625, 0.10501131, -0.9956762])
 
     def filename_lammpstrj(self):
         data_path = self._data_dir_path()
@@ -32,6 +34,10 @@ class TrajectoryReaderTestMixin(object):
         data_path = self._data_dir_path()
         return os.path.join(data_path), "1frame3atoms.xtc"
     
+    def filename_trr_1frame_3atoms(self):
+        data_path = self._data_dir_path()
+        return os.path.join(data_path, "1frame3atoms.trr")
+
     def assert_arrays_equal_within_float32eps(self, a, b):
         abs_diff = numpy.absolute(a - b)
         eps = self._float32abs()
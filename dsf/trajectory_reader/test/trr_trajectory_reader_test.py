@@ -0,0 +1,62 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import os
+import unittest
+import tempfile
+from dsf.trajectory_reader.trr_trajectory_reader import (
+    trr_trajectory_reader as trajectory_reader)
+from dsf.trajectory_reader.test.trajectory_reader_test_mixin import TrajectoryReaderTestMixin
+
+
+class TRRTrajectoryReaderTest(unittest.TestCase, TrajectoryReaderTestMixin):
+
+    def test_open_trr(self):
+        trajectory_reader(self.filename_trr_1frame_3atoms())
+
+    def test_open_lammpstrj_fails(self):
+        self.assertRaises(IOError, trajectory_reader, self.filename_lammpstrj())
+
+    def test_read_frames(self):
+        reader = trajectory_reader(self.filename_trr_1frame_3atoms())
+        frames = list(reader)
+        self.assertEqual(len(frames), 1)
+
+    def test_first_frame_contents(self):
+        reader = trajectory_reader(self.filename_trr_1frame_3atoms())
+        frame = reader.next()
+        self.assertEqual(frame['N'], 3)
+        self.assertEqual(frame['x'].shape, (3, 3))
+        self.assertTrue(frame['x'].flags.f_contiguous)
+        self.assert_arrays_equal_within_float32eps(frame['x'][:, 0],
+                                                   self.TRR_FIRST_FRAME_FIRST_X)
+        self.assert_arrays_equal_within_float32eps(frame['v'][:, 0],
+                                                   self.TRR_FIRST_FRAME_FIRST_V)
+
+    def test_concatenated_frames(self):
+        with open(self.filename_trr_1frame_3atoms(), 'rb') as fh:
+            data = fh.read()
+        fd, filename = tempfile.mkstemp(suffix='.trr')
+        try:
+            os.write(fd, data * 3)
+            os.close(fd)
+            reader = trajectory_reader(filename)
+            self.assertEqual(len(reader), 3)
+            frames = list(reader)
+            self.assertEqual([f['index'] for f in frames], [1, 2, 3])
+            self.assert_arrays_equal_within_float32eps(frames[-1]['x'][:, 0],
+                                                       self.TRR_FIRST_FRAME_FIRST_X)
+        finally:
+            os.remove(filename)
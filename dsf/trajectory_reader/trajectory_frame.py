@@ -13,19 +13,102 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
 # 02110-1301, USA.
 
+from threading import Lock
+import numpy as np
+
+
+class frame_buffer_pool(object):
+    """Pool of recycled arrays, used for per frame data
+
+    Arrays are handed out with get, and handed back with put
+    (normally via trajectory_frame.release). In steady state, when
+    frames are released as fast as new ones are created, no new
+    arrays need to be allocated.
+    """
+    def __init__(self):
+        self._free = {}
+        self._lock = Lock()
+
+    def get(self, shape, dtype, order='F'):
+        dtype = np.dtype(dtype)
+        key = (tuple(shape), dtype, order)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                return free.pop()
+        return np.empty(shape, dtype=dtype, order=order)
+
+    def put(self, a, order='F'):
+        key = (a.shape, a.dtype, order)
+        with self._lock:
+            self._free.setdefault(key, []).append(a)
+
+
 class trajectory_frame(object):
     """Trivial data struct holding MD-data for one time frame
-    
+
      'index' : trajectory index,
      'box'   : simulation box as 3 row vectors (nm),
      'N'     : number of atoms,
      'x'     : particle positions as 3xN array (nm),
      'v'     : (*) particle velocities as 3xN array (nm/ps),
      'time'  : (*) simulation time (ps),
-     
+
      (*) may not be available, depends on reader and trajectory file format.
+
+    During processing, the frame is augmented with per section data
+    (xs, vs, rho_ks, j_ks, jz_ks, jper_ks).
+
+    Attributes can also be accessed as items (frame['x']), as frames
+    used to be plain dicts. Unset attributes are None, and are
+    considered not to be "in" the frame.
+
+    Arrays obtained with buffer are taken from the frame's pool, and
+    are returned to the pool when the frame is released.
     """
-    def __init__(self, **kwargs):
+    __slots__ = ('index', 'box', 'N', 'x', 'v', 'time',
+                 'xs', 'vs', 'rho_ks', 'j_ks', 'jz_ks', 'jper_ks',
+                 '_pool', '_buffers')
+
+    def __init__(self, pool=None, **kwargs):
+        for attribute in self.__slots__:
+            setattr(self, attribute, None)
+        self._pool = pool
+        self._buffers = []
         for attribute, value in kwargs.iteritems():
             setattr(self, attribute, value)
 
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def buffer(self, shape, dtype=np.float64):
+        """Get a (fortran ordered) array owned by this frame"""
+        if self._pool is None:
+            return np.empty(shape, dtype=dtype, order='F')
+        a = self._pool.get(shape, dtype)
+        self._buffers.append(a)
+        return a
+
+    def release(self):
+        """Hand back all buffers of this frame to the pool
+
+        The frame (and any array obtained from it) must not be used
+        after this.
+        """
+        for a in self._buffers:
+            self._pool.put(a)
+        self._buffers = []
+        for attribute in ('x', 'v', 'xs', 'vs', 'rho_ks', 'j_ks', 'jz_ks', 'jper_ks'):
+            setattr(self, attribute, None)
@@ -0,0 +1,201 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.
+
+import numpy as np
+from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader, copy_scaled
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame, frame_buffer_pool
+from numpy import zeros
+
+#
+# G R O M A C S   T R R
+#
+# A trr-file is a sequence of XDR (big endian) encoded frames.
+# Each frame starts with a header
+#
+#   int    magic (1993)
+#   int    version string length (13)
+#   string "GMX_trn_file" (xdr string; int length + data padded to 4 bytes)
+#   int    ir_size, e_size, box_size, vir_size, pres_size, top_size,
+#          sym_size, x_size, v_size, f_size, natoms, step, nre
+#   real   t, lambda
+#
+# followed by box_size + vir_size + pres_size + x_size + v_size + f_size
+# bytes of data (box, virial, pressure, positions, velocities, forces).
+# real is either float or double, and can be deduced from the sizes.
+#
+
+TRR_MAGIC = 1993
+_trr_int = np.dtype('>i4')
+_trr_ints = np.dtype([(name, '>i4') for name in (
+            'ir_size', 'e_size', 'box_size', 'vir_size', 'pres_size',
+            'top_size', 'sym_size', 'x_size', 'v_size', 'f_size',
+            'natoms', 'step', 'nre')])
+
+
+class trr_trajectory_reader(abstract_trajectory_reader):
+    """Read a GROMACS trr-file, using numpy only
+
+    The file is memory mapped, and the offset of each frame is found
+    by hopping from header to header when the file is opened.
+    Positions, velocities and box of a frame are zero-copy big endian
+    views into the mapped file, which are converted in bulk into
+    native (3, N) arrays. Frames can be accessed in any order.
+
+    Frames without positions (e.g. force only frames) are skipped.
+    Velocities are only provided if all (position) frames have them.
+    """
+
+    @classmethod
+    def reader_available(cls):
+        return True
+
+    def __init__(self, filename, x_factor=1.0, t_factor=1.0, atom_order=None):
+        self.x_factor = x_factor
+        self.t_factor = t_factor
+        self.v_factor = x_factor / t_factor
+        self._atom_order = atom_order
+
+        self._mm = np.memmap(filename, dtype=np.uint8, mode='r')
+        self._frames = self._scan_frames()
+        if not self._frames:
+            raise IOError('trr_reader: no frames with positions found in %s' % filename)
+
+        self._natoms = self._frames[0]['natoms']
+        self._real = self._frames[0]['dtype'].newbyteorder('=')
+        for f in self._frames:
+            if f['natoms'] != self._natoms:
+                raise IOError('trr_reader: varying number of atoms in %s' % filename)
+        self._has_v = all(f['v'] is not None for f in self._frames)
+
+        self._pool = frame_buffer_pool()
+        self._i = 0
+        self._open = True
+
+    def _read_header(self, offset):
+        # Parse the frame header at offset, return (frame info, next offset)
+        mm = self._mm
+        magic, slen, vlen = np.ndarray((3,), _trr_int, mm, offset)
+        if magic != TRR_MAGIC:
+            raise IOError('trr_reader: bad magic number at offset %i' % offset)
+        offset += 12 + 4 * ((vlen + 3) // 4)
+        h = np.ndarray((), _trr_ints, mm, offset)
+        offset += _trr_ints.itemsize
+
+        if h['box_size']:
+            prec = h['box_size'] // 9
+        elif h['x_size']:
+            prec = h['x_size'] // (3 * h['natoms'])
+        elif h['v_size']:
+            prec = h['v_size'] // (3 * h['natoms'])
+        elif h['f_size']:
+            prec = h['f_size'] // (3 * h['natoms'])
+        else:
+            raise IOError('trr_reader: can not determine precision at offset %i' % offset)
+        if prec == 4:
+            real = np.dtype('>f4')
+        elif prec == 8:
+            real = np.dtype('>f8')
+        else:
+            raise IOError('trr_reader: unknown precision at offset %i' % offset)
+
+        t = float(np.ndarray((), real, mm, offset))
+        offset += 2 * prec
+
+        frame = dict(natoms=int(h['natoms']), step=int(h['step']), time=t,
+                     dtype=real, box=None, x=None, v=None)
+        offset += h['ir_size'] + h['e_size']
+        if h['box_size']:
+            frame['box'] = offset
+        offset += h['box_size'] + h['vir_size'] + h['pres_size']
+        offset += h['top_size'] + h['sym_size']
+        if h['x_size']:
+            frame['x'] = offset
+        offset += h['x_size']
+        if h['v_size']:
+            frame['v'] = offset
+        offset += h['v_size'] + h['f_size']
+
+        if offset > len(mm):
+            raise IOError('trr_reader: truncated frame')
+        return frame, offset
+
+    def _scan_frames(self):
+        frames = []
+        offset = 0
+        end = len(self._mm)
+        while offset < end:
+            frame, offset = self._read_header(offset)
+            if frame['x'] is not None:
+                frames.append(frame)
+        return frames
+
+    def _view(self, frame, key, shape):
+        # Zero-copy big endian view into the mapped file
+        return np.ndarray(shape, frame['dtype'], self._mm, frame[key])
+
+    def __iter__(self):
+        return self
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, i):
+        """Random access to frame i (counting from 0)
+
+        The returned arrays are not shared with any other frame.
+        """
+        if not self._open:
+            raise IOError('trr_reader: reader is closed')
+        if i < 0:
+            i += len(self._frames)
+        frame = self._frames[i]
+        N = self._natoms
+
+        if frame['box'] is not None:
+            box = self._view(frame, 'box', (3, 3)).astype(np.float64)
+        else:
+            box = zeros((3, 3))
+
+        res = trajectory_frame(
+            pool=self._pool,
+            index=i + 1,
+            N=N,
+            box=self.x_factor * box,
+            time=self.t_factor * frame['time'],
+            )
+
+        # Converting (and scaling) the transposed (N, 3) views in one go
+        # gives native (3, N) arrays in fortran order
+        res.x = copy_scaled(self._view(frame, 'x', (N, 3)).T, self.x_factor,
+                            res.buffer((3, N), self._real), self._atom_order)
+        if self._has_v:
+            res.v = copy_scaled(self._view(frame, 'v', (N, 3)).T, self.v_factor,
+                                res.buffer((3, N), self._real), self._atom_order)
+
+        return res
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self._mm = None
+
+    def next(self):
+        if not self._open or self._i >= len(self._frames):
+            self.close()
+            raise StopIteration
+
+        res = self[self._i]
+        self._i += 1
+        return res
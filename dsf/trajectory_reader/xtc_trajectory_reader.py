@@ -17,6 +17,7 @@ from ctypes import cdll, POINTER, c_float, c_int, c_char_p
 from ctypes.util import find_library
 from itertools import count
 from dsf.trajectory_reader.abstract_trajectory_reader import abstract_trajectory_reader
+from dsf.trajectory_reader.trajectory_frame import trajectory_frame
 import numpy as np
 
 #
@@ -81,7 +82,7 @@ class xtc_trajectory_reader(abstract_trajectory_reader):
         return False
 #         return libgmx is not None
 
-    def __init__(self, filename):
+    def __init__(self, filename, atom_order=None):
         if libgmx is None:
             raise RuntimeError("XTC_reader: No libgmx found, can't use XTC_reader!")
 
@@ -100,6 +101,7 @@ class xtc_trajectory_reader(abstract_trajectory_reader):
         self._bOK = xtcint_ct()  # gmx_bool equals int
         self._open = True
         self._first_called = False
+        self._atom_order = atom_order
 
     def _get_first(self):
         # Read first frame and update state of self accordingly
@@ -150,12 +152,12 @@ class xtc_trajectory_reader(abstract_trajectory_reader):
         else:
             self._get_first()
 
-        return dict(
+        return trajectory_frame(
             index=self._index.next(),
             box=self._box.copy('F'),
             time=self._time.value,
             N=self._natoms.value,
-            x=self._x,
+            x=self._x if self._atom_order is None else self._x[:, self._atom_order],
             v=None,
             )
 
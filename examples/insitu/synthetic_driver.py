@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+# Example of in-situ use of dsf: a synthetic "simulation" (an Einstein
+# solid, i.e. independent harmonic oscillators on a simple cubic
+# lattice) passes its positions and velocities to insitu_dsf at each
+# time step. Nothing but the final results is written to disk.
+
+import numpy as np
+from dsf.insitu import insitu_dsf
+
+n = 6                 # lattice points per side
+a = 0.3               # lattice constant [nm]
+omega = 0.05          # oscillator frequency [fs^-1]
+amplitude = 0.01      # oscillation amplitude [nm]
+dt = 10.0             # time step [fs]
+steps = 200
+
+lattice = a * np.indices((n, n, n)).reshape((3, -1)).T
+N = len(lattice)
+box = a * n * np.eye(3)
+
+rng = np.random.RandomState(42)
+phase = rng.uniform(0, 2 * np.pi, (N, 3))
+
+# Caller owned buffers, reused for every time step
+x = np.empty((N, 3))
+v = np.empty((N, 3))
+
+dsf = insitu_dsf(box, N, nt=20, delta_t=dt, k_max=40, k_bins=40,
+                 calculate_current=True, calculate_self=True)
+
+for step in xrange(steps):
+    t = step * dt
+    x[:] = lattice + amplitude * np.sin(omega * t + phase)
+    v[:] = amplitude * omega * np.cos(omega * t + phase)
+    dsf.add_frame(x, v, time=t)
+
+dsf.finish()
+dsf.write(pfile='insitu_output.pickle', mfile='insitu_output.m',
+          comment='Synthetic in-situ example')
@@ -43,10 +43,10 @@ setup(name = 'python-dynsf',
       description = 'Tool for calculating the dynamical structure factor',
       author = 'Mattias Slabanja',
       author_email = 'slabanja@chalmers.se',
-      packages = ['dsf'],
+      packages = ['dsf', 'dsf.trajectory_reader'],
       ext_modules = [rho_j_k_d_ext,
                      rho_j_k_s_ext],
-      scripts = ['dynsf'],
+      scripts = ['dynsf', 'dynsf-convert'],
       data_files = [('share/man/man1', ['dynsf.1'])],
       requires = ['numpy'],
       license      = "GPL2+",